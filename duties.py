@@ -173,6 +173,16 @@ def coverage(ctx: Context) -> None:
     ctx.run(tools.coverage.html(rcfile="config/coverage.ini"))
 
 
+@duty
+def bench(ctx: Context, *cli_args: str) -> None:
+    """Run the benchmarks, optionally comparing them against a baseline."""
+    ctx.run(
+        [sys.executable, "scripts/benchmark.py", *cli_args],
+        title=pyprefix("Running benchmarks"),
+        capture=False,
+    )
+
+
 @duty(nofail=PY_VERSION == PY_DEV)
 def test(ctx: Context, *cli_args: str) -> None:
     """Run the test suite."""
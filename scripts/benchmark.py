@@ -0,0 +1,236 @@
+# Benchmark the hot paths of failprint, and compare results against a baseline.
+#
+# Each scenario is timed several times after a warm-up run,
+# and the minimum duration is used for comparisons, as it is the least noisy statistic.
+# Results are written as JSON. Save them as a baseline on a quiet machine,
+# then compare later runs against it to catch regressions:
+#
+#     python scripts/benchmark.py --save-baseline
+#     python scripts/benchmark.py --compare
+#
+# The 100 MB scenario is slow, and only runs with `--large`.
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+from failprint import Capture, CaptureManager, run
+
+_root = Path(__file__).parent.parent
+_default_baseline = _root / ".benchmarks" / "baseline.json"
+_windows = os.name == "nt"
+
+_scenarios: dict[str, tuple[Callable[[], object], bool]] = {}
+
+
+def scenario(name: str, *, large: bool = False) -> Callable[[Callable[[], object]], Callable[[], object]]:
+    """Register a benchmark scenario."""
+
+    def decorator(func: Callable[[], object]) -> Callable[[], object]:
+        _scenarios[name] = (func, large)
+        return func
+
+    return decorator
+
+
+def _python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def _write_bytes(size: int) -> list[str]:
+    return _python(f"import sys; sys.stdout.buffer.write(b'x' * {size})")
+
+
+_lines_cmd = _python("import sys; sys.stdout.write('a short line of output\\n' * 200_000)")
+_failing_lines = [f"line {index}: something went wrong <here>" for index in range(1000)]
+
+
+def _fail_with_output() -> bool:
+    print("\n".join(_failing_lines))
+    return False
+
+
+@scenario("overhead-command")
+def _overhead_command() -> object:
+    return run(_python("pass"), silent=True)
+
+
+@scenario("overhead-true")
+def _overhead_true() -> object:
+    return run("exit 0" if _windows else ["true"], silent=True)
+
+
+@scenario("overhead-function")
+def _overhead_function() -> object:
+    return run(lambda: None, silent=True)
+
+
+@scenario("throughput-1mb")
+def _throughput_1mb() -> object:
+    return run(_write_bytes(1024**2), silent=True).output
+
+
+@scenario("throughput-100mb", large=True)
+def _throughput_100mb() -> object:
+    return run(_write_bytes(100 * 1024**2), silent=True).output
+
+
+@scenario("throughput-lines")
+def _throughput_lines() -> object:
+    return run(_lines_cmd, silent=True).output
+
+
+@scenario("pipe-1mb")
+def _pipe_1mb() -> object:
+    return run(_write_bytes(1024**2), pty=False, silent=True).output
+
+
+if not _windows:
+
+    @scenario("pty-1mb")
+    def _pty_1mb() -> object:
+        return run(_write_bytes(1024**2), pty=True, silent=True).output
+
+
+@scenario("capture-manager-1mb")
+def _capture_manager_1mb() -> object:
+    data = b"x" * 1024**2
+    with CaptureManager(Capture.BOTH) as captured:
+        os.write(sys.stdout.fileno(), data)
+    return captured.output
+
+
+@scenario("render-pretty")
+def _render_pretty() -> object:
+    return run(_fail_with_output, fmt="pretty", progress=False)
+
+
+@scenario("render-tap")
+def _render_tap() -> object:
+    return run(_fail_with_output, fmt="tap", progress=False)
+
+
+@scenario("cli-cold-start")
+def _cli_cold_start() -> object:
+    return subprocess.run([sys.executable, "-m", "failprint", "-s", "--", *_python("pass")], check=True)  # noqa: S603
+
+
+def _time(func: Callable[[], object], repeat: int) -> list[float]:
+    durations = []
+    # Discard rendered output without letting it reach the terminal.
+    with open(os.devnull, "w", encoding="utf8") as devnull, contextlib.redirect_stdout(devnull):  # noqa: PTH123
+        func()  # warm-up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _run(names: list[str], repeat: int) -> dict:
+    results = {}
+    for name in names:
+        func, _ = _scenarios[name]
+        durations = _time(func, repeat)
+        results[name] = {
+            "min": min(durations),
+            "median": statistics.median(durations),
+            "stdev": statistics.stdev(durations) if len(durations) > 1 else 0.0,
+            "repeat": repeat,
+        }
+        print(f"{name:24} min {results[name]['min'] * 1000:10.3f} ms", file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def _compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["min"]
+        after = result["min"]
+        ratio = after / before if before else 1.0
+        marker = "REGRESSION" if ratio > 1 + tolerance else ""
+        line = f"{name:24} {before * 1000:10.3f} ms -> {after * 1000:10.3f} ms ({ratio:5.2f}x) {marker}"
+        print(line, file=sys.stderr)
+        if marker:
+            regressions.append(name)
+    return regressions
+
+
+def main(args: list[str] | None = None) -> int:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark failprint hot paths.")
+    parser.add_argument("scenarios", nargs="*", help="Scenarios to run. Default: all (except large ones).")
+    parser.add_argument("-l", "--list", action="store_true", help="List available scenarios and exit.")
+    parser.add_argument("-L", "--large", action="store_true", help="Include large (slow) scenarios.")
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Number of timed runs per scenario.")
+    parser.add_argument("-o", "--output", type=Path, help="Write JSON results to this file (default: stdout).")
+    parser.add_argument(
+        "-s",
+        "--save-baseline",
+        nargs="?",
+        const=_default_baseline,
+        type=Path,
+        help=f"Save results as baseline (default: {_default_baseline.relative_to(_root)}).",
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        nargs="?",
+        const=_default_baseline,
+        type=Path,
+        help="Compare results against a baseline, exit with 1 on regressions.",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Allowed slowdown ratio before reporting a regression (default: 0.15, meaning 15%%).",
+    )
+    opts = parser.parse_args(args)
+
+    if opts.list:
+        for name, (_, large) in _scenarios.items():
+            print(f"{name}{' (large)' if large else ''}")
+        return 0
+
+    names = opts.scenarios or [name for name, (_, large) in _scenarios.items() if opts.large or not large]
+    if unknown := set(names) - set(_scenarios):
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    current = _run(names, opts.repeat)
+    dumped = json.dumps(current, indent=2)
+    if opts.output:
+        opts.output.write_text(dumped, encoding="utf8")
+    elif not opts.save_baseline and not opts.compare:
+        print(dumped)
+
+    if opts.save_baseline:
+        opts.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        opts.save_baseline.write_text(dumped, encoding="utf8")
+
+    if opts.compare:
+        baseline = json.loads(opts.compare.read_text(encoding="utf8"))
+        if _compare(current, baseline, opts.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,10 +5,12 @@ Run a command, print its output only if it fails.
 
 from __future__ import annotations
 
-from failprint._internal.capture import Capture, CaptureManager
+from failprint._internal.capture import Capture, CaptureManager, SeparateOutput
 from failprint._internal.cli import ArgParser, add_flags, get_parser, main
+from failprint._internal.compact import compact_output
 from failprint._internal.formats import (
     Format,
+    RawOutput,
     accept_custom_format,
     as_python_statement,
     as_shell_command,
@@ -17,18 +19,31 @@ from failprint._internal.formats import (
     printable_command,
     unescape,
 )
-from failprint._internal.lazy import LazyCallable, lazy
-from failprint._internal.process import WINDOWS
+from failprint._internal.lazy import LazyBatch, LazyCallable, ResultCache, lazy
+from failprint._internal.metrics import MetricsSink
+from failprint._internal.process import WINDOWS, Limits
+from failprint._internal.profiling import (
+    Profiler,
+    ProfilingCallback,
+    add_profiling_callback,
+    profile_phase,
+    remove_profiling_callback,
+)
 from failprint._internal.runners import (
+    CompactRunResult,
     RunResult,
+    arun,
     run,
     run_command,
     run_function,
     run_function_get_code,
+    run_many,
     run_pty_subprocess,
     run_subprocess,
 )
-from failprint._internal.types import CmdFuncType, CmdType
+from failprint._internal.spool import Spool, SpooledOutput
+from failprint._internal.types import CmdFuncType, CmdType, RenderFunction
+from failprint._internal.workers import WorkerPool
 
 __all__: list[str] = [
     "WINDOWS",
@@ -37,23 +52,42 @@ __all__: list[str] = [
     "CaptureManager",
     "CmdFuncType",
     "CmdType",
+    "CompactRunResult",
     "Format",
+    "LazyBatch",
     "LazyCallable",
+    "Limits",
+    "MetricsSink",
+    "Profiler",
+    "ProfilingCallback",
+    "RawOutput",
+    "RenderFunction",
+    "ResultCache",
     "RunResult",
+    "SeparateOutput",
+    "Spool",
+    "SpooledOutput",
+    "WorkerPool",
     "accept_custom_format",
     "add_flags",
+    "add_profiling_callback",
+    "arun",
     "as_python_statement",
     "as_shell_command",
+    "compact_output",
     "escape",
     "formats",
     "get_parser",
     "lazy",
     "main",
     "printable_command",
+    "profile_phase",
+    "remove_profiling_callback",
     "run",
     "run_command",
     "run_function",
     "run_function_get_code",
+    "run_many",
     "run_pty_subprocess",
     "run_subprocess",
     "unescape",
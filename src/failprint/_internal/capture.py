@@ -4,16 +4,141 @@ from __future__ import annotations
 
 import enum
 import os
+import selectors
 import sys
 import tempfile
+import threading
+import time
 from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cached_property
 from io import StringIO
-from typing import IO, TYPE_CHECKING, TextIO
+from typing import IO, TYPE_CHECKING, Any, Callable, TextIO
+
+from failprint._internal.profiling import profile_phase
+from failprint._internal.sink import _Sink
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
+    from contextvars import Token
+    from pathlib import Path
     from types import TracebackType
 
+_WINDOWS = sys.platform.startswith("win") or os.name == "nt"
+_READ_SIZE = 65536
+_JOIN_TIMEOUT = 1.0
+
+
+def _translate_newlines(raw: bytes) -> bytes:
+    # Like output read from a PTY, lone carriage returns are kept:
+    # they overwrite lines (progress bars), which compacting output relies on.
+    # Skipped entirely (with a single fast scan) when there is no carriage return.
+    if b"\r" in raw:
+        return raw.replace(b"\r\n", b"\n")
+    return raw
+
+
+def _decode(raw: bytes | memoryview) -> str:
+    # Invalid UTF-8 must never crash a run: replace undecodable bytes.
+    return str(raw, "utf8", "replace")
+
+
+def _read_streams(
+    streams: dict[int, str],
+    chunks: list[tuple[float, str, bytes]],
+    on_chunk: Callable[[str, bytes], bool] | None = None,
+) -> None:
+    # Read from several file descriptors concurrently, until they are all exhausted,
+    # appending timestamped chunks of data tagged with the stream name.
+    # Reading stops early if the optional callback returns true.
+    if _WINDOWS:
+        _read_streams_threaded(streams, chunks, on_chunk)
+        return
+    with selectors.DefaultSelector() as selector:
+        for fd, name in streams.items():
+            selector.register(fd, selectors.EVENT_READ, name)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, _READ_SIZE)  # ty: ignore[invalid-argument-type]
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                chunks.append((time.monotonic(), key.data, data))
+                if on_chunk is not None and on_chunk(key.data, data):
+                    return
+
+
+def _read_streams_threaded(
+    streams: dict[int, str],
+    chunks: list[tuple[float, str, bytes]],
+    on_chunk: Callable[[str, bytes], bool] | None,
+) -> None:
+    # Selectors do not support pipes on Windows: use one thread per stream instead.
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def read(fd: int, name: str) -> None:
+        while not stop.is_set() and (data := os.read(fd, _READ_SIZE)):
+            with lock:
+                chunks.append((time.monotonic(), name, data))
+                if on_chunk is not None and on_chunk(name, data):
+                    stop.set()
+
+    threads = [threading.Thread(target=read, args=item, daemon=True) for item in streams.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _read_streams_and_close(streams: dict[int, str], chunks: list[tuple[float, str, bytes]]) -> None:
+    try:
+        _read_streams(streams, chunks)
+    finally:
+        for fd in streams:
+            os.close(fd)
+
+
+class SeparateOutput:
+    """Standard output and error, captured separately as timestamped chunks.
+
+    Converting it to a string returns the interleaved output.
+    """
+
+    def __init__(self, chunks: list[tuple[float, str, bytes]] | None = None) -> None:
+        """Initialize the object.
+
+        Parameters:
+            chunks: Chunks of output.
+        """
+        self.chunks: list[tuple[float, str, bytes]] = chunks if chunks is not None else []
+        """Chunks of output: monotonic timestamp, stream name (`stdout` or `stderr`), and data."""
+
+    def __str__(self) -> str:
+        return self.interleaved
+
+    def _raw(self, stream: str | None = None) -> bytes:
+        chunks = sorted(self.chunks, key=lambda chunk: chunk[0])
+        return _translate_newlines(b"".join(data for _, name, data in chunks if stream is None or name == stream))
+
+    def _join(self, stream: str | None = None) -> str:
+        return _decode(self._raw(stream))
+
+    @cached_property
+    def stdout(self) -> str:
+        """Captured standard output."""
+        return self._join("stdout")
+
+    @cached_property
+    def stderr(self) -> str:
+        """Captured standard error."""
+        return self._join("stderr")
+
+    @cached_property
+    def interleaved(self) -> str:
+        """Captured standard output and error, interleaved in the order they were written."""
+        return self._join()
+
 
 class Capture(enum.Enum):
     """An enum to store the different possible output types."""
@@ -24,6 +149,8 @@ class Capture(enum.Enum):
     """Capture standard error."""
     BOTH = "both"
     """Capture both standard output and error."""
+    SEPARATE = "separate"
+    """Capture both standard output and error, separately."""
     NONE = "none"
     """Do not capture anything."""
 
@@ -100,14 +227,29 @@ class CaptureManager:
         4
     """  # noqa: D301
 
-    def __init__(self, capture: Capture = Capture.BOTH, stdin: str | None = None) -> None:
+    def __init__(
+        self,
+        capture: Capture = Capture.BOTH,
+        stdin: str | None = None,
+        output_file: str | Path | None = None,
+    ) -> None:
         """Initialize the context manager.
 
         Parameters:
             capture: What to capture.
             stdin: Optional input.
+            output_file: A file to write the captured output to, instead of keeping it in memory.
+                It is compressed if its name ends with `.gz` (or `.zst`, with Python 3.14+).
+                Only the last lines of output are then available.
+
+        Raises:
+            ValueError: When trying to write separately captured output to a file.
         """
-        self._temp_file: IO[str] | None = None
+        if capture is Capture.SEPARATE and output_file is not None:
+            raise ValueError("Cannot write separately captured output to a single file")
+        self._output_file = output_file
+        self._sink: _Sink | None = None
+        self._temp_file: IO[bytes] | None = None
         self._capture = capture
         self._devnull: TextIO | None = None
         self._stdin = stdin
@@ -116,7 +258,10 @@ class CaptureManager:
         self._stderr_fd: int = -1
         self._saved_stdout_fd: int = -1
         self._saved_stderr_fd: int = -1
+        self._raw: bytes | None = None
         self._output: str | None = None
+        self._separate: SeparateOutput | None = None
+        self._reader: threading.Thread | None = None
 
     def __enter__(self) -> CaptureManager:  # noqa: PYI034 (false-positive)
         """Set up the necessary file descriptors and temporary files to capture output."""
@@ -132,32 +277,69 @@ class CaptureManager:
             self._saved_stdin = sys.stdin
             sys.stdin = StringIO(self._stdin)
 
+        if self._capture is Capture.SEPARATE:
+            self._enter_separate()
+            return self
+
         # Open devnull if needed.
         if self._capture in {Capture.STDOUT, Capture.STDERR}:
             self._devnull = open(os.devnull, "w", encoding="utf8")  # noqa: PTH123
 
-        # Create temporary file.
-        # Initially we used a pipe but it would hang on writes given enough output.
-        self._temp_file = tempfile.TemporaryFile("w+", encoding="utf8", prefix="failprint-")
-        fdw = self._temp_file.fileno()
+        with profile_phase("redirect"):
+            # Create temporary file.
+            # Initially we used a pipe but it would hang on writes given enough output.
+            # It is opened in binary mode: output is only decoded when accessed.
+            # Uncompressed output files directly receive output instead.
+            if self._output_file is not None:
+                self._sink = _Sink(self._output_file)
+            if self._sink is not None and not self._sink.compressed:
+                fdw = self._sink.fileno()
+            else:
+                self._temp_file = tempfile.TemporaryFile("w+b", prefix="failprint-")
+                fdw = self._temp_file.fileno()
+
+            # Redirect stdout to temporary file or devnull.
+            self._stdout_fd = sys.stdout.fileno()
+            self._saved_stdout_fd = os.dup(self._stdout_fd)
+            if self._capture in {Capture.BOTH, Capture.STDOUT}:
+                os.dup2(fdw, self._stdout_fd)
+            elif self._capture is Capture.STDERR:
+                os.dup2(self._devnull.fileno(), self._stdout_fd)  # ty: ignore[possibly-missing-attribute]
+
+            # Redirect stderr to temporary file or devnull.
+            self._stderr_fd = sys.stderr.fileno()
+            self._saved_stderr_fd = os.dup(self._stderr_fd)
+            if self._capture in {Capture.BOTH, Capture.STDERR}:
+                os.dup2(fdw, self._stderr_fd)
+            elif self._capture is Capture.STDOUT:
+                os.dup2(self._devnull.fileno(), self._stderr_fd)  # ty: ignore[possibly-missing-attribute]
+
+        return self
+
+    def _enter_separate(self) -> None:
+        # Here we need pipes, to timestamp chunks as they are written.
+        # A thread reads them continuously, so writes never hang.
+        self._separate = SeparateOutput()
+        stdout_fdr, stdout_fdw = os.pipe()
+        stderr_fdr, stderr_fdw = os.pipe()
 
-        # Redirect stdout to temporary file or devnull.
         self._stdout_fd = sys.stdout.fileno()
         self._saved_stdout_fd = os.dup(self._stdout_fd)
-        if self._capture in {Capture.BOTH, Capture.STDOUT}:
-            os.dup2(fdw, self._stdout_fd)
-        elif self._capture is Capture.STDERR:
-            os.dup2(self._devnull.fileno(), self._stdout_fd)  # ty: ignore[possibly-missing-attribute]
+        os.dup2(stdout_fdw, self._stdout_fd)
+        os.close(stdout_fdw)
 
-        # Redirect stderr to temporary file or devnull.
         self._stderr_fd = sys.stderr.fileno()
         self._saved_stderr_fd = os.dup(self._stderr_fd)
-        if self._capture in {Capture.BOTH, Capture.STDERR}:
-            os.dup2(fdw, self._stderr_fd)
-        elif self._capture is Capture.STDOUT:
-            os.dup2(self._devnull.fileno(), self._stderr_fd)  # ty: ignore[possibly-missing-attribute]
+        os.dup2(stderr_fdw, self._stderr_fd)
+        os.close(stderr_fdw)
 
-        return self
+        streams = {stdout_fdr: "stdout", stderr_fdr: "stderr"}
+        self._reader = threading.Thread(
+            target=_read_streams_and_close,
+            args=(streams, self._separate.chunks),
+            daemon=True,
+        )
+        self._reader.start()
 
     def __exit__(
         self,
@@ -184,23 +366,192 @@ class CaptureManager:
         # Restore stdout and stderr to their previous values.
         os.dup2(self._saved_stdout_fd, self._stdout_fd)
         os.dup2(self._saved_stderr_fd, self._stderr_fd)
-
-        # Read contents from temporary file, close it.
-        if self._temp_file is not None:
-            self._temp_file.seek(0)
-            self._output = self._temp_file.read()
-            self._temp_file.close()
+        os.close(self._saved_stdout_fd)
+        os.close(self._saved_stderr_fd)
+
+        with profile_phase("read"):
+            # Wait for the reader thread to drain the pipes.
+            # Background processes could keep them open: don't wait for them.
+            if self._reader is not None:
+                self._reader.join(_JOIN_TIMEOUT)
+                self._separate = SeparateOutput(list(self._separate.chunks))  # ty: ignore[possibly-missing-attribute]
+                self._raw = self._separate._raw()
+
+            # Read contents from temporary file, close it.
+            # With an output file, only read its tail (after compressing into it if needed).
+            if self._temp_file is not None:
+                self._temp_file.seek(0)
+                if self._sink is None:
+                    self._raw = _translate_newlines(self._temp_file.read())
+                else:
+                    while data := self._temp_file.read(_READ_SIZE):
+                        self._sink.write(data)
+                self._temp_file.close()
+            if self._sink is not None:
+                self._raw = _translate_newlines(self._sink.close())
 
     def __str__(self) -> str:
         return self.output
 
     @property
     def output(self) -> str:
-        """Captured output.
+        """Captured output, decoded on first access.
 
         Raises:
             RuntimeError: When accessing captured output before exiting the context manager.
         """
         if self._output is None:
-            raise RuntimeError("Not finished capturing")
+            self._output = _decode(self.raw)
         return self._output
+
+    @property
+    def separate(self) -> SeparateOutput:
+        """Captured output, with standard output and error separated (only with `Capture.SEPARATE`).
+
+        Raises:
+            RuntimeError: When accessing captured output before exiting the context manager,
+                or when output was not captured separately.
+        """
+        if self._separate is None or self._raw is None:
+            raise RuntimeError("Output not captured separately, or not finished capturing")
+        return self._separate
+
+    @property
+    def raw(self) -> bytes:
+        """Captured output, as raw bytes.
+
+        Raises:
+            RuntimeError: When accessing captured output before exiting the context manager.
+        """
+        if self._raw is None:
+            raise RuntimeError("Not finished capturing")
+        return self._raw
+
+
+_task_capture: ContextVar[_TaskCapture | None] = ContextVar("failprint_task_capture", default=None)
+_task_streams_lock = threading.Lock()
+_task_streams_users = 0
+
+
+def _install_task_streams() -> None:
+    global _task_streams_users  # noqa: PLW0603
+    with _task_streams_lock:
+        if _task_streams_users == 0:
+            sys.stdin = _TaskStream("stdin", sys.stdin)  # ty: ignore[invalid-assignment]
+            sys.stdout = _TaskStream("stdout", sys.stdout)  # ty: ignore[invalid-assignment]
+            sys.stderr = _TaskStream("stderr", sys.stderr)  # ty: ignore[invalid-assignment]
+        _task_streams_users += 1
+
+
+def _uninstall_task_streams() -> None:
+    global _task_streams_users  # noqa: PLW0603
+    with _task_streams_lock:
+        _task_streams_users -= 1
+        if _task_streams_users == 0:
+            # Streams could have been replaced in the meantime: only restore ours.
+            for name in ("stdin", "stdout", "stderr"):
+                if isinstance(stream := getattr(sys, name), _TaskStream):
+                    setattr(sys, name, stream._original)
+
+
+@contextmanager
+def _task_streams() -> Iterator[None]:
+    # Keep task streams installed across many task captures, for example for a batch of runs.
+    _install_task_streams()
+    try:
+        yield
+    finally:
+        _uninstall_task_streams()
+
+
+class _TaskBuffer:
+    # Binary buffer of a task stream, while the current task captures output.
+
+    def __init__(self, capture: _TaskCapture, name: str) -> None:
+        self._capture = capture
+        self._name = name
+
+    def write(self, data: bytes) -> int:
+        self._capture.write(self._name, bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class _TaskStream:
+    # Replaces `sys.stdout`, `sys.stderr` and `sys.stdin` while tasks capture output:
+    # it uses the streams of the task capture in the current context if any,
+    # and the original streams otherwise.
+
+    def __init__(self, name: str, original: TextIO) -> None:
+        self._name = name
+        self._original = original
+
+    def __getattr__(self, name: str) -> Any:
+        if (capture := _task_capture.get()) is not None and self._name == "stdin" and capture.stdin is not None:
+            return getattr(capture.stdin, name)
+        return getattr(self._original, name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__getattr__("readline"), "")
+
+    @property
+    def buffer(self) -> _TaskBuffer | IO[bytes]:
+        if (capture := _task_capture.get()) is not None and self._name != "stdin":
+            return _TaskBuffer(capture, self._name)
+        return self._original.buffer
+
+    def write(self, text: str) -> int:
+        if (capture := _task_capture.get()) is not None:
+            capture.write(self._name, text.encode("utf8", "surrogateescape"))
+            return len(text)
+        return self._original.write(text)
+
+    def flush(self) -> None:
+        if _task_capture.get() is None:
+            self._original.flush()
+
+
+class _TaskCapture:
+    # Capture output written to `sys.stdout` and `sys.stderr` by the current context only
+    # (an asyncio task and the tasks it creates, or a thread), so that several
+    # captures can run concurrently. Output written directly to file descriptors,
+    # for example by subprocesses, is not captured.
+
+    def __init__(self, capture: Capture, stdin: str | None = None, output_file: str | Path | None = None) -> None:
+        if capture is Capture.SEPARATE and output_file is not None:
+            raise ValueError("Cannot write separately captured output to a single file")
+        self._capture = capture
+        self._output_file = output_file
+        self._token: Token[_TaskCapture | None] | None = None
+        self.stdin = None if stdin is None else StringIO(stdin)
+        self.chunks: list[tuple[float, str, bytes]] = []
+        self.raw = b""
+
+    def __enter__(self) -> _TaskCapture:  # noqa: PYI034 (false-positive)
+        _install_task_streams()
+        self._token = _task_capture.set(self)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        _task_capture.reset(self._token)  # ty: ignore[invalid-argument-type]
+        _uninstall_task_streams()
+        self.raw = SeparateOutput(self.chunks)._raw()
+        if self._output_file is not None:
+            sink = _Sink(self._output_file)
+            sink.write(self.raw)
+            self.raw = _translate_newlines(sink.close())
+
+    @property
+    def separate(self) -> SeparateOutput:
+        return SeparateOutput(self.chunks)
+
+    def write(self, name: str, data: bytes) -> None:
+        if self._capture in {Capture.BOTH, Capture.SEPARATE} or self._capture.value == name:
+            self.chunks.append((time.monotonic(), name, data))
@@ -14,16 +14,59 @@
 from __future__ import annotations
 
 import argparse
+import os
+import re
+import shlex
 import sys
-from typing import TYPE_CHECKING, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from queue import Queue
+from typing import TYPE_CHECKING, Any, Callable
 
 from failprint._internal import debug
 from failprint._internal.capture import Capture
-from failprint._internal.formats import accept_custom_format, formats
-from failprint._internal.runners import run
+from failprint._internal.formats import _FormatNames, accept_custom_format
+from failprint._internal.metrics import MetricsSink
+from failprint._internal.process import Limits
+from failprint._internal.profiling import Profiler
+from failprint._internal.runners import _get_format, _print_result, run
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    from collections.abc import Iterable, Sequence
+
+    from failprint._internal.runners import RunResult
+
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def _parse_size(value: str) -> int:
+    match = re.fullmatch(r"(\d+)\s*([kmgt]?)i?b?", value.strip(), re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r} (examples: 536870912, 512M, 2G)")
+    return int(match[1]) * _SIZE_UNITS[match[2].lower()]
+
+
+def _parse_cpus(value: str) -> set[int]:
+    cpus: set[int] = set()
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        if not start.isdigit() or not (end.isdigit() or not end) or int(end or start) < int(start):
+            raise argparse.ArgumentTypeError(f"invalid CPU list: {value!r} (examples: 0, 0-3, 0,2,4-7)")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+
+def _cpu_sets(jobs: int) -> list[set[int]]:
+    # Contiguous CPUs usually share caches: give each job a contiguous slice of the available CPUs.
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < jobs:
+        return [{cpus[index % len(cpus)]} for index in range(jobs)]
+    size = len(cpus) // jobs
+    cpu_sets = [set(cpus[index * size : (index + 1) * size]) for index in range(jobs)]
+    cpu_sets[-1].update(cpus[jobs * size :])
+    return cpu_sets
 
 
 class _DebugInfo(argparse.Action):
@@ -94,13 +137,14 @@ def add_flags(parser: ArgParser, *, set_defaults: bool = True) -> ArgParser:
         "--fmt",
         "--format",
         dest="fmt",
-        choices=formats.keys(),
+        choices=_FormatNames(),
         type=accept_custom_format,
         default=None,
         help="Output format. Pass your own Jinja2 template as a string with '-f custom=TEMPLATE'. "
         "Available variables: command, title (command or title passed with -t), code (exit status), "
         "success (boolean), failure (boolean), number (command number passed with -n), "
-        "output (command output), nofail (boolean), quiet (boolean), silent (boolean). "
+        "output (command output), stdout and stderr (with '-c separate'), output_file (with '--output-file'), "
+        "nofail (boolean), quiet (boolean), silent (boolean). "
         "Available filters: indent (textwrap.indent).",
     )
     parser.add_bool_argument(
@@ -137,6 +181,22 @@ def add_flags(parser: ArgParser, *, set_defaults: bool = True) -> ArgParser:
         truthy_help="Don't print anything.",
         falsy_help="Print output as usual.",
     )
+    parser.add_bool_argument(
+        ["-k", "--compact"],
+        ["-K", "--no-compact"],
+        dest="compact",
+        default=False if set_defaults else None,
+        truthy_help="Compact the printed output: collapse repeated lines and progress bars redrawn with carriage returns.",
+        falsy_help="Print the output as it was captured.",
+    )
+    parser.add_bool_argument(
+        ["--shell"],
+        ["--no-shell"],
+        dest="shell",
+        default=None,
+        truthy_help="Always run commands in a shell. By default, only commands using shell syntax are.",
+        falsy_help="Never run commands in a shell: split them into arguments and execute them directly.",
+    )
     parser.add_bool_argument(
         ["-z", "--zero", "--nofail"],
         ["-Z", "--no-zero", "--strict"],
@@ -148,6 +208,73 @@ def add_flags(parser: ArgParser, *, set_defaults: bool = True) -> ArgParser:
     return parser
 
 
+def _add_command_options(parser: ArgParser, *, set_defaults: bool) -> None:
+    # Options that can also be set per command, in files passed with `--from-file`.
+    # TODO: specific to the format
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=1 if set_defaults else None,
+        help="Command number. Useful for the 'tap' format. "
+        "With multiple commands, they are numbered automatically, starting at this number.",
+    )
+    # TODO: specific to the format
+    parser.add_argument("-t", "--title", help="Command title. Default is the command itself.")
+    parser.add_argument(
+        "--fail-on",
+        metavar="REGEX",
+        help="Terminate the command as soon as a line of its output matches this regular expression, "
+        "and report it as failed.",
+    )
+    parser.add_argument(
+        "--output-file",
+        metavar="PATH",
+        help="Write the captured output to this file instead of keeping it in memory, "
+        "and only print its last lines. Compressed on the fly if PATH ends with '.gz' (or '.zst' with Python 3.14+). "
+        "To run several commands, set it on each line of commands instead.",
+    )
+    parser.add_argument(
+        "--max-memory",
+        metavar="SIZE",
+        type=_parse_size,
+        help="Limit the virtual memory of the command, in bytes or with a K, M, G or T suffix (for example 2G). "
+        "Allocations beyond it fail. Not supported on Windows.",
+    )
+    parser.add_argument(
+        "--max-cpu-seconds",
+        metavar="SECONDS",
+        type=int,
+        help="Limit the CPU time of the command. The command is killed when it exceeds it, "
+        "and reported with exit code 152. Not supported on Windows.",
+    )
+    parser.add_argument(
+        "--max-files",
+        metavar="NUMBER",
+        type=int,
+        help="Limit the number of files the command can open. Not supported on Windows.",
+    )
+    parser.add_argument(
+        "--nice",
+        metavar="INCREMENT",
+        type=int,
+        help="Lower the priority of the command by this niceness increment (negative values need privileges). "
+        "Not supported on Windows.",
+    )
+    parser.add_argument(
+        "--ionice",
+        metavar="CLASS",
+        help="Set the I/O scheduling class of the command: 'idle', 'best-effort[:0-7]' or 'realtime[:0-7]'. "
+        "Linux only, requires the 'ionice' executable.",
+    )
+    parser.add_argument(
+        "--cpu-affinity",
+        metavar="CPUS",
+        type=_parse_cpus,
+        help="Run the command on these CPUs only, for example '0-3' or '0,2,4'. Linux only.",
+    )
+
+
 def get_parser() -> ArgParser:
     """Return the CLI argument parser.
 
@@ -155,11 +282,55 @@ def get_parser() -> ArgParser:
         An argparse parser.
     """
     parser = add_flags(ArgParser(prog="failprint"))
-    # TODO: specific to the format
-    parser.add_argument("-n", "--number", type=int, default=1, help="Command number. Useful for the 'tap' format.")
-    # TODO: specific to the format
-    parser.add_argument("-t", "--title", help="Command title. Default is the command itself.")
-    parser.add_argument("cmd", metavar="COMMAND", nargs="+")
+    _add_command_options(parser, set_defaults=True)
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        nargs="?",
+        const="-",
+        help="Measure the time spent in each phase of the run (spawn, capture, decode, render, print...). "
+        "Print a breakdown on standard error, or write a Chrome trace (viewable in Perfetto) to FILE.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Write metrics (runs, durations, output sizes) to this file in the Prometheus text format, "
+        "for example to be collected by the node-exporter textfile collector. The file is replaced atomically.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        metavar="SECONDS",
+        type=float,
+        help="Also write metrics periodically while the command runs, not only when it ends.",
+    )
+    parser.add_argument(
+        "--from-file",
+        metavar="FILE",
+        help="Read commands from FILE, one per line, and run them all. Empty lines and lines starting with '#' "
+        "are ignored. Lines can start with options (flags, -n, -t, --fail-on, --output-file, --max-*, --nice, --ionice, "
+        "--cpu-affinity) overriding "
+        "the global ones, separated from the command by '--', for example: -t 'Run tests' -q -- pytest -x.",
+    )
+    parser.add_argument(
+        "--stdin-commands",
+        action="store_true",
+        help="Read commands from standard input, like '--from-file'.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of commands to run in parallel, with '--from-file' or '--stdin-commands'. "
+        "Results are still printed in order. Progress and PTYs are disabled when running commands in parallel.",
+    )
+    parser.add_argument(
+        "--spread-cpus",
+        action="store_true",
+        help="When running commands in parallel, run each one on its own set of CPUs, "
+        "to reduce contention and cache thrashing. Commands with '--cpu-affinity' keep theirs. Linux only.",
+    )
+    parser.add_argument("cmd", metavar="COMMAND", nargs="*")
     parser.add_argument("-V", "--version", action="version", version=f"%(prog)s {debug._get_version()}")
     parser.add_argument("--debug-info", action=_DebugInfo, help="Print debug information.")
     return parser
@@ -177,5 +348,146 @@ def main(args: list[str] | None = None) -> int:
         An exit code.
     """
     parser = get_parser()
-    opts = parser.parse_args(args).__dict__.items()
-    return run(**{_: value for _, value in opts if value is not None}).code
+    opts = parser.parse_args(args).__dict__
+    profile = opts.pop("profile")
+    metrics_file = opts.pop("metrics_file")
+    metrics_interval = opts.pop("metrics_interval")
+    from_file = opts.pop("from_file")
+    stdin_commands = opts.pop("stdin_commands")
+    jobs = opts.pop("jobs")
+    spread_cpus = opts.pop("spread_cpus")
+    multiple = from_file is not None or stdin_commands
+    if multiple and opts["cmd"]:
+        parser.error("COMMAND cannot be used with --from-file or --stdin-commands")
+    if not multiple and not opts["cmd"]:
+        parser.error("the following arguments are required: COMMAND")
+    if jobs < 1:
+        parser.error("--jobs must be a positive number")
+    if spread_cpus and not hasattr(os, "sched_getaffinity"):
+        parser.error("--spread-cpus is only supported on Linux")
+
+    if from_file is not None:
+        with open(from_file, encoding="utf8") as file:  # noqa: PTH123
+            commands = _read_commands(file, from_file)
+    elif stdin_commands:
+        commands = _read_commands(sys.stdin, "<stdin>")
+    if multiple and len(commands) > 1 and opts["output_file"] is not None:
+        # Each command would overwrite the file (concurrently with --jobs).
+        parser.error("--output-file cannot be used to run several commands: set it on each line instead")
+
+    with ExitStack() as stack:
+        profiler = None if profile is None else stack.enter_context(Profiler())
+        if metrics_file is not None:
+            stack.enter_context(MetricsSink(metrics_file, interval=metrics_interval))
+        options = {_: value for _, value in opts.items() if value is not None}
+        code = (
+            _run_commands(commands, options, jobs, spread_cpus=spread_cpus)
+            if multiple
+            else run(**_with_limits(options)).code
+        )
+
+    if profiler is not None:
+        if profile == "-":
+            profiler.print_summary(sys.stderr)
+        else:
+            profiler.write_trace(profile)
+    return code
+
+
+def _read_commands(lines: Iterable[str], source: str) -> list[dict[str, Any]]:
+    commands = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()  # noqa: PLW2901
+        if line and not line.startswith("#"):
+            commands.append(_parse_command_line(line, f"{source}:{lineno}"))
+    return commands
+
+
+def _parse_command_line(line: str, location: str) -> dict[str, Any]:
+    # Commands are kept as strings, to preserve shell syntax.
+    if not line.startswith("-"):
+        return {"cmd": line}
+    parser = ArgParser(prog=f"failprint: {location}", add_help=False)
+    add_flags(parser, set_defaults=False)
+    _add_command_options(parser, set_defaults=False)
+    lexer = shlex.shlex(line, posix=True)
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    options = []
+    for token in lexer:
+        if token == "--":  # noqa: S105
+            break
+        options.append(token)
+    command = lexer.instream.read().strip()
+    if not command:
+        parser.error("options must be followed by '--' and a command")
+    line_opts = parser.parse_args(options).__dict__
+    return {**{_: value for _, value in line_opts.items() if value is not None}, "cmd": command}
+
+
+def _with_limits(options: dict[str, Any]) -> dict[str, Any]:
+    # Limit options are grouped into a single `limits` option.
+    limits = {
+        name: options.pop(f"max_{name}") for name in ("memory", "cpu_seconds", "files") if f"max_{name}" in options
+    }
+    if limits:
+        options["limits"] = Limits(**limits)
+    return options
+
+
+def _run_on_cpu_set(cpu_sets: Queue[set[int]], **kwargs: Any) -> RunResult:
+    # There are as many CPU sets as jobs: one is always free when a job starts.
+    cpu_set = cpu_sets.get()
+    try:
+        return run(**{"cpu_affinity": cpu_set, **kwargs})
+    finally:
+        cpu_sets.put(cpu_set)
+
+
+def _run_commands(
+    commands: list[dict[str, Any]],
+    options: dict[str, Any],
+    jobs: int,
+    *,
+    spread_cpus: bool = False,
+) -> int:
+    # The exit code is the one of the first failing command, if any.
+    options.pop("cmd")
+    first_number = options.pop("number")
+    runs = [
+        _with_limits({**options, "number": first_number + index, **command}) for index, command in enumerate(commands)
+    ]
+
+    if jobs == 1:
+        codes = [run(**kwargs).code for kwargs in runs]
+        return next((code for code in codes if code), 0)
+
+    codes = []
+    runner: Callable[..., RunResult] = run
+    if spread_cpus:
+        cpu_sets: Queue[set[int]] = Queue()
+        for cpu_set in _cpu_sets(jobs):
+            cpu_sets.put(cpu_set)
+        runner = partial(_run_on_cpu_set, cpu_sets)
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(runner, **{**kwargs, "nofail": False, "silent": True, "progress": False, "pty": False})
+            for kwargs in runs
+        ]
+        for kwargs, future in zip(runs, futures):
+            result = future.result()
+            nofail = kwargs.get("nofail", False)
+            if not kwargs.get("silent"):
+                _print_result(
+                    result,
+                    _get_format(kwargs.get("fmt")),
+                    code=result.code,
+                    title=kwargs.get("title"),
+                    command=kwargs["cmd"],
+                    number=kwargs["number"],
+                    nofail=nofail,
+                    quiet=kwargs.get("quiet", False),
+                    compact=kwargs.get("compact", False),
+                )
+            codes.append(0 if nofail else result.code)
+    return next((code for code in codes if code), 0)
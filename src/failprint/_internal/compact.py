@@ -0,0 +1,86 @@
+# Output post-processing, applied between capture and rendering.
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+_ANSI_RE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+
+def compact_output(output: str, *, strip_ansi: bool = False) -> str:
+    """Compact output in a single pass, before rendering it.
+
+    - Lines overwritten with carriage returns (progress bars)
+      are replaced by what a terminal would finally display.
+    - Consecutive duplicate lines are collapsed into one,
+      followed by a line telling how many times it was repeated.
+    - ANSI sequences are removed if `strip_ansi` is true.
+
+    Parameters:
+        output: The output to compact.
+        strip_ansi: Whether to remove ANSI escape sequences.
+
+    Returns:
+        The compacted output.
+
+    Examples:
+        >>> print(compact_output("10%\\r50%\\r100%\\nwarning\\nwarning\\nwarning\\ndone"))
+        100%
+        warning
+        ... repeated 2 more times
+        done
+    """  # noqa: D301
+    compacted = "\n".join(_compact_lines(output, strip_ansi=strip_ansi))
+    if output.endswith("\n"):
+        return compacted + "\n"
+    return compacted
+
+
+def _compact_lines(output: str, *, strip_ansi: bool) -> Iterator[str]:
+    previous = None
+    count = 0
+    for line in _iter_lines(output):
+        if strip_ansi:
+            line = _ANSI_RE.sub("", line)  # noqa: PLW2901
+        if "\r" in line:
+            line = _overwrite(line)  # noqa: PLW2901
+        if line == previous:
+            count += 1
+            continue
+        if previous is not None:
+            yield from _repeated(previous, count)
+        previous = line
+        count = 1
+    if previous is not None:
+        yield from _repeated(previous, count)
+
+
+def _iter_lines(text: str) -> Iterator[str]:
+    start = 0
+    while (end := text.find("\n", start)) != -1:
+        yield text[start:end]
+        start = end + 1
+    if start < len(text):
+        yield text[start:]
+
+
+def _overwrite(line: str) -> str:
+    # Each carriage return moves the cursor back to the first column,
+    # and the following text overwrites what was displayed before.
+    segments = line.split("\r")
+    shown = segments[0]
+    for segment in segments[1:]:
+        shown = segment + shown[len(segment) :]
+    return shown
+
+
+def _repeated(line: str, count: int) -> Iterator[str]:
+    yield line
+    if count == 2:  # noqa: PLR2004
+        yield line
+    elif count > 2:  # noqa: PLR2004
+        yield f"... repeated {count - 1} more times"
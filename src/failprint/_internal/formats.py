@@ -2,23 +2,47 @@
 
 from __future__ import annotations
 
+import contextlib
+import hashlib
 import inspect
-from typing import TYPE_CHECKING, Callable
-
+import json
+import os
+import sys
+import tempfile
+import textwrap
+from functools import cache
+from importlib.metadata import EntryPoint, entry_points
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+from ansimarkup import parse
+
+from failprint._internal.capture import _decode
 from failprint._internal.lazy import LazyCallable
+from failprint._internal.spool import SpooledOutput
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    from collections.abc import Iterable, Iterator, Mapping, Sequence
     from types import FrameType
 
-    from failprint._internal.types import CmdFuncType
+    from jinja2 import Environment, Template
+
+    from failprint._internal.types import CmdFuncType, RenderFunction
 
 _DEFAULT_FORMAT = "pretty"
 _DEFAULT_CALLABLE_NAME = "callable"
+_ENTRY_POINT_GROUP = "failprint.formats"
+_CHUNK_SIZE = 1 << 20
 
 _LT = "#FAILPRINT_LT#"
 _GT = "#FAILPRINT_GT#"
 
+_BOLD = "\x1b[1m"
+_GREEN = "\x1b[32m"
+_RED = "\x1b[31m"
+_YELLOW = "\x1b[33m"
+_RESET = "\x1b[0m"
+
 
 def escape(text: str) -> str:
     """Escape text for ansiprint by replacing `<` and `>` with special strings.
@@ -44,47 +68,312 @@ def unescape(text: str) -> str:
     return text.replace(_LT, "<").replace(_GT, ">")
 
 
+class RawOutput:
+    """Chunk yielded by the render functions of passthrough formats, where output must be copied as is.
+
+    Output is then copied to standard output without being decoded, rendered or even read by Python
+    when possible (output stored in a [spool][failprint.Spool] is copied with `os.sendfile`).
+    """
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "RawOutput()"
+
+
 class Format:
-    """Class to define a display format."""
+    """Class to define a display format.
+
+    A format is either defined with Jinja templates, whose output is parsed
+    as [ansimarkup](https://github.com/gvalkov/python-ansimarkup) markup,
+    or with plain Python functions, receiving the same context as templates,
+    and returning the final text (ANSI sequences included) without further processing.
+    Functions can also return an iterable of text chunks, which are then written
+    one after the other, without building the whole text in memory.
+    Functions of passthrough formats can yield [`RawOutput`][failprint.RawOutput] chunks:
+    they then receive output as raw bytes (or a reference into a spool), not decoded.
+    """
+
+    __slots__ = ("accept_ansi", "passthrough", "progress_template", "template")
 
-    def __init__(self, template: str, *, progress_template: str | None = None, accept_ansi: bool = True) -> None:
+    def __init__(
+        self,
+        template: str | RenderFunction,
+        *,
+        progress_template: str | RenderFunction | None = None,
+        accept_ansi: bool = True,
+        passthrough: bool = False,
+    ) -> None:
         """Initialize the object.
 
         Arguments:
-            template: The main template.
-            progress_template: The template to show progress.
+            template: The main template, or render function.
+            progress_template: The template, or render function, to show progress.
             accept_ansi: Whether to accept ANSI sequences.
+            passthrough: Whether the render function copies output as is, with `RawOutput` chunks.
         """
         self.template = template
-        """The main template."""
+        """The main template, or render function."""
         self.progress_template = progress_template
-        """The template to show progress."""
+        """The template, or render function, to show progress."""
         self.accept_ansi = accept_ansi
         """Whether to accept ANSI sequences."""
+        self.passthrough = passthrough
+        """Whether the render function copies output as is, with `RawOutput` chunks."""
+
+    def render(self, context: Mapping[str, Any]) -> str:
+        """Render a result.
+
+        Arguments:
+            context: The template context.
+
+        Returns:
+            The rendered text.
+        """
+        rendered = _render(self.template, context)
+        if isinstance(rendered, str):
+            return rendered
+        return "".join(_output_text(context["output"]) if isinstance(chunk, RawOutput) else chunk for chunk in rendered)
+
+    def stream(self, context: Mapping[str, Any]) -> Iterable[str]:
+        """Render a result as chunks of text.
+
+        Templates are rendered whole, since markup can span chunks:
+        only render functions returning chunks are streamed.
+
+        Arguments:
+            context: The template context.
+
+        Returns:
+            The rendered chunks.
+        """
+        rendered = _render(self.template, context)
+        return (rendered,) if isinstance(rendered, str) else rendered
+
+    def render_progress(self, context: Mapping[str, Any]) -> str:
+        """Render the progress line.
+
+        Arguments:
+            context: The template context (title and command).
+
+        Returns:
+            The rendered text.
+        """
+        rendered = _render(self.progress_template or "", context)
+        return rendered if isinstance(rendered, str) else "".join(rendered)
+
+
+def _output_text(output: str | bytes | memoryview | SpooledOutput) -> str:
+    if isinstance(output, str):
+        return output
+    return _decode(output.view() if isinstance(output, SpooledOutput) else output)
+
+
+def _render(template: str | RenderFunction, context: Mapping[str, Any]) -> str | Iterable[str]:
+    if callable(template):
+        return template(context)
+    return unescape(parse(_get_template(template).render(context)))
+
+
+@cache
+def _get_environment() -> Environment:
+    # Jinja is only needed for custom formats: built-in formats are plain Python functions.
+    from jinja2 import Environment  # noqa: PLC0415
+
+    env = Environment(autoescape=False)  # noqa: S701 (no HTML: no need to escape)
+    env.filters["indent"] = textwrap.indent
+    env.filters["escape"] = env.filters["e"] = escape
+    env.filters["unescape"] = env.filters["u"] = unescape
+    return env
+
+
+@cache
+def _get_template(source: str) -> Template:
+    # Templates are compiled once per process, and shared by all runs.
+    return _get_environment().from_string(source)
+
+
+def _markup(text: str) -> str:
+    # Titles can contain markup: only parse them when they contain tags.
+    return unescape(parse(text)) if "<" in text else unescape(text)
+
+
+def _heading(title: str | None, command: str) -> str:
+    if not title:
+        return f"{_BOLD}{unescape(command)}{_RESET}"
+    if "<" in title:
+        return unescape(parse(f"<bold>{title}</bold>"))
+    return f"{_BOLD}{unescape(title)}{_RESET}"
+
+
+def _indent(text: str, prefix: str) -> Iterator[str]:
+    # Indent large outputs block by block, cut on line boundaries,
+    # instead of building a second full-size copy of them.
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + _CHUNK_SIZE) + 1 or len(text)
+        yield unescape(textwrap.indent(text[start:end], prefix))
+        start = end
+
+
+# The following functions render exactly like these templates, without Jinja and ansimarkup.
+_PRETTY_TEMPLATE = (
+    "{% if success %}<green>✓</green>"
+    "{% elif nofail %}<yellow>✗</yellow>"
+    "{% else %}<red>✗</red>{% endif %} "
+    "<bold>{{ title or command|e }}</bold>"
+    "{% if cached %} (cached){% endif %}"
+    "{% if failure %} ({{ code }}){% endif %}"
+    "{% if failure and output and not quiet %}\n"
+    "{{ ('  > ' + command|e + '\n') if title and command else '' }}"
+    "{{ output|indent(2 * ' ')|e }}{% endif %}"
+)
+_PRETTY_PROGRESS_TEMPLATE = "> {{ title or command|e }}"
+_TAP_TEMPLATE = (
+    "{% if failure %}not {% endif %}ok {{ number }} - {{ title or command }}"
+    "{% if failure and output %}\n  ---\n  "
+    "{{ ('command: ' + command + '\n  ') if title and command else '' }}"
+    "output: |\n{{ output|indent(4 * ' ') }}\n  ...{% endif %}"
+)
+
+
+def _pretty_header(context: Mapping[str, Any]) -> tuple[str, bool]:
+    # Return the text preceding output, and whether output must be shown.
+    title = context["title"]
+    command = context["command"]
+    if context["success"]:
+        status = f"{_GREEN}✓{_RESET}"
+    elif context["nofail"]:
+        status = f"{_YELLOW}✗{_RESET}"
+    else:
+        status = f"{_RED}✗{_RESET}"
+    rendered = f"{status} {_heading(title, command)}"
+    if context.get("cached"):
+        rendered = f"{rendered} (cached)"
+    if not context["failure"]:
+        return rendered, False
+    rendered = f"{rendered} ({context['code']})"
+    if not context["output"] or context["quiet"]:
+        return rendered, False
+    if title and command:
+        rendered = f"{rendered}\n  > {unescape(command)}"
+    return f"{rendered}\n", True
+
+
+def _render_pretty(context: Mapping[str, Any]) -> Iterator[str]:
+    header, show_output = _pretty_header(context)
+    yield header
+    if show_output:
+        yield from _indent(context["output"], "  ")
+
+
+def _render_raw(context: Mapping[str, Any]) -> Iterator[str | RawOutput]:
+    # Like the pretty format, without indenting output, to copy it as is.
+    header, show_output = _pretty_header(context)
+    yield header
+    if show_output:
+        yield RawOutput()
+
+
+def _render_pretty_progress(context: Mapping[str, Any]) -> str:
+    title = context["title"]
+    return f"> {_markup(title) if title else unescape(context['command'])}"
+
+
+def _render_tap(context: Mapping[str, Any]) -> Iterator[str]:
+    title = context["title"]
+    command = context["command"]
+    failure = context["failure"]
+    rendered = f"{'not ' if failure else ''}ok {context['number']} - {_markup(title) if title else unescape(command)}"
+    output = context["output"]
+    if not failure or not output:
+        yield rendered
+        return
+    rendered = f"{rendered}\n  ---\n  "
+    if title and command:
+        rendered = f"{rendered}command: {unescape(command)}\n  "
+    yield f"{rendered}output: |\n"
+    yield from _indent(output, "    ")
+    yield "\n  ..."
 
 
 formats: dict[str, Format] = {
-    "pretty": Format(
-        "{% if success %}<green>✓</green>"
-        "{% elif nofail %}<yellow>✗</yellow>"
-        "{% else %}<red>✗</red>{% endif %} "
-        "<bold>{{ title or command|e }}</bold>"
-        "{% if failure %} ({{ code }}){% endif %}"
-        "{% if failure and output and not quiet %}\n"
-        "{{ ('  > ' + command|e + '\n') if title and command else '' }}"
-        "{{ output|indent(2 * ' ')|e }}{% endif %}",
-        progress_template="> {{ title or command|e }}",
-    ),
-    "tap": Format(
-        "{% if failure %}not {% endif %}ok {{ number }} - {{ title or command }}"
-        "{% if failure and output %}\n  ---\n  "
-        "{{ ('command: ' + command + '\n  ') if title and command else '' }}"
-        "output: |\n{{ output|indent(4 * ' ') }}\n  ...{% endif %}",
-        accept_ansi=False,
-    ),
+    "pretty": Format(_render_pretty, progress_template=_render_pretty_progress),
+    "raw": Format(_render_raw, progress_template=_render_pretty_progress, passthrough=True),
+    "tap": Format(_render_tap, accept_ansi=False),
 }
 
 
+def _cache_dir() -> Path:
+    if cache_dir := os.environ.get("FAILPRINT_CACHE_DIR"):
+        return Path(cache_dir)
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "failprint"
+
+
+def _environment_fingerprint() -> list[tuple[str, int | None]]:
+    # Installing or removing a distribution changes the modification time of its `sys.path` entry.
+    fingerprint = []
+    for entry in sys.path:
+        try:
+            mtime = os.stat(entry or ".").st_mtime_ns  # noqa: PTH116
+        except OSError:
+            mtime = None
+        fingerprint.append((entry, mtime))
+    return fingerprint
+
+
+def _scan_plugin_formats() -> dict[str, str]:
+    return {entry_point.name: entry_point.value for entry_point in entry_points(group=_ENTRY_POINT_GROUP)}
+
+
+@cache
+def _plugin_formats() -> dict[str, str]:
+    # Scanning entry points reads the metadata of every installed distribution:
+    # the result is cached on disk, per environment, until a `sys.path` entry changes.
+    environment = hashlib.sha256(f"{sys.prefix}\0{sys.executable}".encode()).hexdigest()[:16]
+    cache_file = _cache_dir() / f"formats-{environment}.json"
+    fingerprint = json.loads(json.dumps(_environment_fingerprint()))
+    with contextlib.suppress(OSError, ValueError):
+        cached = json.loads(cache_file.read_text(encoding="utf8"))
+        if cached["fingerprint"] == fingerprint:
+            return cached["formats"]
+    plugins = _scan_plugin_formats()
+    with contextlib.suppress(OSError):
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, prefix=f".{cache_file.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf8") as file:
+                json.dump({"fingerprint": fingerprint, "formats": plugins}, file)
+            os.replace(tmp_path, cache_file)  # noqa: PTH105
+        except BaseException:
+            os.unlink(tmp_path)  # noqa: PTH108
+            raise
+    return plugins
+
+
+def _load_format(name: str) -> Format | None:
+    if (format_obj := formats.get(name)) is not None:
+        return format_obj
+    if (value := _plugin_formats().get(name)) is None:
+        return None
+    # Plugins are only imported when their format is requested.
+    plugin = EntryPoint(name=name, value=value, group=_ENTRY_POINT_GROUP).load()
+    format_obj = plugin if isinstance(plugin, Format) else Format(plugin)
+    formats[name] = format_obj
+    return format_obj
+
+
+class _FormatNames:
+    # Names of built-in and plugin formats, to use as command line choices.
+    # Entry points are only scanned when a name is not a built-in one.
+
+    def __contains__(self, name: object) -> bool:
+        return name in formats or name in _plugin_formats()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter({**dict.fromkeys(formats), **dict.fromkeys(_plugin_formats())})
+
+
 def accept_custom_format(string: str) -> str:
     """Store the value in `formats` if it starts with custom.
 
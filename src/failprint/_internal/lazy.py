@@ -2,10 +2,22 @@
 
 from __future__ import annotations
 
+import contextlib
+import enum
+import hashlib
+import importlib
+import inspect
+import os
+import pickle
 import sys
+import tempfile
+import threading
+import time
 import warnings
+from collections import OrderedDict
 from functools import wraps
-from typing import TYPE_CHECKING, Callable, Generic, TypeVar, overload
+from pathlib import Path, PurePath
+from typing import TYPE_CHECKING, Any, Callable, Generic, TypeVar, overload
 
 if sys.version_info < (3, 10):
     from typing_extensions import ParamSpec
@@ -13,17 +25,139 @@ else:
     from typing import ParamSpec
 
 if TYPE_CHECKING:
-    from collections.abc import Mapping, Sequence
+    from collections.abc import Iterable, Iterator, Mapping, Sequence
 
 
 _P = ParamSpec("_P")
 _R = TypeVar("_R")
 
 
+class ResultCache:
+    """A cache of lazy callables results.
+
+    Results are kept in memory, the least recently used ones being evicted first,
+    and optionally persisted on disk (pickled), to be reused across processes.
+
+    Examples:
+        >>> checks = ResultCache(path=".cache/checks", ttl=3600)
+        >>> @lazy(cache=checks)
+        ... def tool_installed(name: str) -> bool:
+        ...     return shutil.which(name) is not None
+    """
+
+    def __init__(self, maxsize: int = 128, *, ttl: float | None = None, path: str | Path | None = None) -> None:
+        """Initialize the cache.
+
+        Parameters:
+            maxsize: The maximum number of results kept in memory.
+            ttl: The time results stay valid for, in seconds. Default: forever.
+            path: A directory to persist results in, in a `results` subdirectory.
+                Default: results are only kept in memory.
+        """
+        self.maxsize = maxsize
+        """The maximum number of results kept in memory."""
+        self.ttl = ttl
+        """The time results stay valid for, in seconds."""
+        self.path = None if path is None else Path(path)
+        """The directory results are persisted in, if any."""
+        # Results are stored in a subdirectory, so that clearing the cache never deletes other files.
+        self._directory = None if path is None else Path(path, "results")
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: str) -> tuple[bool, Any]:
+        """Look a result up.
+
+        Parameters:
+            key: The result key.
+
+        Returns:
+            Whether the result was found (and is still valid), and the result.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self._directory is not None:
+            with contextlib.suppress(OSError, pickle.UnpicklingError, EOFError, ValueError):
+                entry = pickle.loads((self._directory / key).read_bytes())  # noqa: S301
+                self._remember(key, entry)
+        if entry is None:
+            return False, None
+        created, value = entry
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self.discard(key)
+            return False, None
+        return True, value
+
+    def store(self, key: str, value: Any) -> None:
+        """Store a result.
+
+        Results that cannot be pickled are only kept in memory.
+
+        Parameters:
+            key: The result key.
+            value: The result.
+        """
+        entry = (time.time(), value)
+        self._remember(key, entry)
+        if self._directory is not None:
+            with contextlib.suppress(OSError, pickle.PicklingError, TypeError, AttributeError):
+                data = pickle.dumps(entry)
+                self._directory.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self._directory, prefix=f".{key}.")
+                with os.fdopen(fd, "wb") as file:
+                    file.write(data)
+                os.replace(tmp_path, self._directory / key)  # noqa: PTH105
+
+    def discard(self, key: str) -> None:
+        """Discard a result.
+
+        Parameters:
+            key: The result key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._directory is not None:
+            with contextlib.suppress(OSError):
+                (self._directory / key).unlink()
+
+    def clear(self) -> None:
+        """Discard all results."""
+        with self._lock:
+            self._entries.clear()
+        if self._directory is not None and self._directory.is_dir():
+            for file in self._directory.iterdir():
+                with contextlib.suppress(OSError):
+                    file.unlink()
+
+    def _remember(self, key: str, entry: tuple[float, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_default_cache = ResultCache()
+
+
 class LazyCallable(Generic[_R]):
     """This class allows users to create and pass lazy callables to the runner."""
 
-    def __init__(self, call: Callable[_P, _R], args: Sequence, kwargs: Mapping, name: str | None = None) -> None:
+    __slots__ = ("args", "cache", "call", "kwargs", "name")
+
+    def __init__(
+        self,
+        call: Callable[_P, _R],
+        args: Sequence,
+        kwargs: Mapping,
+        name: str | None = None,
+        cache: ResultCache | None = None,
+    ) -> None:
         """Initialize a lazy callable.
 
         Parameters:
@@ -31,6 +165,7 @@ class LazyCallable(Generic[_R]):
             args: The `*args` to pass when calling.
             kwargs: The `**kwargs` to pass when calling.
             name: The name of the callable.
+            cache: A cache to store the result in, and reuse it on next calls with the same arguments.
         """
         self.call: Callable[_P, _R] = call
         """The original callable."""
@@ -40,17 +175,176 @@ class LazyCallable(Generic[_R]):
         """The `**kwargs` to pass when calling."""
         self.name: str | None = name
         """The name of the callable, if any."""
+        self.cache: ResultCache | None = cache
+        """The cache storing the result, if any."""
 
     def __call__(self) -> _R:
-        """Call the lazy callable."""
-        return self.call(*self.args, **self.kwargs)
+        """Call the lazy callable, or return its cached result."""
+        if self.cache is None or (key := self.cache_key) is None:
+            return self.call(*self.args, **self.kwargs)
+        found, value = self.cache.lookup(key)
+        if found:
+            return value
+        value = self.call(*self.args, **self.kwargs)
+        if _cacheable(value):
+            self.cache.store(key, value)
+        return value
+
+    @property
+    def cache_key(self) -> str | None:
+        """A stable hash of the callable and its arguments, or none if they cannot be hashed.
+
+        The hash is the same in every process. Only module-level functions
+        (and methods bound to plain objects) can be hashed: lambdas, local functions
+        and other callables (like partials) cannot be told apart reliably.
+        Arguments can be built-in scalars and containers, paths, enumeration members,
+        module-level classes and functions, and plain objects made of those.
+        """
+        try:
+            data = repr(_canonical((self.call, tuple(self.args), dict(self.kwargs))))
+        except (TypeError, RecursionError):
+            return None
+        return hashlib.sha256(data.encode()).hexdigest()
 
+    def cached(self, cache: ResultCache | None = None) -> LazyCallable[_R]:
+        """Return a copy of this lazy callable, caching its result.
 
-def _lazy(call: Callable[_P, _R], name: str | None = None) -> Callable[_P, LazyCallable]:
+        Parameters:
+            cache: The cache to use. Default: a cache shared by all lazy callables, in memory.
+
+        Returns:
+            A lazy callable caching its result.
+        """
+        return LazyCallable(
+            self.call,
+            self.args,
+            self.kwargs,
+            name=self.name,
+            cache=_default_cache if cache is None else cache,
+        )
+
+    def __reduce__(self) -> tuple:
+        # Pickle the callable by reference (module and qualified name), to send it to other processes.
+        # Functions decorated with `lazy` are replaced by their wrapper in their module,
+        # so the original function cannot be pickled directly: we reference the wrapper instead.
+        module = sys.modules.get(getattr(self.call, "__module__", None) or "")
+        qualname = getattr(self.call, "__qualname__", "")
+        target = module
+        for part in qualname.split("."):
+            target = getattr(target, part, None)
+        if target is not None and getattr(target, "__wrapped__", None) is self.call:
+            return (_load_lazy_callable, (module.__name__, qualname, tuple(self.args), dict(self.kwargs), self.name))  # ty: ignore[possibly-missing-attribute]
+        return (LazyCallable, (self.call, tuple(self.args), dict(self.kwargs), self.name))
+
+
+def _reference(obj: Any) -> tuple[str, str]:
+    # A function or class is identified by its qualified name only if this name resolves back to it.
+    module = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", "")
+    if not isinstance(module, str) or "<" in qualname:
+        raise TypeError(f"Cannot reference {obj!r}")
+    target: Any = sys.modules.get(module)
+    for part in qualname.split("."):
+        target = getattr(target, part, None)
+    target = getattr(target, "__func__", target)
+    if target is not obj and getattr(target, "__wrapped__", None) is not obj:
+        raise TypeError(f"Cannot reference {obj!r}")
+    return module, qualname
+
+
+_SCALARS = (type(None), bool, int, float, complex, str, bytes)
+_CONTAINERS = (tuple, list, set, frozenset, dict)
+
+
+def _canonical(value: Any) -> Any:
+    # Encode a value into nested tuples of scalars, whose representation is the same for equal values
+    # in every process. Unlike pickles, it does not depend on the order of items in sets and dictionaries,
+    # which depends on the hash seed of the process. Values that cannot be encoded raise a `TypeError`.
+    kind = type(value)
+    if kind in _SCALARS:
+        return kind.__name__, value
+    if kind in (tuple, list):
+        return kind.__name__, tuple(_canonical(item) for item in value)
+    if kind in (set, frozenset):
+        return kind.__name__, tuple(sorted((_canonical(item) for item in value), key=repr))
+    if kind is dict:
+        return "dict", tuple(sorted(((_canonical(key), _canonical(item)) for key, item in value.items()), key=repr))
+    if inspect.ismethod(value):
+        return "method", _reference(value.__func__), _canonical(value.__self__)
+    if inspect.isfunction(value) or inspect.isclass(value):
+        return "reference", _reference(value)
+    if isinstance(value, enum.Enum):
+        return "enum", _reference(kind), value.name
+    if isinstance(value, PurePath):
+        return "path", _reference(kind), str(value)
+    # Plain objects are encoded with their class and attributes.
+    if (
+        isinstance(value, (*_SCALARS, *_CONTAINERS))
+        or any("__slots__" in vars(base) for base in kind.__mro__)
+        or kind.__reduce_ex__ is not object.__reduce_ex__
+        or kind.__reduce__ is not object.__reduce__
+        or getattr(kind, "__getstate__", None) is not getattr(object, "__getstate__", None)
+    ):
+        raise TypeError(f"Cannot encode {value!r}")
+    return "object", _reference(kind), _canonical(vars(value))
+
+
+def _cacheable(value: Any) -> bool:
+    # Coroutines and generators can only be consumed once: don't cache them.
+    return not (inspect.isawaitable(value) or inspect.isgenerator(value) or inspect.isasyncgen(value))
+
+
+def _load_lazy_callable(module: str, qualname: str, args: Sequence, kwargs: Mapping, name: str | None) -> LazyCallable:
+    target = importlib.import_module(module)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return LazyCallable(target.__wrapped__, args, kwargs, name=name)
+
+
+class LazyBatch:
+    """A batch of lazy callables, created with the `map` method of [lazified functions][failprint.lazy].
+
+    Run it with [`run_many`][failprint.run_many].
+    """
+
+    __slots__ = ("calls", "jobs", "name")
+
+    def __init__(self, calls: Sequence[LazyCallable], *, jobs: int | None = None, name: str | None = None) -> None:
+        """Initialize the batch.
+
+        Parameters:
+            calls: The lazy callables to run.
+            jobs: The number of threads to run them in. Default: one, in the current thread.
+            name: The name of the batch.
+        """
+        self.calls: Sequence[LazyCallable] = calls
+        """The lazy callables to run."""
+        self.jobs: int | None = jobs
+        """The number of threads to run them in."""
+        self.name: str | None = name
+        """The name of the batch, if any."""
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def __iter__(self) -> Iterator[LazyCallable]:
+        return iter(self.calls)
+
+
+def _lazy(
+    call: Callable[_P, _R],
+    name: str | None = None,
+    cache: ResultCache | None = None,
+) -> Callable[_P, LazyCallable]:
     @wraps(call)
     def lazy_caller(*args: _P.args, **kwargs: _P.kwargs) -> LazyCallable:
-        return LazyCallable(call, args, kwargs, name=name)
+        return LazyCallable(call, args, kwargs, name=name, cache=cache)
+
+    def lazy_map(iterable: Iterable, *, jobs: int | None = None) -> LazyBatch:
+        calls = [LazyCallable(call, (item,), {}, name=name, cache=cache) for item in iterable]
+        return LazyBatch(calls, jobs=jobs, name=name or getattr(call, "__name__", None))
 
+    lazy_caller.map = lazy_map  # ty: ignore[unresolved-attribute]
     return lazy_caller
 
 
@@ -59,14 +353,29 @@ _DecoratorType = Callable[[_FunctionType], Callable[_P, LazyCallable]]
 
 
 @overload
-def lazy(call: Callable[_P, _R], name: str | None = None) -> Callable[_P, LazyCallable]: ...  # pragma: no cover
+def lazy(
+    call: Callable[_P, _R],
+    name: str | None = None,
+    *,
+    cache: bool | ResultCache = False,
+) -> Callable[_P, LazyCallable]: ...  # pragma: no cover
 
 
 @overload
-def lazy(call: None = None, name: str | None = None) -> _DecoratorType: ...  # pragma: no cover
-
-
-def lazy(call: Callable[_P, _R] | None = None, name: str | None = None) -> Callable[_P, LazyCallable] | _DecoratorType:
+def lazy(
+    call: None = None,
+    name: str | None = None,
+    *,
+    cache: bool | ResultCache = False,
+) -> _DecoratorType: ...  # pragma: no cover
+
+
+def lazy(
+    call: Callable[_P, _R] | None = None,
+    name: str | None = None,
+    *,
+    cache: bool | ResultCache = False,
+) -> Callable[_P, LazyCallable] | _DecoratorType:
     """Transform a callable into a lazy callable.
 
     Being able to create a lazy callable improves the UX/DX.
@@ -99,9 +408,30 @@ def lazy(call: Callable[_P, _R] | None = None, name: str | None = None) -> Calla
     run(greet("tim"))
     ```
 
+    Lazified functions can also be mapped over many arguments,
+    each item being passed as the only positional argument,
+    to run them all as a batch with [`run_many`][failprint.run_many]:
+
+    ```python
+    from failprint import lazy, run_many
+
+
+    @lazy
+    def check_file(path): ...
+
+
+    run_many(check_file.map(paths, jobs=8), title="Checking files")
+    ```
+
+    Results can be cached, to avoid running the same checks again and again:
+    lazy callables created with the same arguments then reuse the result of the first one,
+    and [`run`][failprint.run] reports them as cached, without running them.
+
     Parameters:
         call: The callable to lazify.
         name: An optional name to give to the new callable.
+        cache: Whether to cache results (in a cache shared by all lazy callables, in memory),
+            or the cache to use.
 
     Returns:
         A lazy callable instance.
@@ -114,11 +444,13 @@ def lazy(call: Callable[_P, _R] | None = None, name: str | None = None) -> Calla
             stacklevel=2,
         )
 
+    result_cache = _default_cache if cache is True else None if cache is False else cache
+
     if call is None:
 
         def decorator(func: _FunctionType) -> _FunctionType:
-            return _lazy(func, name)
+            return _lazy(func, name, result_cache)
 
         return decorator
 
-    return _lazy(call, name)
+    return _lazy(call, name, result_cache)
@@ -0,0 +1,207 @@
+# Aggregation of run metrics, exported in the Prometheus text format.
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from types import TracebackType
+
+    from failprint._internal.capture import SeparateOutput
+
+_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+_SIZE_BUCKETS = (0, 1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+_sinks: list[MetricsSink] = []
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _output_size(output: int | str | bytes | memoryview | SeparateOutput, output_file: str | None) -> int:
+    # The size can be given directly, when it is cheaper to compute than joining outputs.
+    if isinstance(output, int):
+        return output
+    if output_file is not None:
+        return os.path.getsize(output_file)  # noqa: PTH202
+    if isinstance(output, (str, bytes, memoryview)):
+        return len(output)
+    return sum(len(data) for _, _, data in output.chunks)
+
+
+class MetricsSink:
+    """Aggregate metrics of runs, and write them to a file in the Prometheus text format.
+
+    The file can be collected by the node-exporter textfile collector.
+    It contains, for each title (or command when no title is given):
+
+    - `failprint_runs_total`: a counter of runs, labeled with their result (`success` or `failure`);
+    - `failprint_run_duration_seconds`: a histogram of run durations;
+    - `failprint_output_bytes`: a histogram of captured output sizes (on disk, when written to an output file).
+
+    Examples:
+        >>> MetricsSink("/var/lib/node_exporter/failprint.prom").start()
+        >>> run(["pytest"], title="tests")
+    """
+
+    def __init__(self, path: str | Path, *, interval: float | None = None) -> None:
+        """Initialize the sink.
+
+        Parameters:
+            path: The file to write metrics to. It is replaced atomically on each write.
+            interval: When set, metrics are also written every `interval` seconds,
+                not only when the sink is closed (or when the process exits).
+        """
+        self.path = Path(path)
+        """The file metrics are written to."""
+        self.interval = interval
+        """The number of seconds between writes, if any."""
+        self._runs: dict[tuple[str, str], int] = {}
+        self._durations: dict[str, _Histogram] = {}
+        self._sizes: dict[str, _Histogram] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._timer: threading.Thread | None = None
+
+    def __enter__(self) -> MetricsSink:  # noqa: PYI034 (false-positive)
+        return self.start()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def start(self) -> MetricsSink:
+        """Start recording runs, and write metrics when the process exits.
+
+        Returns:
+            The sink itself.
+        """
+        _sinks.append(self)
+        atexit.register(self.close)
+        if self.interval is not None:
+            self._timer = threading.Thread(target=self._write_periodically, daemon=True)
+            self._timer.start()
+        return self
+
+    def close(self) -> None:
+        """Stop recording runs, and write metrics a last time."""
+        if self not in _sinks:
+            return
+        _sinks.remove(self)
+        atexit.unregister(self.close)
+        self._stop.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.write()
+
+    def record(self, title: str, code: int, duration: float, output_size: int) -> None:
+        """Record a run.
+
+        Parameters:
+            title: The run title, used as label.
+            code: The exit code.
+            duration: The duration of the run, in seconds.
+            output_size: The size of the captured output, in bytes.
+        """
+        result = "success" if code == 0 else "failure"
+        with self._lock:
+            self._runs[title, result] = self._runs.get((title, result), 0) + 1
+            self._durations.setdefault(title, _Histogram(_DURATION_BUCKETS)).observe(duration)
+            self._sizes.setdefault(title, _Histogram(_SIZE_BUCKETS)).observe(output_size)
+
+    def render(self) -> str:
+        """Render metrics in the Prometheus text format.
+
+        Returns:
+            The metrics.
+        """
+        with self._lock:
+            lines = [
+                "# HELP failprint_runs_total Number of runs, by title and result.",
+                "# TYPE failprint_runs_total counter",
+            ]
+            lines.extend(
+                f'failprint_runs_total{{title="{_label(title)}",result="{result}"}} {count}'
+                for (title, result), count in self._runs.items()
+            )
+            lines.append("# HELP failprint_run_duration_seconds Duration of runs, by title.")
+            lines.append("# TYPE failprint_run_duration_seconds histogram")
+            for title, histogram in self._durations.items():
+                lines.extend(histogram.render("failprint_run_duration_seconds", f'title="{_label(title)}"'))
+            lines.append("# HELP failprint_output_bytes Size of captured output, by title.")
+            lines.append("# TYPE failprint_output_bytes histogram")
+            for title, histogram in self._sizes.items():
+                lines.extend(histogram.render("failprint_output_bytes", f'title="{_label(title)}"'))
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Write metrics to the file, atomically.
+
+        Metrics are written to a temporary file in the same directory, then moved over the target file,
+        so that collectors never read a partially written file.
+        """
+        contents = self.render()
+        fd, temp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf8") as file:
+                file.write(contents)
+            os.chmod(temp_path, 0o644)  # noqa: PTH101 (mkstemp creates files readable by their owner only)
+            os.replace(temp_path, self.path)  # noqa: PTH105
+        except BaseException:
+            os.unlink(temp_path)  # noqa: PTH108
+            raise
+
+    def _write_periodically(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+def _record_run(
+    title: str,
+    code: int,
+    duration: float,
+    output: int | str | bytes | memoryview | SeparateOutput,
+    output_file: str | None,
+) -> None:
+    # Recording is skipped entirely when no sink is started.
+    if _sinks:
+        size = _output_size(output, output_file)
+        for sink in _sinks:
+            sink.record(title, code, duration, size)
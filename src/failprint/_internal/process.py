@@ -2,16 +2,37 @@
 
 from __future__ import annotations
 
+import codecs
 import contextlib
+import io
 import os
+import re
+import shlex
+import shutil
+import signal
 import subprocess
 import sys
-from typing import TYPE_CHECKING
+import threading
+import time
+from collections import ChainMap
+from typing import IO, TYPE_CHECKING, Any, Callable
 
-from failprint._internal.capture import Capture
+from failprint._internal.capture import (
+    _READ_SIZE,
+    Capture,
+    SeparateOutput,
+    _decode,
+    _read_streams,
+    _translate_newlines,
+)
 from failprint._internal.formats import printable_command
+from failprint._internal.profiling import profile_phase
+from failprint._internal.sink import _Sink
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from pathlib import Path
+
     from failprint._internal.types import CmdType
 
 
@@ -19,7 +40,342 @@ WINDOWS = sys.platform.startswith("win") or os.name == "nt"
 """A boolean variable indicating whether the current system is Windows."""
 
 if not WINDOWS:
-    from ptyprocess import PtyProcessUnicode
+    import resource
+
+    from ptyprocess import PtyProcess, PtyProcessUnicode
+
+_TERMINATE_GRACE = 1.0
+# Exit code of commands killed for exceeding their CPU time limit, as reported by shells.
+_LIMIT_CODE = 128 + 24
+
+# Characters that never need a shell: anything else (globs, variables, redirections, pipes, etc.) does.
+_SHELL_SYNTAX = re.compile(r"[^\w@%+=:,./'\" \t-]")
+_SHELL_BUILTINS = frozenset(
+    {
+        ".",
+        ":",
+        "alias",
+        "break",
+        "case",
+        "cd",
+        "command",
+        "continue",
+        "eval",
+        "exec",
+        "exit",
+        "export",
+        "for",
+        "function",
+        "if",
+        "readonly",
+        "return",
+        "set",
+        "shift",
+        "source",
+        "times",
+        "trap",
+        "ulimit",
+        "umask",
+        "unset",
+        "until",
+        "wait",
+        "while",
+    },
+)
+
+
+class Limits:
+    """Resource limits of a command.
+
+    On Linux, limits are set on the process right after it is spawned (with `prlimit`),
+    so that spawning stays as fast as without limits: what the command does
+    in its first moments may not be limited yet. On other Unix systems,
+    the command is run through a shell setting the limits (with `ulimit`) before executing it.
+    Limits are not supported on Windows.
+
+    Examples:
+        >>> run("make test", limits=Limits(memory=2 * 1024**3, cpu_seconds=600))
+    """
+
+    __slots__ = ("cpu_seconds", "files", "memory")
+
+    def __init__(self, *, memory: int | None = None, cpu_seconds: int | None = None, files: int | None = None) -> None:
+        """Initialize the limits.
+
+        Parameters:
+            memory: The maximum size of the process virtual memory, in bytes.
+                Allocations beyond it fail: the command then fails on its own terms.
+            cpu_seconds: The maximum CPU time of the process, in seconds.
+                The command is killed when it exceeds it, and reported as such.
+            files: The maximum number of file descriptors the process can open.
+        """
+        self.memory = memory
+        """The maximum size of the process virtual memory, in bytes."""
+        self.cpu_seconds = cpu_seconds
+        """The maximum CPU time of the process, in seconds."""
+        self.files = files
+        """The maximum number of file descriptors the process can open."""
+
+    def __repr__(self) -> str:
+        return f"Limits(memory={self.memory!r}, cpu_seconds={self.cpu_seconds!r}, files={self.files!r})"
+
+
+def _set_limits(pid: int, limits: Limits) -> None:
+    # The CPU hard limit is one second above the soft one, so that the process
+    # first receives SIGXCPU (and is only killed with SIGKILL if it ignores it).
+    if limits.memory is not None:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limits.memory, limits.memory))
+    if limits.cpu_seconds is not None:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+    if limits.files is not None:
+        resource.prlimit(pid, resource.RLIMIT_NOFILE, (limits.files, limits.files))
+
+
+def _limit_command(cmd: CmdType, limits: Limits | None, *, shell: bool) -> tuple[CmdType, bool]:
+    # Without `prlimit`, a shell sets the limits then replaces itself with the command.
+    if limits is None or hasattr(resource, "prlimit"):
+        return cmd, shell
+    settings = []
+    if limits.memory is not None:
+        settings.append(f"ulimit -v {limits.memory // 1024}")
+    if limits.cpu_seconds is not None:
+        settings.append(f"ulimit -Ht {limits.cpu_seconds + 1}; ulimit -St {limits.cpu_seconds}")
+    if limits.files is not None:
+        settings.append(f"ulimit -n {limits.files}")
+    if not settings:
+        return cmd, shell
+    script = "; ".join(settings)
+    if shell:
+        return f"{script}; {cmd}", True
+    return ["/bin/sh", "-c", f'{script}; exec "$@"', "failprint", *cmd], False
+
+
+_IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+
+def _check_scheduling(
+    *,
+    limits: Limits | None,
+    nice: int | None,
+    ionice: int | str | None,
+    cpu_affinity: Iterable[int] | None,
+) -> None:
+    if WINDOWS and (limits is not None or nice or ionice is not None or cpu_affinity is not None):
+        raise ValueError("Resource limits and scheduling options are not supported on Windows")
+    if cpu_affinity is not None and not hasattr(os, "sched_setaffinity"):
+        raise ValueError("CPU affinity is only supported on Linux")
+    if ionice is not None and not sys.platform.startswith("linux"):
+        raise ValueError("I/O scheduling is only supported on Linux")
+
+
+def _ionice_command(cmd: CmdType, ionice: int | str | None, *, shell: bool) -> tuple[CmdType, bool]:
+    # The I/O scheduling class of other processes cannot be set from the standard library:
+    # the `ionice` executable sets it, then replaces itself with the command.
+    if ionice is None:
+        return cmd, shell
+    if isinstance(ionice, int):
+        name, level = "best-effort", str(ionice)
+    else:
+        name, _, level = ionice.partition(":")
+    if name not in _IONICE_CLASSES or (level and not (level.isdigit() and int(level) <= 7)):  # noqa: PLR2004
+        raise ValueError(f"Invalid I/O scheduling {ionice!r}: expected 'idle', 'best-effort[:0-7]' or 'realtime[:0-7]'")
+    args = [_which("ionice") or "ionice", "-c", _IONICE_CLASSES[name]]
+    if level and name != "idle":
+        args.extend(("-n", level))
+    if shell:
+        return [*args, "/bin/sh", "-c", cmd], False  # ty: ignore[invalid-return-type]
+    return [*args, *cmd], False
+
+
+def _configure_process(
+    pid: int,
+    *,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    cpu_affinity: Iterable[int] | None = None,
+) -> None:
+    if limits is not None and hasattr(resource, "prlimit"):
+        _set_limits(pid, limits)
+    if nice:
+        os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, pid) + nice)
+    if cpu_affinity is not None:
+        os.sched_setaffinity(pid, cpu_affinity)
+
+
+class _MeasuredProcess(subprocess.Popen):
+    # Reap the process with `wait4` instead of `waitpid`, to know the CPU time it used
+    # (including the CPU time of the children it waited for, like commands run by a shell).
+    cpu_time: float | None = None
+
+    def _try_wait(self, wait_flags: int) -> tuple[int, int]:
+        try:
+            pid, status, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return super()._try_wait(wait_flags)  # ty: ignore[unresolved-attribute]
+        if pid:
+            self.cpu_time = usage.ru_utime + usage.ru_stime
+        return pid, status
+
+
+def _cpu_time(process: subprocess.Popen) -> float | None:
+    return process.cpu_time if isinstance(process, _MeasuredProcess) else None
+
+
+def _spawn(
+    cmd: CmdType,
+    *,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    cpu_affinity: Iterable[int] | None = None,
+    **kwargs: Any,
+) -> subprocess.Popen:
+    # Limits, priority and affinity are set after spawning, so that `subprocess` keeps
+    # using its fast spawn path (`vfork` or `posix_spawn`), which a `preexec_fn` would disable.
+    measured = limits is not None and limits.cpu_seconds is not None
+    process = (_MeasuredProcess if measured else subprocess.Popen)(cmd, **kwargs)
+    try:
+        _configure_process(process.pid, limits=limits, nice=nice, cpu_affinity=cpu_affinity)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    return process
+
+
+def _check_limits(
+    code: int,
+    output: str | bytes | SeparateOutput,
+    limits: Limits | None,
+    cpu_time: float | None,
+    *,
+    echo: bool,
+) -> tuple[int, str | bytes | SeparateOutput]:
+    # Commands exceeding their CPU time limit are killed with SIGXCPU (or SIGKILL if they ignore it).
+    # Shells report commands killed by a signal with an exit code of 128 plus the signal number.
+    # Only the limit sends SIGXCPU, but SIGKILL is also sent for other reasons (out of memory, `kill -9`):
+    # it is only blamed on the limit when the command used up its CPU time. The hard limit, enforcing SIGKILL,
+    # is one second above the soft one, which leaves a margin for the less precise time measured when reaping
+    # processes (it can lag behind the time the kernel enforces limits with by a fraction, on loaded machines).
+    if limits is None or limits.cpu_seconds is None:
+        return code, output
+    if code not in {-signal.SIGXCPU, 128 + signal.SIGXCPU} and (
+        code not in {-signal.SIGKILL, 128 + signal.SIGKILL} or cpu_time is None or cpu_time < limits.cpu_seconds
+    ):
+        return code, output
+    report = f"failprint: command exceeded its CPU time limit ({limits.cpu_seconds}s), process killed"
+    if isinstance(output, SeparateOutput):
+        output.chunks.append((time.monotonic(), "stderr", f"\n{report}\n".encode()))
+        return _LIMIT_CODE, output
+    return _LIMIT_CODE, _append_report(output, report, echo=echo)
+
+
+class _LineMatcher:
+    # Match a pattern against output, line by line, as it arrives.
+    # Each complete line is searched exactly once: only the current
+    # incomplete line is kept around, waiting for its end.
+
+    def __init__(self, pattern: str | re.Pattern, stream: str = "output") -> None:
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.stream = stream
+        self.match: re.Match | None = None
+        self.lineno = 0
+        self._pending: list[str] = []
+
+    def feed(self, text: str) -> re.Match | None:
+        if "\n" not in text:
+            self._pending.append(text)
+            return None
+        self._pending.append(text)
+        *lines, last = "".join(self._pending).split("\n")
+        self._pending = [last]
+        for line in lines:
+            if self._search(line):
+                return self.match
+        return None
+
+    def close(self) -> re.Match | None:
+        if self.match is None and (rest := "".join(self._pending)):
+            self._search(rest)
+        self._pending = []
+        return self.match
+
+    def report(self) -> str:
+        column = self.match.start() + 1  # ty: ignore[possibly-missing-attribute]
+        return (
+            f"failprint: {self.stream} matched fail-on pattern {self.pattern.pattern!r} "
+            f"at line {self.lineno}, column {column}, process terminated"
+        )
+
+    def _search(self, line: str) -> bool:
+        self.lineno += 1
+        self.match = self.pattern.search(line.rstrip("\r"))
+        return self.match is not None
+
+
+_which_cache: dict[tuple[str, str], tuple[str, float]] = {}
+
+
+def _which(name: str, path: str | None = None) -> str | None:
+    # Like `shutil.which`, with results cached per name and PATH.
+    # A cached executable is only reused while its modification time is unchanged.
+    # Failed lookups are not cached, so newly installed executables are found.
+    path = os.environ.get("PATH", os.defpath) if path is None else path
+    key = (name, path)
+    if (cached := _which_cache.get(key)) is not None:
+        executable, mtime = cached
+        with contextlib.suppress(OSError):
+            if os.stat(executable).st_mtime == mtime:  # noqa: PTH116
+                return executable
+        del _which_cache[key]
+    executable = shutil.which(name, path=path)
+    if executable is not None:
+        with contextlib.suppress(OSError):
+            _which_cache[key] = (executable, os.stat(executable).st_mtime)  # noqa: PTH116
+    return executable
+
+
+def _environment(env: Mapping[str, str] | None, env_overrides: Mapping[str, str] | None) -> Mapping[str, str] | None:
+    # Overrides are layered over the base environment without copying it:
+    # the merged mapping is only iterated once, when spawning the process.
+    if not env_overrides:
+        return env
+    return ChainMap(dict(env_overrides), os.environ if env is None else env)  # ty: ignore[invalid-argument-type]
+
+
+def _split_simple_command(cmd: str, path: str | None = None) -> list[str] | None:
+    # Commands without shell syntax are split and executed directly, sparing a shell process.
+    # Anything the shell could interpret differently is left to the shell.
+    if _SHELL_SYNTAX.search(cmd):
+        return None
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    if not argv or "=" in argv[0] or argv[0] in _SHELL_BUILTINS or _which(argv[0], path) is None:
+        return None
+    return argv
+
+
+def _terminate_process_group(pid: int, is_alive: Callable[[], bool]) -> None:
+    # Processes spawned for fail-on matching lead their own process group,
+    # so that we can terminate everything they spawned as well.
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(pid, signal.SIGTERM)
+        deadline = time.monotonic() + _TERMINATE_GRACE
+        while is_alive() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if is_alive():
+            os.killpg(pid, signal.SIGKILL)
+
+
+def _text_decoder(errors: str) -> io.IncrementalNewlineDecoder:
+    # Decode UTF-8 incrementally, with universal newlines, like `subprocess` does in text mode.
+    return io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf8")(errors), translate=True)
+
+
+def _feed_stdin(pipe: IO[bytes], stdin: str) -> None:
+    with contextlib.suppress(BrokenPipeError), pipe:
+        pipe.write(stdin.encode("utf8"))
 
 
 def run_subprocess(
@@ -28,7 +384,17 @@ def run_subprocess(
     capture: Capture = Capture.BOTH,
     shell: bool = False,
     stdin: str | None = None,
-) -> tuple[int, str]:
+    fail_on: str | re.Pattern | None = None,
+    binary: bool = False,
+    output_file: str | Path | None = None,
+    cwd: str | Path | None = None,
+    env: Mapping[str, str] | None = None,
+    env_overrides: Mapping[str, str] | None = None,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    ionice: int | str | None = None,
+    cpu_affinity: Iterable[int] | None = None,
+) -> tuple[int, str | bytes]:
     """Run a command in a subprocess.
 
     Arguments:
@@ -36,10 +402,100 @@ def run_subprocess(
         capture: The output to capture.
         shell: Whether to run the command in a shell.
         stdin: String to use as standard input.
+        fail_on: A regular expression searched in each line of output, as it is produced.
+            When it matches, the process (and its process group) is terminated,
+            and the match location is appended to the output.
+        binary: Whether to return the output as raw bytes instead of decoding it.
+            Newlines are still normalized.
+        output_file: A file to write the captured output to, instead of keeping it in memory.
+            It is compressed on the fly if its name ends with `.gz` (or `.zst`, with Python 3.14+).
+            Only the last lines of output are then returned.
+        cwd: The working directory of the command. Default: the current working directory.
+        env: The environment of the command. Default: the current environment.
+        env_overrides: Environment variables to set on top of `env` (or the current environment).
+        limits: Resource limits of the command. Commands exceeding their CPU time limit
+            are reported with exit code 152, like shells do.
+        nice: A niceness increment for the command (positive values lower its priority).
+        ionice: The I/O scheduling class of the command (Linux only): a best-effort priority level
+            from 0 (highest) to 7 (lowest), or `idle`, `best-effort:LEVEL` or `realtime:LEVEL`.
+            It is set with the `ionice` executable, which must be installed.
+        cpu_affinity: The CPUs the command can run on (Linux only).
+
+    Raises:
+        ValueError: When trying to write separately captured output to a file,
+            or to use resource limits or scheduling options not supported by the system.
 
     Returns:
         The exit code and the command raw output.
+            With `Capture.SEPARATE`, the output is a [`SeparateOutput`][failprint.SeparateOutput] instance.
     """
+    _check_scheduling(limits=limits, nice=nice, ionice=ionice, cpu_affinity=cpu_affinity)
+    if shell and not isinstance(cmd, str):
+        cmd = printable_command(cmd)
+    cmd, shell = _limit_command(cmd, limits, shell=shell)
+    cmd, shell = _ionice_command(cmd, ionice, shell=shell)
+    code, output, cpu_time = _run_subprocess(
+        cmd,
+        shell=shell,
+        capture=capture,
+        stdin=stdin,
+        fail_on=fail_on,
+        binary=binary,
+        output_file=output_file,
+        spawn_options={
+            "cwd": cwd,
+            "env": _environment(env, env_overrides),
+            "limits": limits,
+            "nice": nice,
+            "cpu_affinity": cpu_affinity,
+        },
+    )
+    return _check_limits(code, output, limits, cpu_time, echo=capture == Capture.NONE)  # ty: ignore[invalid-return-type]
+
+
+def _run_subprocess(
+    cmd: CmdType,
+    *,
+    shell: bool,
+    capture: Capture,
+    stdin: str | None,
+    fail_on: str | re.Pattern | None,
+    binary: bool,
+    output_file: str | Path | None,
+    spawn_options: dict[str, Any],
+) -> tuple[int, str | bytes | SeparateOutput, float | None]:
+    # Also return the CPU time used by the command, when measured (see `_MeasuredProcess`).
+    spawn_options = {"shell": shell, **spawn_options}
+
+    if capture == Capture.SEPARATE:
+        if output_file is not None:
+            raise ValueError("Cannot write separately captured output to a single file")
+        return _run_subprocess_separately(cmd, stdin=stdin, fail_on=fail_on, spawn_options=spawn_options)
+
+    sink = None if output_file is None or capture == Capture.NONE else _Sink(output_file)
+    matcher = None if fail_on is None else _LineMatcher(fail_on)
+
+    if matcher is not None or (sink is not None and sink.compressed):
+        return _run_subprocess_streaming(
+            cmd,
+            capture=capture,
+            stdin=stdin,
+            binary=binary,
+            matcher=matcher,
+            sink=sink,
+            spawn_options=spawn_options,
+        )
+
+    if sink is not None:
+        return _run_subprocess_to_file(
+            cmd,
+            sink,
+            capture=capture,
+            stdin=stdin,
+            binary=binary,
+            spawn_options=spawn_options,
+        )
+
     if capture == Capture.NONE:
         stdout_opt = None
         stderr_opt = None
@@ -47,28 +503,216 @@ def run_subprocess(
         stdout_opt = subprocess.PIPE
         stderr_opt = subprocess.STDOUT if capture == Capture.BOTH else subprocess.PIPE
 
-    if shell and not isinstance(cmd, str):
-        cmd = printable_command(cmd)
-
-    process = subprocess.run(  # noqa: S603
-        cmd,
-        input=stdin,
-        stdout=stdout_opt,
-        stderr=stderr_opt,
-        shell=shell,
-        text=True,
-        encoding="utf8",
-        check=False,
-    )
+    if binary:
+        process = _run_process(
+            cmd,
+            input=None if stdin is None else stdin.encode("utf8"),
+            stdout=stdout_opt,
+            stderr=stderr_opt,
+            **spawn_options,
+        )
+    else:
+        process = _run_process(
+            cmd,
+            input=stdin,
+            stdout=stdout_opt,
+            stderr=stderr_opt,
+            **spawn_options,
+            text=True,
+            encoding="utf8",
+        )
 
     if capture == Capture.NONE:
-        output = ""
+        output = b"" if binary else ""
     elif capture == Capture.STDERR:
         output = process.stderr
     else:
         output = process.stdout
 
-    return process.returncode, output
+    if binary:
+        output = _translate_newlines(output)
+    return process.returncode, output, process.cpu_time
+
+
+class _CompletedProcess(subprocess.CompletedProcess):
+    # Also hold the CPU time used by the process, when measured.
+    def __init__(self, args: Any, returncode: int, stdout: Any, stderr: Any, cpu_time: float | None) -> None:
+        super().__init__(args, returncode, stdout, stderr)
+        self.cpu_time = cpu_time
+
+
+def _run_process(cmd: CmdType, *, input: str | bytes | None, **kwargs: Any) -> _CompletedProcess:  # noqa: A002
+    # Like `subprocess.run`, timing the spawn and the capture separately.
+    with profile_phase("spawn"):
+        process = _spawn(cmd, stdin=None if input is None else subprocess.PIPE, **kwargs)
+    with process, profile_phase("capture"):
+        try:
+            stdout, stderr = process.communicate(input)
+        except BaseException:
+            process.kill()
+            raise
+    return _CompletedProcess(process.args, process.returncode, stdout, stderr, _cpu_time(process))
+
+
+def _run_subprocess_to_file(
+    cmd: CmdType,
+    sink: _Sink,
+    *,
+    capture: Capture,
+    stdin: str | None,
+    binary: bool,
+    spawn_options: dict[str, Any],
+) -> tuple[int, str | bytes, float | None]:
+    # The process writes directly into the file: output never goes through Python.
+    if capture == Capture.STDERR:
+        stdout_opt, stderr_opt = subprocess.DEVNULL, sink.file
+    elif capture == Capture.STDOUT:
+        stdout_opt, stderr_opt = sink.file, subprocess.DEVNULL
+    else:
+        stdout_opt, stderr_opt = sink.file, subprocess.STDOUT
+
+    try:
+        process = _run_process(
+            cmd,
+            input=None if stdin is None else stdin.encode("utf8"),
+            stdout=stdout_opt,
+            stderr=stderr_opt,
+            **spawn_options,
+        )
+    finally:
+        output = _sink_output(sink, binary=binary)
+    return process.returncode, output, process.cpu_time
+
+
+def _sink_output(sink: _Sink, *, binary: bool) -> str | bytes:
+    tail = _translate_newlines(sink.close())
+    return tail if binary else _decode(tail)
+
+
+def _run_subprocess_streaming(
+    cmd: CmdType,
+    *,
+    capture: Capture,
+    stdin: str | None,
+    binary: bool,
+    matcher: _LineMatcher | None,
+    sink: _Sink | None,
+    spawn_options: dict[str, Any],
+) -> tuple[int, str | bytes, float | None]:
+    # Output must be read to be matched: when not capturing,
+    # we read both streams combined and echo them as they arrive.
+    stdout_opt = subprocess.DEVNULL if capture == Capture.STDERR else subprocess.PIPE
+    if capture == Capture.STDOUT:
+        stderr_opt = subprocess.DEVNULL
+    elif capture == Capture.STDERR:
+        stderr_opt = subprocess.PIPE
+    else:
+        stderr_opt = subprocess.STDOUT
+
+    with profile_phase("spawn"):
+        process = _spawn(
+            cmd,
+            stdin=None if stdin is None else subprocess.PIPE,
+            stdout=stdout_opt,
+            stderr=stderr_opt,
+            start_new_session=matcher is not None and not WINDOWS,
+            **spawn_options,
+        )
+    if stdin is not None:
+        threading.Thread(target=_feed_stdin, args=(process.stdin, stdin), daemon=True).start()
+
+    pipe: IO[bytes] = process.stderr if capture == Capture.STDERR else process.stdout  # ty: ignore[invalid-assignment]
+    # only decode output when it must be matched, echoed or returned as text
+    decoder = None
+    if matcher is not None or capture == Capture.NONE or not (binary or sink):
+        decoder = _text_decoder("replace" if binary or sink else "strict")
+    chunks: list = []
+    text = ""
+
+    with pipe, profile_phase("capture"):
+        while True:
+            data = pipe.read1(_READ_SIZE)  # ty: ignore[unresolved-attribute]
+            if decoder is not None:
+                text = decoder.decode(data, final=not data)
+            if capture == Capture.NONE:
+                print(text, end="", flush=True)  # noqa: T201
+            elif sink is not None:
+                sink.write(data)
+            else:
+                chunks.append(data if binary else text)
+            if (matcher is not None and matcher.feed(text)) or not data:
+                break
+
+        if matcher is not None and matcher.close() is not None:
+            if WINDOWS:
+                process.terminate()
+            else:
+                _terminate_process_group(process.pid, lambda: process.poll() is None)
+
+    code = process.wait()
+    if sink is not None:
+        output = _sink_output(sink, binary=binary)
+    else:
+        output = _translate_newlines(b"".join(chunks)) if binary else "".join(chunks)
+    if matcher is None or matcher.match is None:
+        return code, output, _cpu_time(process)
+    return code or 1, _append_report(output, matcher.report(), echo=capture == Capture.NONE), _cpu_time(process)
+
+
+def _run_subprocess_separately(
+    cmd: CmdType,
+    *,
+    stdin: str | None,
+    fail_on: str | re.Pattern | None,
+    spawn_options: dict[str, Any],
+) -> tuple[int, SeparateOutput, float | None]:
+    with profile_phase("spawn"):
+        process = _spawn(
+            cmd,
+            stdin=None if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=fail_on is not None and not WINDOWS,
+            **spawn_options,
+        )
+    if stdin is not None:
+        threading.Thread(target=_feed_stdin, args=(process.stdin, stdin), daemon=True).start()
+
+    output = SeparateOutput()
+    matchers: dict[str, _LineMatcher] = {}
+    decoders: dict[str, io.IncrementalNewlineDecoder] = {}
+    if fail_on is not None:
+        for name in ("stdout", "stderr"):
+            matchers[name] = _LineMatcher(fail_on, stream=name)
+            decoders[name] = _text_decoder("replace")
+
+    def match(name: str, data: bytes) -> bool:
+        return matchers[name].feed(decoders[name].decode(data)) is not None
+
+    streams = {process.stdout.fileno(): "stdout", process.stderr.fileno(): "stderr"}  # ty: ignore[possibly-missing-attribute]
+    with process.stdout, process.stderr, profile_phase("capture"):  # ty: ignore[invalid-context-manager]
+        _read_streams(streams, output.chunks, match if matchers else None)
+        matched = next((matcher for matcher in matchers.values() if matcher.close() is not None), None)
+        if matched is not None:
+            if WINDOWS:
+                process.terminate()
+            else:
+                _terminate_process_group(process.pid, lambda: process.poll() is None)
+
+    code = process.wait()
+    if matched is None:
+        return code, output, _cpu_time(process)
+    output.chunks.append((time.monotonic(), "stderr", f"\n{matched.report()}\n".encode()))
+    return code or 1, output, _cpu_time(process)
+
+
+def _append_report(output: str | bytes, report: str, *, echo: bool) -> str | bytes:
+    if echo:
+        print(f"\n{report}", flush=True)  # noqa: T201
+        return output
+    if isinstance(output, bytes):
+        return output.rstrip(b"\n") + f"\n{report}\n".encode()
+    return output.rstrip("\n") + f"\n{report}\n"
 
 
 def run_pty_subprocess(
@@ -76,41 +720,125 @@ def run_pty_subprocess(
     *,
     capture: Capture = Capture.BOTH,
     stdin: str | None = None,
-) -> tuple[int, str]:
+    fail_on: str | re.Pattern | None = None,
+    binary: bool = False,
+    output_file: str | Path | None = None,
+    cwd: str | Path | None = None,
+    env: Mapping[str, str] | None = None,
+    env_overrides: Mapping[str, str] | None = None,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    ionice: int | str | None = None,
+    cpu_affinity: Iterable[int] | None = None,
+) -> tuple[int, str | bytes]:
     """Run a command in a PTY subprocess.
 
     Arguments:
         cmd: The command to run.
         capture: The output to capture.
         stdin: String to use as standard input.
+        fail_on: A regular expression searched in each line of output, as it is produced.
+            When it matches, the process (and its process group) is terminated,
+            and the match location is appended to the output.
+        binary: Whether to return the output as raw bytes instead of decoding it.
+            Newlines are still normalized.
+        output_file: A file to write the captured output to, instead of keeping it in memory.
+            It is compressed on the fly if its name ends with `.gz` (or `.zst`, with Python 3.14+).
+            Only the last lines of output are then returned.
+        cwd: The working directory of the command. Default: the current working directory.
+        env: The environment of the command. Default: the current environment.
+        env_overrides: Environment variables to set on top of `env` (or the current environment).
+        limits: Resource limits of the command. Commands exceeding their CPU time limit
+            are reported with exit code 152, like shells do.
+        nice: A niceness increment for the command (positive values lower its priority).
+        ionice: The I/O scheduling class of the command (Linux only): a best-effort priority level
+            from 0 (highest) to 7 (lowest), or `idle`, `best-effort:LEVEL` or `realtime:LEVEL`.
+            It is set with the `ionice` executable, which must be installed.
+        cpu_affinity: The CPUs the command can run on (Linux only).
+
+    Raises:
+        ValueError: When trying to use scheduling options not supported by the system.
 
     Returns:
         The exit code and the command output.
     """
-    process = PtyProcessUnicode.spawn(cmd)
+    _check_scheduling(limits=limits, nice=nice, ionice=ionice, cpu_affinity=cpu_affinity)
+    environment = _environment(env, env_overrides)
+    if environment is not None and "PATH" in environment:
+        # the PTY library only searches executables in the current PATH
+        cmd = [_which(cmd[0], environment["PATH"]) or cmd[0], *cmd[1:]]
+    cmd = _limit_command(cmd, limits, shell=False)[0]  # ty: ignore[invalid-assignment]
+    cmd = _ionice_command(cmd, ionice, shell=False)[0]  # ty: ignore[invalid-assignment]
+    sink = None if output_file is None or capture == Capture.NONE else _Sink(output_file)
+    raw = binary or sink is not None
+    with profile_phase("spawn"):
+        process = (PtyProcess if raw else PtyProcessUnicode).spawn(cmd, cwd=cwd, env=environment)
+        try:
+            _configure_process(process.pid, limits=limits, nice=nice, cpu_affinity=cpu_affinity)
+        except BaseException:
+            process.terminate(force=True)
+            raise
     process.delayafterclose = 0.01  # default to 0.1
     process.delayafterterminate = 0.01  # default to 0.1
-    pty_output: list[str] = []
+    pty_output: list = []
+    matcher = None if fail_on is None else _LineMatcher(fail_on)
+    # when reading bytes, we only decode when we need text: to echo or match output
+    decoder = codecs.getincrementaldecoder("utf8")("replace") if raw else None
 
     if stdin is not None:
         process.setecho(state=False)
         process.waitnoecho()
-        process.write(stdin)
+        process.write(stdin.encode("utf8") if raw else stdin)
         process.sendeof()
         # not sure why but sending only one eof is not always enough,
         # so we send a second one and ignore any IO error
         with contextlib.suppress(OSError):
             process.sendeof()
 
-    while True:
-        try:
-            output_data = process.read()
-        except EOFError:
-            break
-        if capture == Capture.NONE:
-            print(output_data, end="", flush=True)  # noqa: T201
-        else:
-            pty_output.append(output_data)
-
-    output = "".join(pty_output).replace("\r\n", "\n")
-    return process.wait(), output
+    with profile_phase("capture"):
+        while True:
+            try:
+                output_data = process.read()
+            except EOFError:
+                break
+            if decoder is None:
+                text = output_data
+            elif capture == Capture.NONE or matcher is not None:
+                text = decoder.decode(output_data)
+            if capture == Capture.NONE:
+                print(text, end="", flush=True)  # noqa: T201
+            elif sink is not None:
+                sink.write(output_data)
+            else:
+                pty_output.append(output_data)
+            if matcher is not None and matcher.feed(text):
+                # the PTY child is a session leader, so its PID is also its process group ID
+                _terminate_process_group(process.pid, process.isalive)
+                break
+
+    if sink is not None:
+        output = _sink_output(sink, binary=binary)
+    elif binary:
+        output = b"".join(pty_output).replace(b"\r\n", b"\n")
+    else:
+        output = "".join(pty_output).replace("\r\n", "\n")
+    cpu_time = None
+    if limits is not None and limits.cpu_seconds is not None and not process.terminated:
+        # reap the process ourselves to know the CPU time it used (see `_MeasuredProcess`)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.terminated = True
+        code = os.waitstatus_to_exitcode(status)
+        cpu_time = usage.ru_utime + usage.ru_stime
+    else:
+        code = process.wait()
+    if matcher is None or matcher.close() is None:
+        if limits is None:
+            return code, output
+        # terminated by a signal: report it like the subprocess module does
+        code = -process.signalstatus if code is None else code
+        return _check_limits(code, output, limits, cpu_time, echo=capture == Capture.NONE)  # ty: ignore[invalid-return-type]
+
+    process.close()
+    # terminated by a signal: report it like the subprocess module does
+    code = -process.signalstatus if code is None else code
+    return code or 1, _append_report(output, matcher.report(), echo=capture == Capture.NONE)
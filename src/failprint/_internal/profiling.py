@@ -0,0 +1,154 @@
+# Instrumentation of the different phases of a run.
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import AbstractContextManager, nullcontext
+from typing import TYPE_CHECKING, Callable, TextIO
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from types import TracebackType
+
+ProfilingCallback = Callable[[str, float, float], None]
+"""Type for profiling callbacks: they receive a phase name, its start time and end time (`time.perf_counter`)."""
+
+_callbacks: list[ProfilingCallback] = []
+_disabled = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("_name", "_start")
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        end = time.perf_counter()
+        for callback in _callbacks:
+            callback(self._name, self._start, end)
+
+
+def profile_phase(name: str) -> AbstractContextManager:
+    """Time a phase of a run, and report it to profiling callbacks.
+
+    When no callback is registered, a shared no-op context manager is returned,
+    so that instrumentation costs close to nothing.
+
+    Parameters:
+        name: The name of the phase.
+
+    Returns:
+        A context manager timing the phase.
+    """
+    if not _callbacks:
+        return _disabled
+    return _Phase(name)
+
+
+def add_profiling_callback(callback: ProfilingCallback) -> None:
+    """Register a callback, called each time a phase ends.
+
+    Parameters:
+        callback: A callable accepting a phase name, its start time and end time.
+    """
+    _callbacks.append(callback)
+
+
+def remove_profiling_callback(callback: ProfilingCallback) -> None:
+    """Unregister a profiling callback.
+
+    Parameters:
+        callback: A previously registered callback.
+    """
+    _callbacks.remove(callback)
+
+
+class Profiler:
+    """Collect timings of run phases while active.
+
+    Examples:
+        >>> with Profiler() as profiler:
+        ...     run(["true"])
+        >>> profiler.print_summary()
+    """
+
+    def __init__(self) -> None:
+        """Initialize the profiler."""
+        self.events: list[tuple[str, float, float, int]] = []
+        """Collected events: phase name, start time, end time, and thread identifier."""
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, start: float, end: float) -> None:
+        with self._lock:
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def __enter__(self) -> Profiler:  # noqa: PYI034 (false-positive)
+        add_profiling_callback(self)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        remove_profiling_callback(self)
+
+    def summary(self) -> dict[str, tuple[int, float]]:
+        """Aggregate events per phase.
+
+        Returns:
+            A dictionary mapping phase names to their number of occurrences and total duration, in seconds.
+        """
+        totals: dict[str, tuple[int, float]] = {}
+        for name, start, end, _ in self.events:
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + 1, total + end - start)
+        return totals
+
+    def print_summary(self, file: TextIO | None = None) -> None:
+        """Print a per-phase breakdown.
+
+        Parameters:
+            file: Where to print. Default: standard output.
+        """
+        lines = [f"{'phase':<16}{'count':>8}{'total (ms)':>14}"]
+        lines.extend(f"{name:<16}{count:>8}{total * 1000:>14.3f}" for name, (count, total) in self.summary().items())
+        print("\n".join(lines), file=file)
+
+    def write_trace(self, path: str | Path) -> None:
+        """Write events as a Chrome trace file, readable by `chrome://tracing` or Perfetto.
+
+        Parameters:
+            path: The file to write.
+        """
+        pid = os.getpid()
+        trace = {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start * 1_000_000,
+                    "dur": (end - start) * 1_000_000,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, start, end, tid in self.events
+            ],
+        }
+        with open(path, "w", encoding="utf8") as file:  # noqa: PTH123
+            json.dump(trace, file)
@@ -2,34 +2,73 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import errno
+import inspect
+import multiprocessing
 import os
-import shutil
+import pickle
+import shlex
+import signal
 import sys
-import textwrap
+import tempfile
+import threading
+import time
 import traceback
-from functools import cache
-from typing import TYPE_CHECKING, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cache, partial
+from io import StringIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, TextIO
 
 import colorama
-from ansimarkup import parse
-from jinja2 import Environment
 
-from failprint._internal.capture import Capture
+from failprint._internal.capture import (
+    Capture,
+    CaptureManager,
+    SeparateOutput,
+    _decode,
+    _task_streams,
+    _TaskCapture,
+    _translate_newlines,
+)
+from failprint._internal.compact import compact_output
 from failprint._internal.formats import (
     _DEFAULT_FORMAT,
+    Format,
+    RawOutput,
+    _load_format,
+    _markup,
+    _output_text,
     accept_custom_format,
-    escape,
     formats,
     printable_command,
-    unescape,
 )
-from failprint._internal.lazy import LazyCallable
-from failprint._internal.process import WINDOWS, run_pty_subprocess, run_subprocess
+from failprint._internal.lazy import LazyBatch, LazyCallable
+from failprint._internal.metrics import _record_run
+from failprint._internal.process import (
+    WINDOWS,
+    Limits,
+    _environment,
+    _split_simple_command,
+    _which,
+    run_pty_subprocess,
+    run_subprocess,
+)
+from failprint._internal.profiling import profile_phase
+from failprint._internal.sink import _Sink
+from failprint._internal.spool import SpooledOutput
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    import re
+    from collections.abc import AsyncGenerator, Awaitable, Coroutine, Generator, Iterable, Mapping, Sequence
+    from multiprocessing.connection import Connection
+    from types import FrameType
 
+    from failprint._internal.spool import Spool
     from failprint._internal.types import CmdFuncType, CmdType
+    from failprint._internal.workers import WorkerPool
 
 if WINDOWS:
     colorama.init()
@@ -38,17 +77,136 @@ if WINDOWS:
 class RunResult:
     """Placeholder for a run result."""
 
-    def __init__(self, code: int, output: str) -> None:
+    __slots__ = ("_output", "_separate", "cached", "code", "output_file", "timed_out")
+
+    def __init__(
+        self,
+        code: int,
+        output: str | bytes | memoryview | SeparateOutput,
+        *,
+        output_file: str | None = None,
+        timed_out: bool = False,
+        cached: bool = False,
+    ) -> None:
         """Initialize the object.
 
         Arguments:
             code: The exit code of the command.
-            output: The output of the command.
+            output: The output of the command, as text, raw bytes,
+                or standard output and error captured separately.
+            output_file: The file the output was written to, if any.
+            timed_out: Whether the command was stopped because it timed out.
+            cached: Whether the result was taken from a cache, without running the command.
         """
         self.code = code
         """The exit code of the command."""
-        self.output = output
-        """The output of the command."""
+        self.output_file = output_file
+        """The file the output was written to, if any. In that case, `output` only contains its last lines."""
+        self.timed_out = timed_out
+        """Whether the command was stopped because it timed out. Its output is then the output produced until then."""
+        self.cached = cached
+        """Whether the result was taken from a [lazy callable][failprint.lazy] cache. Its output is then empty."""
+        self._separate = output if isinstance(output, SeparateOutput) else None
+        self._output = output
+
+    @property
+    def output(self) -> str:
+        """The output of the command, decoded on first access.
+
+        When standard output and error were captured separately, they are interleaved.
+        """
+        if self._separate is not None:
+            return self._separate.interleaved
+        if not isinstance(self._output, str):
+            self._output = _decode(self._output)  # ty: ignore[invalid-argument-type]
+        return self._output
+
+    @property
+    def raw_output(self) -> bytes:
+        """The output of the command, as raw bytes."""
+        if self._separate is not None:
+            return self._separate._raw()
+        if isinstance(self._output, str):
+            return self._output.encode("utf8")
+        return bytes(self._output)  # ty: ignore[invalid-argument-type]
+
+    @property
+    def stdout(self) -> str | None:
+        """The standard output of the command, if it was captured separately."""
+        return None if self._separate is None else self._separate.stdout
+
+    @property
+    def stderr(self) -> str | None:
+        """The standard error of the command, if it was captured separately."""
+        return None if self._separate is None else self._separate.stderr
+
+    def compact(self, spool: Spool | None = None) -> CompactRunResult:
+        """Return a compact copy of this result, to keep in memory.
+
+        Parameters:
+            spool: A spool to store the output in. The result then only references it.
+
+        Returns:
+            A result storing output as raw bytes only, or as a reference into the spool.
+        """
+        raw_output = self.raw_output
+        output = raw_output if spool is None else spool.append(raw_output)
+        return CompactRunResult(
+            self.code,
+            output,
+            output_file=self.output_file,
+            timed_out=self.timed_out,
+            cached=self.cached,
+        )
+
+
+class CompactRunResult(RunResult):
+    """A run result storing its output as raw bytes only, or as a reference into a spool.
+
+    Decoded output is not kept in memory, and separately captured streams are only kept interleaved.
+    Use it to keep many results around, for reporting.
+    """
+
+    __slots__ = ()
+
+    def __init__(
+        self,
+        code: int,
+        output: bytes | SpooledOutput,
+        *,
+        output_file: str | None = None,
+        timed_out: bool = False,
+        cached: bool = False,
+    ) -> None:
+        """Initialize the object.
+
+        Arguments:
+            code: The exit code of the command.
+            output: The raw output of the command, or a reference to it in a spool.
+            output_file: The file the output was written to, if any.
+            timed_out: Whether the command was stopped because it timed out.
+            cached: Whether the result was taken from a cache, without running the command.
+        """
+        super().__init__(code, output, output_file=output_file, timed_out=timed_out, cached=cached)  # ty: ignore[invalid-argument-type]
+
+    @property
+    def output(self) -> str:
+        """The output of the command, decoded on each access."""
+        output = self._output
+        return _decode(output.view() if isinstance(output, SpooledOutput) else output)  # ty: ignore[invalid-argument-type]
+
+    def compact(self, spool: Spool | None = None) -> CompactRunResult:
+        """Return this result, already compact.
+
+        Parameters:
+            spool: A spool to store the output in, if it is not already in one.
+
+        Returns:
+            This result, or a copy referencing the spool.
+        """
+        if spool is None or isinstance(self._output, SpooledOutput):
+            return self
+        return super().compact(spool)
 
 
 def run(
@@ -67,6 +225,20 @@ def run(
     silent: bool = False,
     stdin: str | None = None,
     command: str | None = None,
+    fail_on: str | re.Pattern | None = None,
+    compact: bool = False,
+    output_file: str | Path | None = None,
+    shell: bool | None = None,
+    pool: WorkerPool | None = None,
+    spool: Spool | None = None,
+    cwd: str | Path | None = None,
+    env: Mapping[str, str] | None = None,
+    env_overrides: Mapping[str, str] | None = None,
+    timeout: float | None = None,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    ionice: int | str | None = None,
+    cpu_affinity: Iterable[int] | None = None,
 ) -> RunResult:
     """Run a command in a subprocess or a Python function, and print its output if it fails.
 
@@ -85,51 +257,543 @@ def run(
         silent: Don't print anything.
         stdin: String to use as standard input.
         command: The command to display.
+        fail_on: A regular expression matched against each line of the command output, as it is produced.
+            When it matches, the command is terminated early and reported as failed.
+            Ignored when running Python callables.
+        compact: Whether to compact the output before printing it:
+            collapse repeated lines, keep only the last frame of lines overwritten with carriage returns,
+            and strip ANSI sequences if the format does not accept them.
+        output_file: A file to write the captured output to, instead of keeping it in memory.
+            It is compressed on the fly if its name ends with `.gz` (or `.zst`, with Python 3.14+).
+            Templates then only get the last lines of output.
+        shell: Whether to run the command in a shell. By default, only strings using shell syntax
+            (or shell builtins) are run in a shell: other strings are split and executed directly,
+            which is faster. Pass true to always use a shell, or false to never use one.
+            Ignored when running Python callables.
+        pool: A pool of worker processes to run Python callables in, instead of the current process.
+            Ignored when running commands.
+        spool: A spool to append the output to. A compact result referencing it is then returned.
+        cwd: The working directory of the command. Default: the current working directory.
+        env: The environment of the command. Default: the current environment.
+        env_overrides: Environment variables to set on top of `env` (or the current environment).
+            Python callables run in the current process: to run them
+            with a different working directory or environment, run them in a `pool`.
+        timeout: The maximum duration of Python callables, in seconds. See [`run_function`][failprint.run_function].
+            Ignored when running commands.
+        limits: Resource limits of the command (memory, CPU time, open files). See [`Limits`][failprint.Limits].
+            Ignored when running Python callables.
+        nice: A niceness increment for the command. See [`run_command`][failprint.run_command].
+            Ignored when running Python callables.
+        ionice: The I/O scheduling class of the command. See [`run_command`][failprint.run_command].
+            Ignored when running Python callables.
+        cpu_affinity: The CPUs the command can run on. See [`run_command`][failprint.run_command].
+            Ignored when running Python callables.
+
+    Raises:
+        ValueError: When passing a working directory or environment for a Python callable, without a pool.
 
     Returns:
         The command exit code, or 0 if `nofail` is True.
     """
-    format_name: str = fmt or os.environ.get("FAILPRINT_FORMAT", _DEFAULT_FORMAT)
-    format_name = accept_custom_format(format_name)
-    format_obj = formats.get(format_name, formats[_DEFAULT_FORMAT])
+    format_obj, command = _start_run(
+        cmd,
+        args,
+        kwargs,
+        fmt=fmt,
+        title=title,
+        command=command,
+        progress=progress and not silent,
+    )
+    capture = Capture.cast(capture)
+
+    # Output is captured as bytes, and only decoded if needed (when rendering or accessed).
+    start = time.perf_counter()
+    with profile_phase("execute"):
+        timed_out = False
+        cached, value = _cached_result(cmd, args, kwargs)
+        if cached:
+            code, raw_output = _result_code(value), b""
+        elif callable(cmd) and pool is not None:
+            code, raw_output, timed_out = pool._run_function(
+                cmd,
+                args=args,
+                kwargs=kwargs,
+                capture=capture,
+                stdin=stdin,
+                binary=True,
+                output_file=output_file,
+                cwd=cwd,
+                env=env,
+                env_overrides=env_overrides,
+                timeout=timeout,
+            )
+        elif callable(cmd):
+            if cwd is not None or env is not None or env_overrides:
+                raise ValueError(
+                    "Python callables run in the current process: use a worker pool "
+                    "to run them with a different working directory or environment",
+                )
+            code, raw_output, timed_out = _run_function(
+                cmd,
+                args=args,
+                kwargs=kwargs,
+                capture=capture,
+                stdin=stdin,
+                binary=True,
+                output_file=output_file,
+                timeout=timeout,
+            )
+        else:
+            code, raw_output = run_command(
+                cmd,
+                capture=capture,
+                ansi=format_obj.accept_ansi,
+                pty=pty,
+                stdin=stdin,
+                fail_on=fail_on,
+                binary=True,
+                output_file=output_file,
+                shell=shell,
+                cwd=cwd,
+                env=env,
+                env_overrides=env_overrides,
+                limits=limits,
+                nice=nice,
+                ionice=ionice,
+                cpu_affinity=cpu_affinity,
+            )
+    return _finish_run(
+        code,
+        raw_output,
+        format_obj,
+        start=start,
+        capture=capture,
+        output_file=output_file,
+        title=title,
+        command=command,
+        number=number,
+        nofail=nofail,
+        quiet=quiet,
+        silent=silent,
+        compact=compact,
+        spool=spool,
+        timed_out=timed_out,
+        cached=cached,
+    )
+
+
+async def arun(cmd: CmdFuncType, **options: Any) -> RunResult:
+    """Run a command in a subprocess or a Python callable, concurrently with other tasks.
+
+    Commands (and callables run in a worker pool) are run in a thread, with [`run`][failprint.run].
+    Coroutine functions (and asynchronous generators) are awaited in the current task,
+    on the running event loop, and other callables are run in a thread, so that several of them can overlap.
+    Their output is captured per task, from `sys.stdout` and `sys.stderr`:
+    output written directly to file descriptors (for example by subprocesses) is not captured.
+    Their timeout cannot interrupt blocking code: coroutines are cancelled at their next await point,
+    and callables run in a thread are reported as timed out, but keep running in the background.
+
+    Examples:
+        >>> results = await asyncio.gather(
+        ...     arun(check_links), arun(check_api), arun("make lint")
+        ... )
 
-    env = Environment(autoescape=False)  # noqa: S701 (no HTML: no need to escape)
-    env.filters["indent"] = textwrap.indent
-    env.filters["escape"] = env.filters["e"] = escape
-    env.filters["unescape"] = env.filters["u"] = unescape
+    Arguments:
+        cmd: The command or callable to run.
+        **options: The same options as [`run`][failprint.run].
+
+    Raises:
+        ValueError: When passing a working directory or environment for a Python callable, without a pool.
 
-    command = command if command is not None else printable_command(cmd, args, kwargs)
+    Returns:
+        The run result.
+    """
+    if not callable(cmd) or options.get("pool") is not None:
+        return await asyncio.to_thread(run, cmd, **options)
+    return await _arun_callable(cmd, **options)
 
-    if not silent and progress and format_obj.progress_template:
-        progress_template = env.from_string(format_obj.progress_template)
-        print(unescape(parse(progress_template.render({"title": title, "command": command}))), end="\r")  # noqa: T201
 
+def run_many(
+    batch: LazyBatch,
+    *,
+    capture: str | bool | Capture | None = None,
+    title: str | None = None,
+    fmt: str | None = None,
+    progress: bool = True,
+    nofail: bool = False,
+    quiet: bool = False,
+    silent: bool = False,
+    pool: WorkerPool | None = None,
+) -> list[CompactRunResult]:
+    """Run a batch of lazy callables, rendering a single summary and the individual failures.
+
+    Callables run in the number of threads of the batch, or in a pool of worker processes.
+    Without a pool, their output is captured per thread, from `sys.stdout` and `sys.stderr`:
+    output written directly to file descriptors (for example by subprocesses) is not captured.
+    The format is loaded and capture is set up once for the whole batch,
+    and successful calls are not rendered at all. With the TAP format, every call is rendered
+    after a plan, and the summary is a comment, so that the output is a valid TAP stream.
+
+    Examples:
+        >>> results = run_many(check_file.map(paths, jobs=8), title="Checking files")
+
+    Parameters:
+        batch: The batch to run, created with the `map` method of [lazified functions][failprint.lazy].
+        capture: The output to capture.
+        title: The title of the batch summary.
+        fmt: The output format.
+        progress: Whether to show progress.
+        nofail: Whether to always succeed.
+        quiet: Whether to not print the output of failures.
+        silent: Whether to not print anything.
+        pool: A pool of worker processes to run the callables in, instead of threads.
+
+    Returns:
+        The compact result of each callable, in order.
+    """
+    command = f"{batch.name or 'batch'} ({len(batch)} call{'' if len(batch) == 1 else 's'})"
+    with profile_phase("setup"):
+        format_obj = _get_format(fmt)
+    # TAP consumers expect a plan and a line for each test.
+    tap = format_obj is formats["tap"]
+    if tap and not silent:
+        print(f"1..{len(batch)}")  # noqa: T201
+    if progress and not silent and format_obj.progress_template:
+        with profile_phase("progress"):
+            print(format_obj.render_progress({"title": title, "command": command}), end="\r")  # noqa: T201
     capture = Capture.cast(capture)
 
-    if callable(cmd):
-        code, output = run_function(cmd, args=args, kwargs=kwargs, capture=capture, stdin=stdin)
-    else:
-        code, output = run_command(cmd, capture=capture, ansi=format_obj.accept_ansi, pty=pty, stdin=stdin)
+    start = time.perf_counter()
+    with profile_phase("execute"):
+        if pool is not None:
+            outcomes = _run_batch_in_pool(batch, capture, pool)
+        else:
+            run_call = partial(_run_batch_call, capture=capture)
+            with _task_streams():
+                if (batch.jobs or 1) == 1:
+                    outcomes = [run_call(call) for call in batch]
+                else:
+                    with ThreadPoolExecutor(batch.jobs) as executor:
+                        outcomes = list(executor.map(run_call, batch))
+
+    results = []
+    failures = 0
+    for number, (call, (code, raw_output, cached)) in enumerate(zip(batch, outcomes), 1):
+        result = RunResult(0 if nofail else code, raw_output, cached=cached)
+        if code != 0:
+            failures += 1
+        if not silent and (code != 0 or tap):
+            _print_result(
+                result,
+                format_obj,
+                code=code,
+                title=None,
+                command=printable_command(call),
+                number=number,
+                nofail=nofail,
+                quiet=quiet,
+                compact=False,
+            )
+        results.append(result.compact())
+
+    code = int(failures > 0)
+    summary = f"{failures} of {len(batch)} failed" if failures else ""
+    # Results are compact: their output is raw bytes, which we measure without copying them.
+    size = sum(len(result._output) for result in results)  # ty: ignore[invalid-argument-type]
+    _record_run(title or command, code, time.perf_counter() - start, size, None)
+    if not silent and tap:
+        print(f"# {_markup(title) if title else command}: {summary or 'all passed'}")  # noqa: T201
+    elif not silent:
+        _print_result(
+            RunResult(0 if nofail else code, summary),
+            format_obj,
+            code=code,
+            title=title,
+            command=command,
+            number=len(batch) + 1,
+            nofail=nofail,
+            quiet=False,
+            compact=False,
+        )
+    return results
+
+
+def _run_batch_call(call: LazyCallable, *, capture: Capture) -> tuple[int, bytes | SeparateOutput, bool]:
+    cached, value = _cached_result(call, None, None)
+    if cached:
+        return _result_code(value), b"", True
+    if capture is Capture.NONE:
+        return run_function_get_code(call, args=(), kwargs={}), b"", False
+    with _TaskCapture(capture) as captured:
+        code = run_function_get_code(call, args=(), kwargs={})
+    return code, captured.separate if capture is Capture.SEPARATE else captured.raw, False
+
+
+def _run_batch_in_pool(
+    batch: LazyBatch,
+    capture: Capture,
+    pool: WorkerPool,
+) -> list[tuple[int, bytes | SeparateOutput, bool]]:
+    futures: list[Future | tuple[int, bytes | SeparateOutput, bool]] = []
+    for call in batch:
+        cached, value = _cached_result(call, None, None)
+        futures.append((_result_code(value), b"", True) if cached else pool.submit(call, capture=capture))
+    outcomes = []
+    for future in futures:
+        if isinstance(future, Future):
+            code, raw_output, _ = future.result()
+            outcomes.append((code, raw_output, False))
+        else:
+            outcomes.append(future)
+    return outcomes
+
+
+async def _arun_callable(
+    func: Callable,
+    *,
+    args: Sequence | None = None,
+    kwargs: dict | None = None,
+    number: int = 1,
+    capture: str | bool | Capture | None = None,
+    title: str | None = None,
+    fmt: str | None = None,
+    progress: bool = True,
+    nofail: bool = False,
+    quiet: bool = False,
+    silent: bool = False,
+    stdin: str | None = None,
+    command: str | None = None,
+    compact: bool = False,
+    output_file: str | Path | None = None,
+    spool: Spool | None = None,
+    cwd: str | Path | None = None,
+    env: Mapping[str, str] | None = None,
+    env_overrides: Mapping[str, str] | None = None,
+    timeout: float | None = None,
+    **ignored: Any,
+) -> RunResult:
+    # Options only used for commands are ignored, as with `run`.
+    if unexpected := set(ignored) - {"pty", "fail_on", "shell", "pool", "limits", "nice", "ionice", "cpu_affinity"}:
+        raise TypeError(f"arun() got unexpected keyword arguments: {', '.join(sorted(unexpected))}")
+    if cwd is not None or env is not None or env_overrides:
+        raise ValueError(
+            "Python callables run in the current process: use a worker pool "
+            "to run them with a different working directory or environment",
+        )
+    format_obj, command = _start_run(
+        func,
+        args,
+        kwargs,
+        fmt=fmt,
+        title=title,
+        command=command,
+        progress=progress and not silent,
+    )
+    capture = Capture.cast(capture)
+    start = time.perf_counter()
+    with profile_phase("execute"):
+        cached, value = _cached_result(func, args, kwargs)
+        if cached:
+            code, timed_out, raw_output = _result_code(value), False, b""
+        elif capture is Capture.NONE:
+            code, timed_out = await _arun_function_with_timeout(func, args=args, kwargs=kwargs, timeout=timeout)
+            raw_output: bytes | SeparateOutput = b""
+        else:
+            with _TaskCapture(capture, stdin=stdin, output_file=output_file) as captured:
+                code, timed_out = await _arun_function_with_timeout(func, args=args, kwargs=kwargs, timeout=timeout)
+            raw_output = captured.separate if capture is Capture.SEPARATE else captured.raw
+    return _finish_run(
+        code,
+        raw_output,
+        format_obj,
+        start=start,
+        capture=capture,
+        output_file=output_file,
+        title=title,
+        command=command,
+        number=number,
+        nofail=nofail,
+        quiet=quiet,
+        silent=silent,
+        compact=compact,
+        spool=spool,
+        timed_out=timed_out,
+        cached=cached,
+    )
+
+
+def _cached_result(cmd: CmdFuncType, args: Sequence | None, kwargs: dict | None) -> tuple[bool, Any]:
+    # Cached results of lazy callables are reported without running them (nor capturing output).
+    if args or kwargs or not isinstance(cmd, LazyCallable) or cmd.cache is None:
+        return False, None
+    key = cmd.cache_key
+    return (False, None) if key is None else cmd.cache.lookup(key)
+
+
+async def _arun_function_with_timeout(
+    func: Callable,
+    *,
+    args: Sequence | None,
+    kwargs: dict | None,
+    timeout: float | None,
+) -> tuple[int, bool]:
+    coroutine = _arun_function_get_code(func, args=args or [], kwargs=kwargs or {})
+    try:
+        return await asyncio.wait_for(coroutine, timeout), False
+    except asyncio.TimeoutError:
+        sys.stderr.write(_timeout_report(timeout))  # ty: ignore[invalid-argument-type]
+        return _TIMEOUT_CODE, True
+
+
+def _start_run(
+    cmd: CmdFuncType,
+    args: Sequence | None,
+    kwargs: dict | None,
+    *,
+    fmt: str | None,
+    title: str | None,
+    command: str | None,
+    progress: bool,
+) -> tuple[Format, str]:
+    with profile_phase("setup"):
+        format_obj = _get_format(fmt)
+        command = command if command is not None else printable_command(cmd, args, kwargs)
+
+    if progress and format_obj.progress_template:
+        with profile_phase("progress"):
+            print(format_obj.render_progress({"title": title, "command": command}), end="\r")  # noqa: T201
+
+    return format_obj, command
+
+
+def _finish_run(
+    code: int,
+    raw_output: bytes | SeparateOutput,
+    format_obj: Format,
+    *,
+    start: float,
+    capture: Capture,
+    output_file: str | Path | None,
+    title: str | None,
+    command: str,
+    number: int,
+    nofail: bool,
+    quiet: bool,
+    silent: bool,
+    compact: bool,
+    spool: Spool | None,
+    timed_out: bool = False,
+    cached: bool = False,
+) -> RunResult:
+    output_file = None if output_file is None or capture is Capture.NONE else str(output_file)
+    result = RunResult(0 if nofail else code, raw_output, output_file=output_file, timed_out=timed_out, cached=cached)
+    _record_run(title or command, code, time.perf_counter() - start, raw_output, output_file)
+    if spool is not None:
+        # Spool output before printing it, so that passthrough formats can copy it from the spool file.
+        result = result.compact(spool)
 
     if not silent:
-        template = env.from_string(format_obj.template)
-        rendered = template.render(
+        _print_result(
+            result,
+            format_obj,
+            code=code,
+            title=title,
+            command=command,
+            number=number,
+            nofail=nofail,
+            quiet=quiet,
+            compact=compact,
+        )
+
+    return result
+
+
+def _get_format(fmt: str | None) -> Format:
+    format_name: str = fmt or os.environ.get("FAILPRINT_FORMAT", _DEFAULT_FORMAT)
+    format_name = accept_custom_format(format_name)
+    return _load_format(format_name) or formats[_DEFAULT_FORMAT]
+
+
+def _print_result(
+    result: RunResult,
+    format_obj: Format,
+    *,
+    code: int,
+    title: str | None,
+    command: str,
+    number: int,
+    nofail: bool,
+    quiet: bool,
+    compact: bool,
+) -> None:
+    output: str | bytes | memoryview | SpooledOutput
+    if format_obj.passthrough and not compact:
+        # Passthrough formats copy output as is: don't decode it.
+        output = result._output if result._separate is None else result._separate._raw()  # ty: ignore[invalid-assignment]
+    else:
+        with profile_phase("decode"):
+            output = result.output
+        if compact:
+            with profile_phase("compact"):
+                output = compact_output(output, strip_ansi=not format_obj.accept_ansi)
+    # Streamed chunks are rendered while they are written, in the print phase.
+    with profile_phase("render"):
+        chunks = format_obj.stream(
             {
                 "title": title,
                 "command": command,
                 "code": code,
+                "cached": result.cached,
                 "success": code == 0,
                 "failure": code != 0,
                 "number": number,
                 "output": output,
+                "stdout": result.stdout,
+                "stderr": result.stderr,
+                "output_file": result.output_file,
                 "nofail": nofail,
                 "quiet": quiet,
-                "silent": silent,
+                "silent": False,
             },
         )
-        print(unescape(parse(rendered)))  # noqa: T201
+    with profile_phase("print"):
+        _write_chunks(chunks, output)
+
 
-    return RunResult(0 if nofail else code, output)
+def _write_chunks(chunks: Iterable[str | RawOutput], output: str | bytes | memoryview | SpooledOutput) -> None:
+    stream = sys.stdout
+    # On Windows, colorama wraps the text stream to convert ANSI sequences.
+    buffer = None if WINDOWS else getattr(stream, "buffer", None)
+    if buffer is None:
+        for chunk in chunks:
+            stream.write(_output_text(output) if isinstance(chunk, RawOutput) else chunk)
+        stream.write("\n")
+        return
+    # Encode chunks one by one straight into the binary buffer,
+    # rather than copying the whole text through the text layer.
+    stream.flush()
+    encoding, errors = stream.encoding, stream.errors or "strict"
+    for chunk in chunks:
+        if not isinstance(chunk, RawOutput):
+            buffer.write(chunk.encode(encoding, errors))
+        elif isinstance(output, str):
+            buffer.write(output.encode(encoding, errors))
+        elif isinstance(output, SpooledOutput) and (fd := _fileno(stream)) is not None:
+            buffer.flush()
+            output.write_to(fd)
+        else:
+            buffer.write(output.view() if isinstance(output, SpooledOutput) else output)
+    buffer.write(b"\n")
+    if stream.line_buffering:
+        buffer.flush()
+
+
+def _fileno(stream: TextIO) -> int | None:
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError):
+        # In-memory streams, for example when testing.
+        return None
 
 
 def run_command(
@@ -139,7 +803,18 @@ def run_command(
     ansi: bool = False,
     pty: bool = False,
     stdin: str | None = None,
-) -> tuple[int, str]:
+    fail_on: str | re.Pattern | None = None,
+    binary: bool = False,
+    output_file: str | Path | None = None,
+    shell: bool | None = None,
+    cwd: str | Path | None = None,
+    env: Mapping[str, str] | None = None,
+    env_overrides: Mapping[str, str] | None = None,
+    limits: Limits | None = None,
+    nice: int | None = None,
+    ionice: int | str | None = None,
+    cpu_affinity: Iterable[int] | None = None,
+) -> tuple[int, str | bytes]:
     """Run a command.
 
     Arguments:
@@ -148,30 +823,115 @@ def run_command(
         ansi: Whether to accept ANSI sequences.
         pty: Whether to run in a PTY.
         stdin: String to use as standard input.
+        fail_on: A regular expression matched against each line of output, terminating the command on match.
+        binary: Whether to return the output as raw bytes instead of decoding it.
+        output_file: A file to write the captured output to. Only its last lines are then returned.
+        shell: Whether to run the command in a shell. By default, only strings using shell syntax
+            (or shell builtins) are run in a shell: other strings are split and executed directly.
+            Pass true to always use a shell, even for lists, or false to never use one.
+        cwd: The working directory of the command. Default: the current working directory.
+        env: The environment of the command. Default: the current environment.
+        env_overrides: Environment variables to set on top of `env` (or the current environment).
+            They are layered over it without copying it.
+        limits: Resource limits of the command (memory, CPU time, open files).
+            Commands exceeding their CPU time limit are reported with exit code 152.
+        nice: A niceness increment for the command (positive values lower its priority).
+        ionice: The I/O scheduling class of the command (Linux only): a best-effort priority level
+            from 0 (highest) to 7 (lowest), or `idle`, `best-effort:LEVEL` or `realtime:LEVEL`.
+        cpu_affinity: The CPUs the command can run on (Linux only).
+
+    Limits, priority and CPU affinity are set right after the process is spawned,
+    without slowing spawning down: what the command does in its first moments is not affected yet.
+
+    Executables are looked up in PATH once and cached (per name and PATH value, until modified).
+    This is always done on Windows, and on other systems when the `FAILPRINT_CACHE_EXECUTABLES`
+    environment variable is set to `1`.
 
     Returns:
         The exit code and the command output.
     """
-    shell = isinstance(cmd, str)
+    environment = _environment(env, env_overrides)
+    path = None if environment is None else environment.get("PATH", os.defpath)
+
+    original_cmd = cmd
+    split = False
+    if isinstance(cmd, str) and shell is not True and not WINDOWS:
+        argv = shlex.split(cmd) if shell is False else _split_simple_command(cmd, path)
+        if argv is not None:
+            cmd = argv
+            split = shell is None
+    shell = bool(shell) or (shell is None and isinstance(cmd, str))
+
+    # On Windows, make sure the process can find the executable.
+    # On other systems, resolving it once spares a PATH search on each spawn.
+    if not shell and not isinstance(cmd, str) and (WINDOWS or _cache_executables()):
+        cmd = [_which(cmd[0], path) or cmd[0], *cmd[1:]]
 
     # if chosen format doesn't accept ansi, or on Windows, don't use pty
     if pty and (not ansi or WINDOWS):
         pty = False
 
-    # pty can only combine, so only use pty when combining
-    if pty and capture in {Capture.BOTH, Capture.NONE}:
-        if shell:
-            cmd = ["sh", "-c", cmd]  # ty: ignore[invalid-assignment]
-        return run_pty_subprocess(cmd, capture=capture, stdin=stdin)  # ty: ignore[invalid-argument-type]
+    try:
+        # pty can only combine, so only use pty when combining
+        if pty and capture in {Capture.BOTH, Capture.NONE}:
+            if shell:
+                cmd = ["sh", "-c", printable_command(cmd)]
+            return run_pty_subprocess(
+                cmd,  # ty: ignore[invalid-argument-type]
+                capture=capture,
+                stdin=stdin,
+                fail_on=fail_on,
+                binary=binary,
+                output_file=output_file,
+                cwd=cwd,
+                env=environment,
+                limits=limits,
+                nice=nice,
+                ionice=ionice,
+                cpu_affinity=cpu_affinity,
+            )
+
+        return run_subprocess(
+            cmd,
+            capture=capture,
+            shell=shell,
+            stdin=stdin,
+            fail_on=fail_on,
+            binary=binary,
+            output_file=output_file,
+            cwd=cwd,
+            env=environment,
+            limits=limits,
+            nice=nice,
+            ionice=ionice,
+            cpu_affinity=cpu_affinity,
+        )
+    except OSError as error:
+        # Executables without a shebang can only be run by a shell, as `sh -c` used to.
+        if not split or error.errno != errno.ENOEXEC:
+            raise
+    return run_command(  # noqa: S604
+        original_cmd,
+        capture=capture,
+        ansi=ansi,
+        pty=pty,
+        stdin=stdin,
+        fail_on=fail_on,
+        binary=binary,
+        output_file=output_file,
+        shell=True,
+        cwd=cwd,
+        env=env,
+        env_overrides=env_overrides,
+        limits=limits,
+        nice=nice,
+        ionice=ionice,
+        cpu_affinity=cpu_affinity,
+    )
 
-    # we are on Windows
-    if WINDOWS:
-        # make sure the process can find the executable
-        if not shell:
-            cmd[0] = shutil.which(cmd[0]) or cmd[0]  # ty: ignore[invalid-assignment]
-        return run_subprocess(cmd, capture=capture, shell=shell, stdin=stdin)
 
-    return run_subprocess(cmd, capture=capture, shell=shell, stdin=stdin)
+def _cache_executables() -> bool:
+    return os.environ.get("FAILPRINT_CACHE_EXECUTABLES", "").lower() in {"1", "true", "yes", "on"}
 
 
 def run_function(
@@ -181,29 +941,245 @@ def run_function(
     kwargs: dict | None = None,
     capture: Capture = Capture.BOTH,
     stdin: str | None = None,
-) -> tuple[int, str]:
+    binary: bool = False,
+    output_file: str | Path | None = None,
+    timeout: float | None = None,
+) -> tuple[int, str | bytes]:
     """Run a function.
 
+    Functions run in the current process, sharing its working directory and environment.
+    To run them with a different working directory or environment, without changing
+    those of the current process, use [`WorkerPool.run_function`][failprint.WorkerPool.run_function].
+
+    Functions that exceed their timeout are interrupted with a `SIGALRM` signal
+    when running in the main thread (on systems supporting it). Elsewhere, they run in
+    a child process, which is killed on timeout. In both cases, output captured until then is kept,
+    and the exit code is 124. Functions (and their arguments) are then sent to the child process:
+    they must be picklable (defined at module level), other functions fail with exit code 1.
+
     Arguments:
         func: The function to run.
         args: Positional arguments passed to the function.
         kwargs: Keyword arguments passed to the function.
         capture: The output to capture.
         stdin: String to use as standard input.
+        binary: Whether to return the output as raw bytes instead of decoding it.
+        output_file: A file to write the captured output to. Only its last lines are then returned.
+        timeout: The maximum duration of the function, in seconds.
 
     Returns:
         The exit code and the function output.
+            With `Capture.SEPARATE`, the output is a [`SeparateOutput`][failprint.SeparateOutput] instance.
     """
+    code, output, _ = _run_function(
+        func,
+        args=args,
+        kwargs=kwargs,
+        capture=capture,
+        stdin=stdin,
+        binary=binary,
+        output_file=output_file,
+        timeout=timeout,
+    )
+    return code, output
+
+
+def _run_function(
+    func: Callable,
+    *,
+    args: Sequence | None,
+    kwargs: dict | None,
+    capture: Capture,
+    stdin: str | None,
+    binary: bool,
+    output_file: str | Path | None,
+    timeout: float | None,
+) -> tuple[int, str | bytes | SeparateOutput, bool]:
     args = args or []
     kwargs = kwargs or {}
 
+    if timeout is not None and not _can_alarm():
+        return _run_function_isolated(
+            func,
+            args=args,
+            kwargs=kwargs,
+            capture=capture,
+            stdin=stdin,
+            binary=binary,
+            output_file=output_file,
+            timeout=timeout,
+        )
+
     if capture == Capture.NONE:
-        return run_function_get_code(func, args=args, kwargs=kwargs), ""
+        with profile_phase("call"):
+            code, timed_out = _run_function_with_alarm(func, args=args, kwargs=kwargs, timeout=timeout)
+        return code, b"" if binary else "", timed_out
+
+    with CaptureManager(capture, stdin=stdin, output_file=output_file) as captured, profile_phase("call"):
+        code, timed_out = _run_function_with_alarm(func, args=args, kwargs=kwargs, timeout=timeout)
+
+    if capture == Capture.SEPARATE:
+        return code, captured.separate, timed_out
+    return code, captured.raw if binary else str(captured), timed_out
+
+
+_TIMEOUT_CODE = 124
+
+
+class _FunctionTimeoutError(BaseException):
+    # Like `KeyboardInterrupt`, not an `Exception`: functions catching exceptions must not swallow it.
+    pass
+
 
-    with capture.here(stdin=stdin) as captured:
-        code = run_function_get_code(func, args=args, kwargs=kwargs)
+def _timeout_report(timeout: float) -> str:
+    return f"\nfailprint: timed out after {timeout:g} seconds, function interrupted\n"
 
-    return code, str(captured)
+
+def _can_alarm() -> bool:
+    # Signal handlers can only be set in the main thread.
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+def _raise_timeout(signum: int, frame: FrameType | None) -> None:  # noqa: ARG001
+    raise _FunctionTimeoutError
+
+
+def _run_function_with_alarm(
+    func: Callable,
+    *,
+    args: Sequence,
+    kwargs: dict,
+    timeout: float | None,
+) -> tuple[int, bool]:
+    if timeout is None:
+        return run_function_get_code(func, args=args, kwargs=kwargs), False
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    previous_delay, previous_interval = signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.monotonic()
+    try:
+        # The timer is disarmed while timeouts are still caught: the alarm can go off just after the function returns.
+        try:
+            code = run_function_get_code(func, args=args, kwargs=kwargs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _FunctionTimeoutError:
+        sys.stderr.write(_timeout_report(timeout))
+        return _TIMEOUT_CODE, True
+    else:
+        return code, False
+    finally:
+        signal.signal(signal.SIGALRM, previous_handler)
+        if previous_delay:
+            # Restore the caller's timer, minus the time spent running the function.
+            remaining = max(previous_delay - (time.monotonic() - start), 0.001)
+            signal.setitimer(signal.ITIMER_REAL, remaining, previous_interval)
+
+
+def _run_function_isolated(
+    func: Callable,
+    *,
+    args: Sequence,
+    kwargs: dict,
+    capture: Capture,
+    stdin: str | None,
+    binary: bool,
+    output_file: str | Path | None,
+    timeout: float,
+) -> tuple[int, str | bytes | SeparateOutput, bool]:
+    # Output is written to files by the child process, so that it is kept even if it is killed.
+    # This only runs outside the main thread: forking a multi-threaded process can deadlock the child,
+    # so children are started from a single-threaded server process (or spawned, where it is not available).
+    context = multiprocessing.get_context("spawn" if WINDOWS else "forkserver")
+    report = None
+    with tempfile.TemporaryDirectory(prefix="failprint-") as directory:
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_function_in_child,
+            kwargs={
+                "func": func,
+                "args": args,
+                "kwargs": kwargs,
+                "capture": capture,
+                "stdin": stdin,
+                "directory": directory,
+                "connection": writer,
+            },
+            daemon=True,
+        )
+        with profile_phase("call"):
+            timed_out = False
+            try:
+                process.start()
+            except (pickle.PicklingError, AttributeError, TypeError) as error:
+                code = 1
+                report = f"\nfailprint: cannot send function to a child process to enforce its timeout: {error}\n"
+            finally:
+                writer.close()
+            if report is None:
+                # The timeout starts once the child received the function (importing its module).
+                with contextlib.suppress(EOFError):
+                    reader.recv()
+                process.join(timeout)
+                timed_out = process.is_alive()
+                if timed_out:
+                    process.kill()
+                    process.join()
+                    code = _TIMEOUT_CODE
+                    report = _timeout_report(timeout)
+                else:
+                    code = reader.recv() if reader.poll() else process.exitcode
+            reader.close()
+        stdout = Path(directory, "stdout")
+        stderr = Path(directory, "stderr")
+        chunks = [
+            (float(index), name, _translate_newlines(path.read_bytes()))
+            for index, (name, path) in enumerate((("stdout", stdout), ("stderr", stderr)))
+            if path.exists()
+        ]
+    if report is not None and capture is not Capture.STDOUT:
+        chunks.append((2.0, "stderr", report.encode()))
+    if capture is Capture.NONE:
+        if report is not None:
+            sys.stderr.write(report)
+        return code, b"" if binary else "", timed_out
+    if capture is Capture.SEPARATE:
+        return code, SeparateOutput(chunks), timed_out
+    raw = b"".join(data for _, _, data in chunks)
+    if output_file is not None:
+        sink = _Sink(output_file)
+        sink.write(raw)
+        raw = _translate_newlines(sink.close())
+    return code, raw if binary else _decode(raw), timed_out
+
+
+def _run_function_in_child(
+    *,
+    func: Callable,
+    args: Sequence,
+    kwargs: dict,
+    capture: Capture,
+    stdin: str | None,
+    directory: str,
+    connection: Connection,
+) -> None:
+    # With `Capture.BOTH`, standard output and error share a single file.
+    targets = {
+        Capture.BOTH: {"stdout": "stdout", "stderr": "stdout"},
+        Capture.SEPARATE: {"stdout": "stdout", "stderr": "stderr"},
+        Capture.STDOUT: {"stdout": "stdout", "stderr": os.devnull},
+        Capture.STDERR: {"stdout": os.devnull, "stderr": "stderr"},
+        Capture.NONE: {},
+    }[capture]
+    files = {target: open(Path(directory, target), "wb") for target in set(targets.values())}  # noqa: PTH123,SIM115
+    for name, target in targets.items():
+        os.dup2(files[target].fileno(), getattr(sys, name).fileno())
+    if stdin is not None:
+        sys.stdin = StringIO(stdin)
+    connection.send(None)
+    code = run_function_get_code(func, args=args, kwargs=kwargs)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    connection.send(code)
 
 
 def run_function_get_code(
@@ -214,6 +1190,10 @@ def run_function_get_code(
 ) -> int:
     """Run a function and return a exit code.
 
+    Coroutines returned by the function are awaited on an event loop managed by failprint
+    (one per thread). Generators are consumed, and the chunks they yield are written
+    to standard output (text or bytes). Their return value is then used as result.
+
     Arguments:
         func: The function to run.
         args: Positional arguments passed to the function.
@@ -224,23 +1204,71 @@ def run_function_get_code(
     """
     try:
         result = func(*args, **kwargs)
+        if inspect.iscoroutine(result) or inspect.isasyncgen(result):
+            result = _run_coroutine(_await(result))
+        elif inspect.isgenerator(result):
+            result = _consume_generator(result)
     except SystemExit as exit:
-        if exit.code is None:
-            return 0
-        if isinstance(exit.code, int):
-            return exit.code
-        sys.stderr.write(str(exit.code))
-        return 1
+        return _exit_code(exit)
     except Exception as error:  # noqa: BLE001
-        if (duty_failure := _get_duty_failure_exception()) and isinstance(error, duty_failure):
-            return error.code  # ty: ignore[unresolved-attribute]
-        sys.stderr.write(traceback.format_exc() + "\n")
-        return 1
+        return _exception_code(error)
 
     # if func was a lazy callable, recurse
     if isinstance(result, LazyCallable):
         return run_function_get_code(result, args=(), kwargs={})
 
+    return _result_code(result)
+
+
+async def _arun_function_get_code(func: Callable, *, args: Sequence, kwargs: dict) -> int:
+    # Blocking functions run in a thread, so that they don't stall other tasks of the event loop
+    # (the thread inherits the context of the task, and so its output capture).
+    try:
+        if _is_async_function(func):
+            result = func(*args, **kwargs)
+        else:
+            result = await asyncio.to_thread(_call_consuming_generators, func, args, kwargs)
+        if inspect.isawaitable(result) or inspect.isasyncgen(result):
+            result = await _await(result)
+    except SystemExit as exit:
+        return _exit_code(exit)
+    except Exception as error:  # noqa: BLE001
+        return _exception_code(error)
+
+    if isinstance(result, LazyCallable):
+        return await _arun_function_get_code(result, args=(), kwargs={})
+
+    return _result_code(result)
+
+
+def _is_async_function(func: Callable) -> bool:
+    if isinstance(func, LazyCallable):
+        func = func.call
+    return inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+
+
+def _call_consuming_generators(func: Callable, args: Sequence, kwargs: dict) -> Any:
+    result = func(*args, **kwargs)
+    return _consume_generator(result) if inspect.isgenerator(result) else result
+
+
+def _exit_code(system_exit: SystemExit) -> int:
+    if system_exit.code is None:
+        return 0
+    if isinstance(system_exit.code, int):
+        return system_exit.code
+    sys.stderr.write(str(system_exit.code))
+    return 1
+
+
+def _exception_code(error: Exception) -> int:
+    if (duty_failure := _get_duty_failure_exception()) and isinstance(error, duty_failure):
+        return error.code  # ty: ignore[unresolved-attribute]
+    sys.stderr.write(traceback.format_exc() + "\n")
+    return 1
+
+
+def _result_code(result: Any) -> int:
     # first check True and False
     # because int(True) == 1 and int(False) == 0
     if result is True:
@@ -255,6 +1283,64 @@ def run_function_get_code(
         return 1
 
 
+async def _await(result: Awaitable | AsyncGenerator) -> Any:
+    if not inspect.isasyncgen(result):
+        return await result
+    async for chunk in result:
+        _write_chunk(chunk)
+    return None
+
+
+def _consume_generator(generator: Generator) -> Any:
+    while True:
+        try:
+            chunk = next(generator)
+        except StopIteration as stop:
+            return stop.value
+        _write_chunk(chunk)
+
+
+def _write_chunk(chunk: Any) -> None:
+    # Chunks are written as is: text chunks should contain their own line endings.
+    if isinstance(chunk, (bytes, bytearray, memoryview)):
+        sys.stdout.flush()
+        sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+    elif chunk is not None:
+        sys.stdout.write(str(chunk))
+
+
+class _ThreadLoop:
+    # The event loop of a thread, closed when the thread ends and its thread-local data is deleted.
+    __slots__ = ("loop",)
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+
+    def __del__(self) -> None:
+        self.loop.close()
+
+
+_loops = threading.local()
+
+
+def _run_coroutine(coroutine: Coroutine) -> Any:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        # A loop is already running in this thread (`run` was called from a coroutine):
+        # it cannot be blocked on, so run the coroutine in another thread, with its own loop.
+        with ThreadPoolExecutor(1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+    # Reuse one loop per thread, rather than creating one for each function.
+    thread_loop = getattr(_loops, "loop", None)
+    if thread_loop is None or thread_loop.loop.is_closed():
+        thread_loop = _loops.loop = _ThreadLoop()
+    return thread_loop.loop.run_until_complete(coroutine)
+
+
 @cache
 def _get_duty_failure_exception() -> type[BaseException] | None:
     try:
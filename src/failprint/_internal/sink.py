@@ -0,0 +1,70 @@
+# Writing captured output to files.
+
+from __future__ import annotations
+
+import gzip
+import os
+from pathlib import Path
+from typing import IO
+
+try:
+    from compression import zstd  # ty: ignore[unresolved-import]
+except ImportError:
+    zstd = None
+
+_TAIL_BYTES = 8192
+_TAIL_LINES = 20
+
+
+def _tail_excerpt(raw: bytes, *, truncated: bool) -> bytes:
+    # Keep the last lines of output, dropping the first line if it was truncated.
+    lines = raw[-_TAIL_BYTES:].split(b"\n")
+    if truncated:
+        lines = lines[1:]
+    return b"\n".join(lines[-_TAIL_LINES - 1 :])
+
+
+class _Sink:
+    # A file receiving output as it is captured, compressed on the fly
+    # when its name ends with `.gz` or `.zst`. Only the tail of the output
+    # is kept in memory, to be rendered as an excerpt.
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = str(path)
+        suffix = Path(path).suffix
+        self.compressed = suffix in {".gz", ".zst"}
+        self.file: IO[bytes]
+        if suffix == ".gz":
+            self.file = gzip.open(path, "wb")  # noqa: SIM115
+        elif suffix == ".zst":
+            if zstd is None:
+                raise ValueError("Zstandard compression requires Python 3.14 or above")
+            self.file = zstd.open(path, "wb")
+        else:
+            self.file = open(path, "w+b")  # noqa: PTH123,SIM115
+        self._tail = bytearray()
+        self._size = 0
+
+    def fileno(self) -> int:
+        # Only uncompressed files can receive output directly from other processes.
+        return self.file.fileno()
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self._size += len(data)
+        if self.compressed:
+            self._tail += data[-_TAIL_BYTES:]
+            if len(self._tail) > 2 * _TAIL_BYTES:
+                del self._tail[:-_TAIL_BYTES]
+
+    def close(self) -> bytes:
+        if self.compressed:
+            self.file.close()
+            return _tail_excerpt(bytes(self._tail), truncated=self._size > _TAIL_BYTES)
+        # The file may have been written by another process: get its actual size.
+        self.file.flush()
+        size = self.file.seek(0, os.SEEK_END)
+        self.file.seek(max(0, size - _TAIL_BYTES))
+        tail = self.file.read()
+        self.file.close()
+        return _tail_excerpt(tail, truncated=size > _TAIL_BYTES)
@@ -0,0 +1,213 @@
+# Storage of many outputs in a single, memory-mapped file.
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+from typing import IO, TYPE_CHECKING
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+    from types import TracebackType
+
+_spools: weakref.WeakValueDictionary[str, Spool] = weakref.WeakValueDictionary()
+
+
+def _open_spool(path: str) -> Spool:
+    # Unpickled outputs referencing the same spool share a single instance.
+    if (spool := _spools.get(path)) is None:
+        spool = Spool(path)
+    return spool
+
+
+class Spool:
+    """An append-only file storing the output of many runs.
+
+    Outputs are appended to a single file, and read back through a memory map,
+    without copies. Results only keep a reference to their output (an offset and a length),
+    so that keeping thousands of them costs little memory, and a single file descriptor.
+
+    Examples:
+        >>> with Spool("outputs.spool") as spool:
+        ...     results = [run(cmd, spool=spool) for cmd in commands]
+        ...     failures = [result.output for result in results if result.code]
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        """Open the spool.
+
+        Parameters:
+            path: The spool file. Existing contents are kept, and new outputs are appended.
+                Default: an anonymous temporary file, deleted when the spool is closed.
+        """
+        self.path = None if path is None else str(path)
+        """The spool file, unless it is temporary."""
+        # Files are unbuffered: other spools (in this process or others) can append to the same file.
+        self._file: IO[bytes]
+        if self.path is None:
+            self._file = tempfile.TemporaryFile("w+b", buffering=0, prefix="failprint-spool-")  # noqa: SIM115
+        else:
+            self._file = open(self.path, "a+b", buffering=0)  # noqa: PTH123,SIM115
+            _spools[self.path] = self
+        self._map: mmap.mmap | None = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> Spool:  # noqa: PYI034 (false-positive)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __reduce__(self) -> tuple:
+        if self.path is None:
+            raise TypeError("Cannot pickle a temporary spool: give it a path to share it between processes")
+        return (_open_spool, (self.path,))
+
+    def __len__(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+
+    def append(self, data: bytes) -> SpooledOutput:
+        """Append data to the spool.
+
+        Spools opened on the same file, in this process or in others, can append to it concurrently
+        (except on Windows, where the file is not locked).
+
+        Parameters:
+            data: The data to append.
+
+        Returns:
+            A reference to the appended data.
+        """
+        with self._lock, self._file_lock():
+            # The file size is the real offset: other spools may have appended to the file.
+            offset = os.fstat(self._file.fileno()).st_size
+            view = memoryview(data)
+            while view:
+                view = view[self._file.write(view) :]
+        return SpooledOutput(self, offset, len(data))
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if fcntl is None or self.path is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def view(self, offset: int, length: int) -> memoryview:
+        """Return a view on data stored in the spool, without copying it.
+
+        Parameters:
+            offset: The position of the data in the spool.
+            length: The length of the data.
+
+        Returns:
+            A read-only view on the data.
+        """
+        if length == 0:
+            return memoryview(b"")
+        with self._lock:
+            if self._map is None or offset + length > len(self._map):
+                # Previous maps stay valid while views on them exist.
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._map)[offset : offset + length]
+
+    def write_to(self, fd: int, offset: int, length: int) -> None:
+        """Copy data stored in the spool to a file descriptor.
+
+        Data is copied by the kernel with `os.sendfile` when possible,
+        without being read by Python, and written from the memory map otherwise.
+
+        Parameters:
+            fd: The file descriptor to write to.
+            offset: The position of the data in the spool.
+            length: The length of the data.
+        """
+        sent = 0
+        if hasattr(os, "sendfile"):
+            try:
+                while sent < length and (count := os.sendfile(fd, self._file.fileno(), offset + sent, length - sent)):
+                    sent += count
+            except OSError as error:
+                # Some targets (or platforms, like macOS with anything else than sockets) are not supported.
+                if error.errno not in {errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP}:
+                    raise
+        view = self.view(offset + sent, length - sent)
+        while view:
+            view = view[os.write(fd, view) :]
+
+    def close(self) -> None:
+        """Close the spool file."""
+        if self.path is not None and _spools.get(self.path) is self:
+            del _spools[self.path]
+        if self._map is not None:
+            # Views on the map may still be used: it is then unmapped when they are released.
+            with contextlib.suppress(BufferError):
+                self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class SpooledOutput:
+    """A reference to an output stored in a [spool][failprint.Spool]."""
+
+    __slots__ = ("length", "offset", "spool")
+
+    def __init__(self, spool: Spool, offset: int, length: int) -> None:
+        """Initialize the reference.
+
+        Parameters:
+            spool: The spool storing the output.
+            offset: The position of the output in the spool.
+            length: The length of the output.
+        """
+        self.spool = spool
+        """The spool storing the output."""
+        self.offset = offset
+        """The position of the output in the spool."""
+        self.length = length
+        """The length of the output."""
+
+    def __reduce__(self) -> tuple:
+        return (SpooledOutput, (self.spool, self.offset, self.length))
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.view())
+
+    def view(self) -> memoryview:
+        """Return a view on the output, without copying it.
+
+        Returns:
+            A read-only view on the output.
+        """
+        return self.spool.view(self.offset, self.length)
+
+    def write_to(self, fd: int) -> None:
+        """Copy the output to a file descriptor, with `os.sendfile` when possible.
+
+        Parameters:
+            fd: The file descriptor to write to.
+        """
+        self.spool.write_to(fd, self.offset, self.length)
@@ -2,11 +2,17 @@
 
 from __future__ import annotations
 
-from typing import Callable, Union
+from collections.abc import Iterable, Mapping
+from typing import TYPE_CHECKING, Any, Callable, Union
 
 from failprint._internal.lazy import LazyCallable
 
+if TYPE_CHECKING:
+    from failprint._internal.formats import RawOutput
+
 CmdType = Union[str, list[str]]
 """Type for a command."""
 CmdFuncType = Union[CmdType, Callable, LazyCallable]
 """Type for a command or function."""
+RenderFunction = Callable[[Mapping[str, Any]], Union[str, Iterable[Union[str, "RawOutput"]]]]
+"""Type for a function rendering a result (as text or chunks of text) from a template context."""
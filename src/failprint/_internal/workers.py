@@ -0,0 +1,325 @@
+# Pool of pre-started worker processes, to run Python callables in isolation.
+
+from __future__ import annotations
+
+import importlib
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable
+
+from failprint._internal.capture import Capture, _decode
+from failprint._internal.lazy import LazyCallable, _cacheable
+from failprint._internal.runners import _run_function
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Mapping, Sequence
+    from types import TracebackType
+
+    from failprint._internal.capture import SeparateOutput
+
+
+def _preload(modules: Sequence[str]) -> None:
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _ready() -> None:
+    pass
+
+
+@contextmanager
+def _isolated(
+    cwd: str | Path | None,
+    env: Mapping[str, str] | None,
+    env_overrides: Mapping[str, str] | None,
+) -> Iterator[None]:
+    # Workers run one function at a time: changing their working directory
+    # and environment for the duration of the call affects nothing else.
+    saved_cwd = Path.cwd() if cwd is not None else None
+    saved_env = dict(os.environ) if env is not None or env_overrides else None
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+        if env is not None:
+            os.environ.clear()
+            os.environ.update(env)
+        if env_overrides:
+            os.environ.update(env_overrides)
+        yield
+    finally:
+        if saved_cwd is not None:
+            os.chdir(saved_cwd)
+        if saved_env is not None:
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+
+def _run_in_worker(
+    func: Callable,
+    *,
+    args: Sequence | None,
+    kwargs: dict | None,
+    capture: Capture,
+    stdin: str | None,
+    output_file: str | Path | None,
+    cwd: str | Path | None,
+    env: Mapping[str, str] | None,
+    env_overrides: Mapping[str, str] | None,
+    timeout: float | None,
+) -> tuple[int, bytes | SeparateOutput, bool]:
+    with _isolated(cwd, env, env_overrides):
+        return _run_function(  # ty: ignore[invalid-return-type]
+            func,
+            args=args,
+            kwargs=kwargs,
+            capture=capture,
+            stdin=stdin,
+            binary=True,
+            output_file=output_file,
+            timeout=timeout,
+        )
+
+
+def _run_recording_in_worker(
+    func: Callable,
+    *,
+    record: bool,
+    **options: Any,
+) -> tuple[int, bytes | SeparateOutput, bool, tuple[bool, Any]]:
+    # Lazy callables are sent without their cache: their result is sent back
+    # (when it can be pickled), to be stored in the cache of the calling process.
+    if not record:
+        return (*_run_in_worker(func, **options), (False, None))
+    results = []
+
+    def call() -> Any:
+        results.append(func())
+        return results[-1]
+
+    code, output, timed_out = _run_in_worker(call, **options)
+    if not results or not _cacheable(results[0]):
+        return code, output, timed_out, (False, None)
+    try:
+        pickle.dumps(results[0])
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return code, output, timed_out, (False, None)
+    return code, output, timed_out, (True, results[0])
+
+
+def _cache_key(func: Callable) -> str | None:
+    if isinstance(func, LazyCallable) and func.cache is not None:
+        return func.cache_key
+    return None
+
+
+class WorkerPool:
+    """A pool of worker processes, started in advance, running Python callables.
+
+    Each callable runs isolated from the caller process, but without paying
+    for the interpreter start and imports of a fresh process:
+    modules listed in `preload` are imported once, when workers start.
+
+    Callables and their arguments are sent to workers with pickle:
+    they must be importable from their module (module-level functions,
+    or [lazy callables][failprint.lazy] created from module-level functions).
+    Output is captured in the worker, and sent back when the callable returns.
+
+    Examples:
+        >>> with WorkerPool(4, preload=["duty", "myproject.tasks"]) as pool:
+        ...     run(tasks.check_types(), pool=pool)
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        *,
+        preload: Sequence[str] = (),
+        context: str | None = None,
+    ) -> None:
+        """Start the worker processes.
+
+        Parameters:
+            workers: The number of worker processes. Default: the number of CPUs.
+            preload: Modules to import in each worker when it starts.
+            context: The multiprocessing start method (`fork`, `forkserver` or `spawn`).
+                Default: the platform default.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        """The number of worker processes."""
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context(context),
+            initializer=_preload,
+            initargs=(tuple(preload),),
+        )
+        # Workers are otherwise started on demand: submit no-op tasks
+        # to start all of them (and run their initializer) right away.
+        wait([self._executor.submit(_ready) for _ in range(self.workers)])
+
+    def __enter__(self) -> WorkerPool:  # noqa: PYI034 (false-positive)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        exc_traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def submit(
+        self,
+        func: Callable,
+        *,
+        args: Sequence | None = None,
+        kwargs: dict | None = None,
+        capture: Capture = Capture.BOTH,
+        stdin: str | None = None,
+        output_file: str | Path | None = None,
+        cwd: str | Path | None = None,
+        env: Mapping[str, str] | None = None,
+        env_overrides: Mapping[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> Future[tuple[int, bytes | SeparateOutput, bool]]:
+        """Submit a function to the pool.
+
+        Parameters:
+            func: The function to run.
+            args: Positional arguments passed to the function.
+            kwargs: Keyword arguments passed to the function.
+            capture: The output to capture.
+            stdin: String to use as standard input.
+            output_file: A file to write the captured output to. Only its last lines are then returned.
+            cwd: The working directory to run the function in.
+            env: The environment to run the function in.
+            env_overrides: Environment variables to set on top of `env` (or the worker environment).
+            timeout: The maximum duration of the function, in seconds.
+                It is interrupted in the worker, which stays available for other functions.
+
+        Results of [cached lazy callables][failprint.lazy] are sent back from workers,
+        and stored in their cache in this process.
+
+        Returns:
+            A future resolving to the exit code, the raw function output, and whether the function timed out.
+        """
+        # Like in this process, lazy callables called with arguments are not cached.
+        key = None if args or kwargs else _cache_key(func)
+        future = self._executor.submit(
+            _run_recording_in_worker,
+            func,
+            record=key is not None,
+            args=args,
+            kwargs=kwargs,
+            capture=capture,
+            stdin=stdin,
+            output_file=output_file,
+            cwd=cwd,
+            env=env,
+            env_overrides=env_overrides,
+            timeout=timeout,
+        )
+        result: Future[tuple[int, bytes | SeparateOutput, bool]] = Future()
+
+        def store(done: Future) -> None:
+            try:
+                code, output, timed_out, (found, value) = done.result()
+            except BaseException as error:  # noqa: BLE001
+                result.set_exception(error)
+                return
+            if found:
+                func.cache.store(key, value)  # ty: ignore[unresolved-attribute]
+            result.set_result((code, output, timed_out))
+
+        future.add_done_callback(store)
+        return result
+
+    def run_function(
+        self,
+        func: Callable,
+        *,
+        args: Sequence | None = None,
+        kwargs: dict | None = None,
+        capture: Capture = Capture.BOTH,
+        stdin: str | None = None,
+        binary: bool = False,
+        output_file: str | Path | None = None,
+        cwd: str | Path | None = None,
+        env: Mapping[str, str] | None = None,
+        env_overrides: Mapping[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> tuple[int, str | bytes | SeparateOutput]:
+        """Run a function in a worker process, and wait for its result.
+
+        This method has the same signature as [`run_function`][failprint.run_function],
+        with additional parameters to change the working directory and environment of the worker
+        for the duration of the call.
+
+        Parameters:
+            func: The function to run.
+            args: Positional arguments passed to the function.
+            kwargs: Keyword arguments passed to the function.
+            capture: The output to capture.
+            stdin: String to use as standard input.
+            binary: Whether to return the output as raw bytes instead of decoding it.
+            output_file: A file to write the captured output to. Only its last lines are then returned.
+            cwd: The working directory to run the function in.
+            env: The environment to run the function in.
+            env_overrides: Environment variables to set on top of `env` (or the worker environment).
+            timeout: The maximum duration of the function, in seconds.
+
+        Returns:
+            The exit code and the function output.
+        """
+        code, output, _ = self._run_function(
+            func,
+            args=args,
+            kwargs=kwargs,
+            capture=capture,
+            stdin=stdin,
+            binary=binary,
+            output_file=output_file,
+            cwd=cwd,
+            env=env,
+            env_overrides=env_overrides,
+            timeout=timeout,
+        )
+        return code, output
+
+    def _run_function(
+        self,
+        func: Callable,
+        *,
+        args: Sequence | None = None,
+        kwargs: dict | None = None,
+        capture: Capture = Capture.BOTH,
+        stdin: str | None = None,
+        binary: bool = False,
+        output_file: str | Path | None = None,
+        cwd: str | Path | None = None,
+        env: Mapping[str, str] | None = None,
+        env_overrides: Mapping[str, str] | None = None,
+        timeout: float | None = None,
+    ) -> tuple[int, str | bytes | SeparateOutput, bool]:
+        code, output, timed_out = self.submit(
+            func,
+            args=args,
+            kwargs=kwargs,
+            capture=capture,
+            stdin=stdin,
+            output_file=output_file,
+            cwd=cwd,
+            env=env,
+            env_overrides=env_overrides,
+            timeout=timeout,
+        ).result()
+        if binary or not isinstance(output, bytes):
+            return code, output, timed_out
+        return code, _decode(output), timed_out
+
+    def close(self) -> None:
+        """Stop the worker processes, after they finish running submitted functions."""
+        self._executor.shutdown()
@@ -1 +1,31 @@
 """Configuration for the pytest test suite."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from failprint._internal.formats import _plugin_formats
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache(tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """Keep caches written during tests out of the user's cache directory.
+
+    Parameters:
+        tmp_path_factory: Pytest fixture providing temporary directories.
+        monkeypatch: Pytest fixture to patch objects.
+
+    Yields:
+        Nothing.
+    """
+    cache_dir: Path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("FAILPRINT_CACHE_DIR", str(cache_dir))
+    _plugin_formats.cache_clear()
+    yield
+    _plugin_formats.cache_clear()
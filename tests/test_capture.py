@@ -2,9 +2,13 @@
 
 from __future__ import annotations
 
+import os
+import sys
+import time
+
 import pytest
 
-from failprint._internal.capture import Capture
+from failprint._internal.capture import Capture, CaptureManager
 
 
 @pytest.mark.parametrize(
@@ -14,6 +18,7 @@ from failprint._internal.capture import Capture
         ("stderr", Capture.STDERR),
         ("both", Capture.BOTH),
         ("none", Capture.NONE),
+        ("separate", Capture.SEPARATE),
         (True, Capture.BOTH),
         (False, Capture.NONE),
         (Capture.STDOUT, Capture.STDOUT),
@@ -31,3 +36,38 @@ def test_cast_string(value: str | bool | Capture, expected: Capture) -> None:
         expected: The value to expect.
     """
     assert Capture.cast(value) == expected
+
+
+def test_capture_raw_bytes(capsys: pytest.CaptureFixture) -> None:
+    """Keep captured output as bytes, decode it only when accessed.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    with capsys.disabled(), CaptureManager(Capture.STDOUT) as captured:
+        os.write(sys.stdout.fileno(), b"\xffbinary\r\n")
+    assert captured.raw == b"\xffbinary\n"
+    assert captured.output == "\ufffdbinary\n"
+
+
+def test_access_output_before_finishing() -> None:
+    """Refuse to return output before capture is finished."""
+    with CaptureManager(Capture.STDOUT) as captured, pytest.raises(RuntimeError):
+        captured.raw  # noqa: B018
+
+
+def test_capture_separately(capsys: pytest.CaptureFixture) -> None:
+    """Capture standard output and error separately, keeping their order.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    with capsys.disabled(), CaptureManager(Capture.SEPARATE) as captured:
+        for index in range(3):
+            os.write(sys.stdout.fileno(), f"out{index}\n".encode())
+            time.sleep(0.01)
+            os.write(sys.stderr.fileno(), f"err{index}\n".encode())
+            time.sleep(0.01)
+    assert captured.separate.stdout == "out0\nout1\nout2\n"
+    assert captured.separate.stderr == "err0\nerr1\nerr2\n"
+    assert captured.output == "out0\nerr0\nout1\nerr1\nout2\nerr2\n"
@@ -2,12 +2,19 @@
 
 from __future__ import annotations
 
+import io
+import json
+import os
 import sys
+from typing import TYPE_CHECKING
 
 import pytest
 
 from failprint._internal import debug
-from failprint._internal.cli import main
+from failprint._internal.cli import _cpu_sets, _parse_cpus, main
+
+if TYPE_CHECKING:
+    from pathlib import Path
 
 
 def test_fail_without_arguments() -> None:
@@ -69,3 +76,176 @@ def test_show_debug_info(capsys: pytest.CaptureFixture) -> None:
     assert "system" in captured
     assert "environment" in captured
     assert "packages" in captured
+
+
+@pytest.mark.timeout(5, method="thread")
+def test_fail_on_pattern(capsys: pytest.CaptureFixture) -> None:
+    """Stop a command early when its output matches a pattern.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    script = "import time; print('Traceback', flush=True); time.sleep(30)"
+    assert main(["--no-progress", "--fail-on", "^Traceback", "--", sys.executable, "-c", script]) != 0
+    assert "fail-on pattern" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("jobs", ["1", "3"])
+def test_run_commands_from_file(tmp_path: Path, capsys: pytest.CaptureFixture, jobs: str) -> None:
+    """Run commands read from a file, in order, numbered automatically.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        capsys: Pytest fixture to capture output.
+        jobs: Number of parallel jobs.
+    """
+    commands = tmp_path / "commands.txt"
+    commands.write_text(
+        "# comment\necho one\n\n-t 'second check' -- echo two && exit 3\n-z -- false\n",
+    )
+    assert main(["-f", "tap", "-j", jobs, "--from-file", str(commands)]) == 3
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "ok 1 - echo one"
+    assert lines[1] == "not ok 2 - second check"
+    assert lines[-1] == "not ok 3 - false"
+
+
+def test_run_commands_from_stdin(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture) -> None:
+    """Run commands read from standard input.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+        capsys: Pytest fixture to capture output.
+    """
+    monkeypatch.setattr("sys.stdin", io.StringIO("true\n-n 5 -- echo hello\n"))
+    assert main(["-f", "tap", "--stdin-commands"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["ok 1 - true", "ok 5 - echo hello"]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--stdin-commands", "true"],
+        ["-j", "0", "true"],
+    ],
+)
+def test_invalid_multiple_commands_usage(args: list[str]) -> None:
+    """Reject invalid combinations of options.
+
+    Parameters:
+        args: Command line arguments.
+    """
+    with pytest.raises(SystemExit):
+        main(args)
+
+
+def test_output_files_of_multiple_commands(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Reject a single output file for several commands, but accept one per command.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    monkeypatch.setattr("sys.stdin", io.StringIO("echo one\necho two\n"))
+    with pytest.raises(SystemExit):
+        main(["--stdin-commands", "-j", "2", "--output-file", str(tmp_path / "out.log")])
+
+    one, two = tmp_path / "one.log", tmp_path / "two.log"
+    monkeypatch.setattr("sys.stdin", io.StringIO(f"--output-file {one} -- echo one\n--output-file {two} -- echo two\n"))
+    assert main(["--stdin-commands", "-j", "2", "-s"]) == 0
+    assert one.read_text() == "one\n"
+    assert two.read_text() == "two\n"
+
+
+def test_reject_options_without_command(tmp_path: Path) -> None:
+    """Reject lines with options but no command.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    commands = tmp_path / "commands.txt"
+    commands.write_text("-t title\n")
+    with pytest.raises(SystemExit):
+        main(["--from-file", str(commands)])
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="no resource limits on Windows")
+def test_limit_resources(capsys: pytest.CaptureFixture) -> None:
+    """Limit resources of commands from the command line.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    code = main(
+        [
+            "--max-files",
+            "32",
+            "--max-memory",
+            "1G",
+            "--",
+            sys.executable,
+            "-c",
+            "import os; [os.open(os.devnull, os.O_RDONLY) for _ in range(64)]",
+        ],
+    )
+    assert code == 1
+    assert "Too many open files" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("size", ["1x", "G", "-1"])
+def test_reject_invalid_memory_sizes(size: str) -> None:
+    """Reject invalid memory sizes.
+
+    Parameters:
+        size: The invalid size.
+    """
+    with pytest.raises(SystemExit):
+        main(["--max-memory", size, "true"])
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [("0", {0}), ("0-3", {0, 1, 2, 3}), ("0,2,4-5", {0, 2, 4, 5})],
+)
+def test_parse_cpu_lists(value: str, expected: set[int]) -> None:
+    """Parse CPU lists.
+
+    Parameters:
+        value: The CPU list.
+        expected: The parsed CPUs.
+    """
+    assert _parse_cpus(value) == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="CPU affinity is only supported on Linux")
+@pytest.mark.parametrize("jobs", [1, 2, 3, 64])
+def test_spread_cpus_across_jobs(jobs: int) -> None:
+    """Give each job a contiguous set of CPUs, disjoint when there are enough CPUs.
+
+    Parameters:
+        jobs: The number of parallel jobs.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    cpu_sets = _cpu_sets(jobs)
+    assert len(cpu_sets) == jobs
+    assert all(cpu_set and cpu_set <= set(cpus) for cpu_set in cpu_sets)
+    if jobs <= len(cpus):
+        assert sorted(cpu for cpu_set in cpu_sets for cpu in cpu_set) == cpus
+
+
+@pytest.mark.skipif(not hasattr(os, "sched_getaffinity"), reason="CPU affinity is only supported on Linux")
+def test_run_parallel_commands_on_spread_cpus(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    """Run parallel commands on their own CPU sets, or on the ones they ask for.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        capsys: Pytest fixture to capture output.
+    """
+    show_cpus = f"{sys.executable} -c 'import os; print(sorted(os.sched_getaffinity(0))); raise SystemExit(1)'"
+    cpu = min(os.sched_getaffinity(0))
+    commands = tmp_path / "commands.txt"
+    commands.write_text(f"{show_cpus}\n--cpu-affinity {cpu} --nice 1 -- {show_cpus}\n")
+    assert main(["-f", "tap", "-j", "2", "--spread-cpus", "--from-file", str(commands)]) == 1
+    outputs = [line.strip() for line in capsys.readouterr().out.splitlines() if line.strip().startswith("[")]
+    assert outputs[1] == f"[{cpu}]"
+    assert set(json.loads(outputs[0])) in _cpu_sets(2)
@@ -0,0 +1,71 @@
+"""Tests for the `compact` module."""
+
+from __future__ import annotations
+
+import sys
+
+import pytest
+
+from failprint._internal.compact import compact_output
+from failprint._internal.runners import run
+
+
+@pytest.mark.parametrize(
+    ("output", "expected"),
+    [
+        ("", ""),
+        ("a\nb\n", "a\nb\n"),
+        ("a\nb", "a\nb"),
+        ("a\na\nb\n", "a\na\nb\n"),
+        ("a\na\na\na\nb\n", "a\n... repeated 3 more times\nb\n"),
+        ("0%\r50%\r100%\n", "100%\n"),
+        ("downloading\rdone\n", "doneloading\n"),
+        ("1/3\r2/3\r3/3\n1/3\r2/3\r3/3\n", "3/3\n3/3\n"),
+        ("50%\r100%\n" * 5, "100%\n... repeated 4 more times\n"),
+    ],
+)
+def test_compact_output(output: str, expected: str) -> None:
+    """Collapse repeated lines and overwritten frames.
+
+    Parameters:
+        output: The output to compact.
+        expected: The expected compacted output.
+    """
+    assert compact_output(output) == expected
+
+
+def test_strip_ansi_sequences() -> None:
+    """Strip ANSI sequences only when asked to."""
+    output = "\x1b[1;31merror\x1b[0m\n\x1b]8;;https://example.com\x07link\x1b]8;;\x07\n"
+    assert compact_output(output, strip_ansi=True) == "error\nlink\n"
+    assert compact_output(output) == output
+
+
+def test_run_with_compact_output(capsys: pytest.CaptureFixture) -> None:
+    """Print compacted output, but keep the original one in the result.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    script = "import sys; print('warning\\n' * 100, end=''); sys.exit(1)"
+    result = run([sys.executable, "-c", script], compact=True, fmt="tap")
+    assert result.output == "warning\n" * 100
+    outerr = capsys.readouterr()
+    assert outerr.out.splitlines().count("    warning") == 1
+    assert "... repeated 99 more times" in outerr.out
+
+
+@pytest.mark.parametrize("pty", [False, True])
+def test_run_with_compact_progress_frames(capsys: pytest.CaptureFixture, pty: bool) -> None:
+    """Collapse progress frames overwritten with carriage returns, with or without a PTY.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+        pty: Whether to run the command in a PTY.
+    """
+    script = "import sys; print('10%\\r50%\\r100%'); sys.exit(1)"
+    result = run([sys.executable, "-c", script], compact=True, fmt="tap", pty=pty)
+    assert result.output == "10%\r50%\r100%\n"
+    outerr = capsys.readouterr()
+    assert "    100%\n" in outerr.out
+    assert "\r" not in outerr.out
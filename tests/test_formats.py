@@ -2,18 +2,35 @@
 
 from __future__ import annotations
 
+import pickle
 import sys
-from typing import TYPE_CHECKING, Callable
+from importlib.metadata import EntryPoint
+from typing import TYPE_CHECKING, Any, Callable
 
 import pytest
 from hypothesis import given
-from hypothesis.strategies import text
+from hypothesis.strategies import booleans, integers, none, one_of, sampled_from, text
 
-from failprint._internal.formats import _DEFAULT_CALLABLE_NAME, _GT, _LT, _get_callable_name, printable_command
+from failprint._internal.cli import main
+from failprint._internal.formats import (
+    _DEFAULT_CALLABLE_NAME,
+    _GT,
+    _LT,
+    _PRETTY_PROGRESS_TEMPLATE,
+    _PRETTY_TEMPLATE,
+    _TAP_TEMPLATE,
+    Format,
+    _get_callable_name,
+    _load_format,
+    _plugin_formats,
+    formats,
+    printable_command,
+)
 from failprint._internal.runners import run
 
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    from collections.abc import Iterator, Mapping, Sequence
+    from pathlib import Path
 
 
 @pytest.mark.parametrize(
@@ -152,3 +169,172 @@ def test_escaping_and_unescaping_command_and_output(capsys: pytest.CaptureFixtur
     assert "<l num=0>hello</l>" in outerr.out
     assert _LT not in outerr.out
     assert _GT not in outerr.out
+
+
+def test_pickle_formats() -> None:
+    """Pickle slotted formats."""
+    unpickled = pickle.loads(pickle.dumps(formats["tap"]))  # noqa: S301
+    assert not hasattr(unpickled, "__dict__")
+    assert unpickled.template == formats["tap"].template
+    assert unpickled.accept_ansi is False
+
+
+# Templates escape `<` and `>` into sentinels then unescape them after parsing markup,
+# mangling text that already contains sentinels: render functions print such text as is.
+_plain_text = text(alphabet=sampled_from("ab <>/\n\t#FAILPRINT_LT#")).filter(lambda value: "FAILPRINT_" not in value)
+# Titles are markup: plain text titles must not contain tags (like `<b>`), which would be unbalanced.
+_titles = one_of(
+    none(),
+    _plain_text.filter(lambda value: "<" not in value),
+    sampled_from(["<red>title</red>", "a <b>bold</b> title", "<i>x</i> > y"]),
+)
+
+
+@given(
+    title=_titles,
+    command=_plain_text,
+    code=integers(min_value=-1, max_value=2),
+    number=integers(min_value=0, max_value=10),
+    output=_plain_text,
+    nofail=booleans(),
+    quiet=booleans(),
+)
+def test_render_functions_match_templates(
+    *,
+    title: str | None,
+    command: str,
+    code: int,
+    number: int,
+    output: str,
+    nofail: bool,
+    quiet: bool,
+) -> None:
+    """Render built-in formats exactly like the templates they replace.
+
+    Parameters:
+        title: The title.
+        command: The command.
+        code: The exit code.
+        number: The command number.
+        output: The output.
+        nofail: Whether failures are ignored.
+        quiet: Whether output is hidden.
+    """
+    context = {
+        "title": title,
+        "command": command,
+        "code": code,
+        "success": code == 0,
+        "failure": code != 0,
+        "number": number,
+        "output": output,
+        "nofail": nofail,
+        "quiet": quiet,
+    }
+    pretty = formats["pretty"]
+    assert pretty.render(context) == Format(_PRETTY_TEMPLATE).render(context)
+    # The raw format copies output as is, without unescaping it like templates: only compare what precedes it.
+    raw_template = Format(_PRETTY_TEMPLATE.replace("|indent(2 * ' ')", ""))
+    expected_raw = raw_template.render({**context, "output": "\0" if output else ""}).replace("\0", output)
+    assert formats["raw"].render(context) == expected_raw
+    assert pretty.render_progress(context) == Format("", progress_template=_PRETTY_PROGRESS_TEMPLATE).render_progress(
+        context,
+    )
+    # The TAP template does not escape commands and outputs: tags in them would be interpreted.
+    if "<" not in command and "<" not in output:
+        assert formats["tap"].render(context) == Format(_TAP_TEMPLATE).render(context)
+
+
+def test_render_tap_tags_verbatim() -> None:
+    """Print tag-like text in TAP commands and outputs as is."""
+    context = {"title": None, "command": "echo </b>", "failure": True, "number": 1, "output": "<b>\n"}
+    assert formats["tap"].render(context) == "not ok 1 - echo </b>\n  ---\n  output: |\n    <b>\n\n  ..."
+
+
+def test_custom_templates_still_use_jinja() -> None:
+    """Render custom templates with Jinja and ansimarkup."""
+    assert Format("<bold>{{ title|e }}</bold>").render({"title": "<x>"}) == "\x1b[1m<x>\x1b[0m"
+
+
+def render_plugin(context: Mapping[str, Any]) -> str:
+    """Render results for the plugin test format.
+
+    Parameters:
+        context: The template context.
+
+    Returns:
+        The rendered text.
+    """
+    return f"plugin: {context['command']} ({context['code']})"
+
+
+@pytest.fixture(name="plugin")
+def fixture_plugin(monkeypatch: pytest.MonkeyPatch) -> Iterator[list[str]]:
+    """Declare a plugin format through entry points.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+
+    Yields:
+        The list of entry point scans.
+    """
+    scans = []
+
+    def entry_points(group: str) -> list[EntryPoint]:
+        scans.append(group)
+        return [EntryPoint(name="plugin", value=f"{__name__}:render_plugin", group=group)]
+
+    monkeypatch.setattr("failprint._internal.formats.entry_points", entry_points)
+    yield scans
+    formats.pop("plugin", None)
+
+
+def test_load_plugin_formats_lazily(plugin: list[str], capsys: pytest.CaptureFixture) -> None:
+    """Load formats declared as entry points only when requested.
+
+    Parameters:
+        plugin: Fixture declaring a plugin format.
+        capsys: Pytest fixture to capture output.
+    """
+    assert _load_format("tap") is formats["tap"]
+    assert not plugin
+    assert main(["-f", "plugin", "true"]) == 0
+    assert capsys.readouterr().out == "plugin: true (0)\n"
+    assert plugin == ["failprint.formats"]
+    assert _load_format("missing") is None
+
+
+def test_cache_entry_point_scans(plugin: list[str], tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Cache entry point scans on disk, until the environment changes.
+
+    Parameters:
+        plugin: Fixture declaring a plugin format.
+        tmp_path: Pytest fixture providing a temporary directory.
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    assert "plugin" in _plugin_formats()
+    _plugin_formats.cache_clear()
+    assert "plugin" in _plugin_formats()
+    assert len(plugin) == 1
+
+    monkeypatch.syspath_prepend(str(tmp_path))
+    _plugin_formats.cache_clear()
+    assert "plugin" in _plugin_formats()
+    assert len(plugin) == 2
+
+
+def test_stream_large_outputs_in_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Indent and stream large outputs block by block, on line boundaries.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    monkeypatch.setattr("failprint._internal.formats._CHUNK_SIZE", 10)
+    output = "".join(f"line {number}\n" for number in range(20))
+    context = {"title": None, "command": "cmd", "code": 1, "success": False, "failure": True, "number": 1}
+    context.update(output=output, nofail=False, quiet=False)
+    chunks = list(formats["pretty"].stream(context))
+    assert len(chunks) > 3
+    assert all(chunk.endswith("\n") for chunk in chunks[:-1])
+    assert "".join(chunks) == Format(_PRETTY_TEMPLATE).render(context)
+    assert "".join(formats["tap"].stream(context)) == Format(_TAP_TEMPLATE).render(context)
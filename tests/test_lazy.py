@@ -1,6 +1,21 @@
-"""Tests for the `runners` module."""
+"""Tests for the `lazy` module."""
 
-from failprint._internal.lazy import LazyCallable, lazy
+from __future__ import annotations
+
+import functools
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from failprint._internal import lazy as lazy_module
+from failprint._internal.lazy import LazyCallable, ResultCache, lazy
+from failprint._internal.runners import run
+
+if TYPE_CHECKING:
+    import pytest
 
 
 def test_decorating_function() -> None:
@@ -35,3 +50,172 @@ def test_lazifying_function() -> None:
     non_lazy = lazy_greet()
     assert isinstance(non_lazy, LazyCallable)
     assert non_lazy.name == "lazy_greet"
+
+
+_calls: list[str] = []
+
+
+def _record_check(name: str, *, strict: bool = False) -> bool:
+    _calls.append(name)
+    print(f"checking {name}")
+    return strict
+
+
+class _Checker:
+    def __init__(self, value: bool) -> None:
+        self.value = value
+
+    def check(self) -> bool:
+        return self.value
+
+
+def test_caching_results() -> None:
+    """Reuse results of lazy callables called with the same arguments."""
+    _calls.clear()
+    check = lazy(_record_check, cache=ResultCache())
+    assert check("a")() is False
+    assert check("a")() is False
+    assert check("a", strict=True)() is True
+    assert check("b")() is False
+    assert _calls == ["a", "a", "b"]
+
+
+def test_identifying_callables() -> None:
+    """Only hash callables that can be told apart."""
+    cache = ResultCache()
+    assert lazy(lambda: False, cache=cache)().cache_key is None
+    assert lazy(functools.partial(_record_check, "a"), cache=cache)().cache_key is None
+
+    def local_check() -> bool: ...  # pragma: no cover
+
+    assert lazy(local_check, cache=cache)().cache_key is None
+    assert lazy(_record_check, cache=cache)("a").cache_key is not None
+
+    false_check = lazy(_Checker(False).check, cache=cache)()  # noqa: FBT003
+    true_check = lazy(_Checker(True).check, cache=cache)()  # noqa: FBT003
+    assert false_check.cache_key is not None
+    assert false_check.cache_key != true_check.cache_key
+    assert false_check() is False
+    assert true_check() is True
+
+
+def test_evicting_least_recently_used_results() -> None:
+    """Evict least recently used results when the cache is full."""
+    cache = ResultCache(2)
+    cache.store("a", 1)
+    cache.store("b", 2)
+    assert cache.lookup("a") == (True, 1)
+    cache.store("c", 3)
+    assert len(cache) == 2
+    assert cache.lookup("b") == (False, None)
+    assert cache.lookup("a") == (True, 1)
+
+
+def test_expiring_results(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Discard results older than the cache time-to-live.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    now = 1000.0
+    monkeypatch.setattr(lazy_module.time, "time", lambda: now)
+    cache = ResultCache(ttl=10)
+    cache.store("a", 1)
+    now += 10
+    assert cache.lookup("a") == (True, 1)
+    now += 1
+    assert cache.lookup("a") == (False, None)
+    assert len(cache) == 0
+
+
+def test_persisting_results(tmp_path: Path) -> None:
+    """Persist results on disk, to reuse them from other caches.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    ResultCache(path=tmp_path).store("a", {"x": 1})
+    cache = ResultCache(path=tmp_path)
+    assert cache.lookup("a") == (True, {"x": 1})
+    cache.store("b", lambda: None)
+    assert not (tmp_path / "results" / "b").exists()
+    assert cache.lookup("b")[0]
+    (tmp_path / "notes.txt").write_text("keep me")
+    cache.clear()
+    assert ResultCache(path=tmp_path).lookup("a") == (False, None)
+    assert (tmp_path / "notes.txt").read_text() == "keep me"
+
+
+def test_hashing_arguments_canonically() -> None:
+    """Hash equal arguments the same way in every process, whatever their hash seed."""
+    script = (
+        "from failprint._internal.lazy import LazyCallable; import os.path; "
+        "print(LazyCallable(os.path.join, [frozenset('abcdef')], {'b': {'x', 'y'}, 'a': 1}).cache_key)"
+    )
+    keys = {
+        subprocess.run(  # noqa: S603
+            [sys.executable, "-c", script],
+            env={**os.environ, "PYTHONHASHSEED": str(seed)},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in range(1, 4)
+    }
+    assert len(keys) == 1
+    assert len(keys.pop().strip()) == 64
+    assert LazyCallable(_record_check, [{"a": 1, "b": 2}], {}).cache_key == (
+        LazyCallable(_record_check, [{"b": 2, "a": 1}], {}).cache_key
+    )
+    assert LazyCallable(_record_check, [1], {}).cache_key != LazyCallable(_record_check, [True], {}).cache_key
+    assert LazyCallable(_record_check, [Path("a")], {}).cache_key is not None
+    assert LazyCallable(_record_check, [_Checker(True)], {}).cache_key is not None  # noqa: FBT003
+    assert LazyCallable(_record_check, [threading.Lock()], {}).cache_key is None
+
+
+def test_not_caching_unhashable_arguments() -> None:
+    """Call lazy callables every time when their arguments cannot be hashed."""
+    calls = []
+
+    def check(arg: object) -> None:
+        calls.append(arg)
+
+    unpicklable = lambda: None  # noqa: E731
+    cached_check = LazyCallable(check, [unpicklable], {}, cache=ResultCache())
+    assert cached_check.cache_key is None
+    cached_check()
+    cached_check()
+    assert len(calls) == 2
+
+
+def test_cached_copy() -> None:
+    """Create cached copies of lazy callables."""
+    lazy_check = lazy(_record_check)("a")
+    cache = ResultCache()
+    cached_check = lazy_check.cached(cache)
+    assert lazy_check.cache is None
+    assert cached_check.cache is cache
+    assert cached_check() is False
+    assert len(cache) == 1
+
+
+def test_reporting_cached_results(capfd: pytest.CaptureFixture) -> None:
+    """Report cached results without running lazy callables again.
+
+    Parameters:
+        capfd: Pytest fixture to capture output.
+    """
+    _calls.clear()
+    check = lazy(_record_check, cache=ResultCache())
+
+    result = run(check("a"), title="check")
+    assert not result.cached
+    assert result.code == 1
+    assert "checking a" in capfd.readouterr().out
+
+    result = run(check("a"), title="check")
+    assert result.cached
+    assert result.code == 1
+    assert result.output == ""
+    assert "\x1b[0m (cached) (1)" in capfd.readouterr().out
+    assert _calls == ["a"]
@@ -0,0 +1,94 @@
+"""Tests for the `metrics` module."""
+
+from __future__ import annotations
+
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from failprint._internal.cli import main
+from failprint._internal.lazy import lazy
+from failprint._internal.metrics import MetricsSink
+from failprint._internal.runners import run, run_many
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_aggregate_runs(tmp_path: Path) -> None:
+    """Aggregate counters and histograms by title.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    metrics_file = tmp_path / "failprint.prom"
+    with MetricsSink(metrics_file):
+        run(lambda: print("hello"), title="greet", silent=True)
+        run(lambda: print("hello"), title="greet", silent=True)
+        run(lambda: False, title="fail", silent=True)
+    run(lambda: True, title="ignored", silent=True)
+
+    metrics = metrics_file.read_text()
+    assert 'failprint_runs_total{title="greet",result="success"} 2' in metrics
+    assert 'failprint_runs_total{title="fail",result="failure"} 1' in metrics
+    assert 'failprint_run_duration_seconds_count{title="greet"} 2' in metrics
+    assert 'failprint_output_bytes_bucket{title="greet",le="1024"} 2' in metrics
+    assert 'failprint_output_bytes_sum{title="greet"} 12.0' in metrics
+    assert "ignored" not in metrics
+    assert [path.name for path in tmp_path.iterdir()] == ["failprint.prom"]
+
+
+@lazy
+def _greet(name: str) -> None:
+    print(f"hello {name}")
+
+
+def test_aggregate_batches(tmp_path: Path) -> None:
+    """Record batches as a single run, with the output size of all their callables.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    metrics_file = tmp_path / "failprint.prom"
+    with MetricsSink(metrics_file):
+        run_many(_greet.map(["tim", "tom"]), title="greetings", silent=True)  # ty: ignore[unresolved-attribute]
+    metrics = metrics_file.read_text()
+    assert 'failprint_runs_total{title="greetings",result="success"} 1' in metrics
+    assert 'failprint_output_bytes_sum{title="greetings"} 20.0' in metrics
+
+
+def test_escape_label_values(tmp_path: Path) -> None:
+    """Escape quotes, backslashes and newlines in titles.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    sink = MetricsSink(tmp_path / "failprint.prom")
+    sink.record('say "hi"\\\n', 0, 0.1, 10)
+    assert 'title="say \\"hi\\"\\\\\\n"' in sink.render()
+
+
+def test_cli_metrics_file(tmp_path: Path) -> None:
+    """Write metrics from the command line.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    metrics_file = tmp_path / "failprint.prom"
+    assert main(["-s", "-t", "check", "--metrics-file", str(metrics_file), "--", sys.executable, "-c", "pass"]) == 0
+    assert 'failprint_runs_total{title="check",result="success"} 1' in metrics_file.read_text()
+
+
+def test_write_periodically(tmp_path: Path) -> None:
+    """Write metrics on a timer, before the sink is closed.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    metrics_file = tmp_path / "failprint.prom"
+    with MetricsSink(metrics_file, interval=0.01):
+        run(lambda: True, title="tick", silent=True)
+        deadline = time.monotonic() + 5
+        while not (metrics_file.exists() and "tick" in metrics_file.read_text()):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
@@ -2,14 +2,29 @@
 
 from __future__ import annotations
 
+import os
+import signal
 import sys
+from shutil import which as shutil_which
+from typing import TYPE_CHECKING
 
 import pytest
 from hypothesis import given, settings
 from hypothesis.strategies import characters, text
 
+from failprint._internal import process
 from failprint._internal.capture import Capture
-from failprint._internal.process import WINDOWS, run_pty_subprocess, run_subprocess
+from failprint._internal.process import (
+    WINDOWS,
+    Limits,
+    _split_simple_command,
+    _which,
+    run_pty_subprocess,
+    run_subprocess,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
 
 
 def test_run_list_of_args_as_shell() -> None:
@@ -72,3 +87,275 @@ def test_pass_stdin_to_pty_subprocess(stdin: str) -> None:
     code, output = run_pty_subprocess(["cat"], stdin=stdin)
     assert code == 0
     assert output == stdin
+
+
+@pytest.mark.timeout(5, method="thread")
+def test_fail_on_terminates_subprocess() -> None:
+    """Terminate a subprocess as soon as its output matches the fail-on pattern."""
+    script = "import sys, time; print('starting'); print('FATAL: out of memory', flush=True); time.sleep(30)"
+    code, output = run_subprocess([sys.executable, "-c", script], fail_on=r"out of \w+")
+    assert code != 0
+    assert output.startswith("starting\nFATAL: out of memory\n")
+    assert "line 2, column 8" in output
+
+
+def test_fail_on_without_match() -> None:
+    """Keep the original exit code and output when the fail-on pattern never matches."""
+    code, output = run_subprocess([sys.executable, "-c", "print('all good')"], fail_on="FATAL")
+    assert code == 0
+    assert output == "all good\n"
+
+
+def test_fail_on_matches_last_line_without_newline() -> None:
+    """Match the last line of output even if it does not end with a newline."""
+    code, output = run_subprocess(
+        [sys.executable, "-c", "import sys; sys.stdout.write('ok\\nSegmentation fault')"],
+        fail_on="Segmentation",
+    )
+    assert code == 1
+    assert "line 2, column 1" in output
+
+
+@pytest.mark.skipif(WINDOWS, reason="no PTY support on Windows")
+@pytest.mark.timeout(5, method="thread")
+def test_fail_on_terminates_pty_subprocess() -> None:
+    """Terminate a PTY subprocess as soon as its output matches the fail-on pattern."""
+    code, output = run_pty_subprocess(["sh", "-c", "echo FATAL; sleep 30"], fail_on="^FATAL$")
+    assert code != 0
+    assert output.startswith("FATAL\n")
+    assert "line 1, column 1" in output
+
+
+def test_run_subprocess_as_bytes() -> None:
+    """Return raw bytes, with normalized newlines."""
+    script = "import sys; sys.stdout.buffer.write(b'\\xff\\r\\nok\\r\\n')"
+    code, output = run_subprocess([sys.executable, "-c", script], binary=True)
+    assert code == 0
+    assert output == b"\xff\nok\n"
+
+
+@pytest.mark.skipif(WINDOWS, reason="no PTY support on Windows")
+def test_run_pty_subprocess_as_bytes() -> None:
+    """Return raw bytes from a PTY subprocess."""
+    code, output = run_pty_subprocess(["printf", "\\377\\n"], binary=True)
+    assert code == 0
+    assert output == b"\xff\n"
+
+
+def test_run_subprocess_separately() -> None:
+    """Capture standard output and error separately."""
+    script = "import sys, time; print('out', flush=True); time.sleep(0.05); print('err', file=sys.stderr)"
+    code, output = run_subprocess([sys.executable, "-c", script], capture=Capture.SEPARATE)
+    assert code == 0
+    assert output.stdout == "out\n"
+    assert output.stderr == "err\n"
+    assert str(output) == "out\nerr\n"
+
+
+@pytest.mark.timeout(5, method="thread")
+def test_fail_on_with_separate_streams() -> None:
+    """Match the fail-on pattern in each stream separately."""
+    script = "import sys, time; print('fine'); print('x FATAL', file=sys.stderr, flush=True); time.sleep(30)"
+    code, output = run_subprocess([sys.executable, "-c", script], capture=Capture.SEPARATE, fail_on="FATAL")
+    assert code != 0
+    assert "stderr matched fail-on pattern 'FATAL' at line 1, column 3" in output.stderr
+
+
+@pytest.mark.parametrize(
+    ("cmd", "expected"),
+    [
+        ("echo hello", ["echo", "hello"]),
+        ("echo 'hello world' --flag=value", ["echo", "hello world", "--flag=value"]),
+        ("echo $HOME", None),
+        ("echo hello > file", None),
+        ("echo hello | cat", None),
+        ("echo *.py", None),
+        ("VAR=1 echo hello", None),
+        ("cd /tmp", None),
+        ("exit 1", None),
+        ("echo 'unbalanced", None),
+        ("failprint-missing-executable", None),
+        ("", None),
+    ],
+)
+def test_split_simple_commands(cmd: str, expected: list[str] | None) -> None:
+    """Only split commands that do not need a shell.
+
+    Parameters:
+        cmd: The command string.
+        expected: The expected arguments, or None if a shell is needed.
+    """
+    assert _split_simple_command(cmd) == expected
+
+
+def test_cache_executable_lookups(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Cache executable lookups, invalidated on PATH and executable changes.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    executable = tmp_path / ("failprint-tool.bat" if WINDOWS else "failprint-tool")
+    executable.write_text("")
+    executable.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path))
+    lookups = []
+
+    def which(name: str, path: str | None = None) -> str | None:
+        lookups.append(name)
+        return shutil_which(name, path=path)
+
+    monkeypatch.setattr("failprint._internal.process.shutil.which", which)
+    expected = _which("failprint-tool")
+    assert expected is not None
+    assert _which("failprint-tool") == expected
+    assert len(lookups) == 1
+
+    os.utime(executable, (0, 0))
+    assert _which("failprint-tool") == expected
+    assert len(lookups) == 2
+
+    monkeypatch.setenv("PATH", os.pathsep.join((str(tmp_path), os.defpath)))
+    assert _which("failprint-tool") == expected
+    assert len(lookups) == 3
+
+    executable.unlink()
+    assert _which("failprint-tool") is None
+
+
+_BUSY_LOOP = "while True: pass"
+_KILL_ITSELF = "import os, signal; os.kill(os.getpid(), signal.SIGKILL)"
+_OPEN_FILES = "import os; fds = [os.open(os.devnull, os.O_RDONLY) for _ in range(64)]"
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+@pytest.mark.parametrize("capture", [Capture.BOTH, Capture.SEPARATE])
+def test_kill_commands_exceeding_cpu_time_limit(capture: Capture) -> None:
+    """Kill commands exceeding their CPU time limit, and report it.
+
+    Parameters:
+        capture: The output to capture.
+    """
+    code, output = run_subprocess([sys.executable, "-c", _BUSY_LOOP], capture=capture, limits=Limits(cpu_seconds=1))
+    assert code == 152
+    assert "exceeded its CPU time limit (1s)" in str(output)
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+def test_kill_commands_ignoring_cpu_time_limit() -> None:
+    """Report commands killed by the hard CPU time limit, after ignoring the soft one."""
+    script = f"import signal\nsignal.signal(signal.SIGXCPU, signal.SIG_IGN)\n{_BUSY_LOOP}"
+    code, output = run_subprocess([sys.executable, "-c", script], limits=Limits(cpu_seconds=1))
+    assert code == 152
+    assert "exceeded its CPU time limit (1s)" in output
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+@pytest.mark.parametrize("pty", [False, True])
+def test_keep_signals_of_commands_killed_before_cpu_time_limit(pty: bool) -> None:
+    """Only report CPU time limits when commands killed by their signals actually used up their CPU time.
+
+    Parameters:
+        pty: Whether to run the command in a PTY.
+    """
+    runner = run_pty_subprocess if pty else run_subprocess
+    code, output = runner([sys.executable, "-c", _KILL_ITSELF], limits=Limits(cpu_seconds=100))
+    assert code == -signal.SIGKILL
+    assert "CPU time limit" not in output
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+def test_limit_open_files() -> None:
+    """Limit the number of files commands can open."""
+    code, output = run_subprocess([sys.executable, "-c", _OPEN_FILES], limits=Limits(files=32))
+    assert code == 1
+    assert "Too many open files" in output
+    assert run_subprocess([sys.executable, "-c", _OPEN_FILES])[0] == 0
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+def test_limit_memory() -> None:
+    """Limit the memory commands can allocate."""
+    allocate = "data = bytearray(1024**3)"
+    code, output = run_subprocess([sys.executable, "-c", allocate], limits=Limits(memory=512 * 1024**2))
+    assert code == 1
+    assert "MemoryError" in output
+
+
+@pytest.mark.skipif(WINDOWS, reason="no resource limits on Windows")
+def test_limit_commands_through_shell(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Set limits with a shell where `prlimit` is not available.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    monkeypatch.delattr(process.resource, "prlimit", raising=False)
+    code, output = run_subprocess([sys.executable, "-c", _OPEN_FILES], limits=Limits(files=32))
+    assert code == 1
+    assert "Too many open files" in output
+    code, output = run_subprocess(f"{sys.executable} -c '{_BUSY_LOOP}'", shell=True, limits=Limits(cpu_seconds=1))  # noqa: S604
+    assert code == 152
+
+
+@pytest.mark.skipif(WINDOWS, reason="no PTY support on Windows")
+def test_limit_pty_subprocess() -> None:
+    """Limit commands running in a PTY."""
+    code, output = run_pty_subprocess([sys.executable, "-c", _BUSY_LOOP], limits=Limits(cpu_seconds=1))
+    assert code == 152
+    assert "exceeded its CPU time limit" in output
+
+
+_LINUX = sys.platform.startswith("linux")
+
+
+@pytest.mark.skipif(WINDOWS, reason="no scheduling options on Windows")
+@pytest.mark.parametrize("pty", [False, True])
+def test_lower_command_priority(pty: bool) -> None:
+    """Lower the priority of commands.
+
+    Parameters:
+        pty: Whether to run the command in a PTY.
+    """
+    runner = run_pty_subprocess if pty else run_subprocess
+    code, output = runner([sys.executable, "-c", "import os; print(os.nice(0))"], nice=5)
+    assert code == 0
+    assert int(output) == os.nice(0) + 5
+
+
+@pytest.mark.skipif(not _LINUX, reason="CPU affinity is only supported on Linux")
+def test_set_command_cpu_affinity() -> None:
+    """Run commands on specific CPUs."""
+    cpu = min(os.sched_getaffinity(0))
+    code, output = run_subprocess(
+        [sys.executable, "-c", "import os; print(os.sched_getaffinity(0))"],
+        cpu_affinity={cpu},
+    )
+    assert code == 0
+    assert output.strip() == str({cpu})
+
+
+@pytest.mark.skipif(not _LINUX or shutil_which("ionice") is None, reason="ionice is only available on Linux")
+@pytest.mark.parametrize(("ionice", "expected"), [("idle", "idle"), (7, "best-effort: prio 7")])
+def test_set_command_io_scheduling(ionice: int | str, expected: str) -> None:
+    """Set the I/O scheduling class of commands.
+
+    Parameters:
+        ionice: The I/O scheduling class.
+        expected: The class reported by the command.
+    """
+    code, output = run_subprocess("ionice", shell=True, ionice=ionice)  # noqa: S604
+    assert code == 0
+    assert output.strip() == expected
+
+
+@pytest.mark.parametrize("ionice", ["fast", "best-effort:8", "realtime:x"])
+def test_reject_invalid_io_scheduling(ionice: str) -> None:
+    """Reject invalid I/O scheduling classes.
+
+    Parameters:
+        ionice: The invalid I/O scheduling class.
+    """
+    if not _LINUX:
+        pytest.skip("I/O scheduling is only supported on Linux")
+    with pytest.raises(ValueError, match="Invalid I/O scheduling"):
+        run_subprocess(["true"], ionice=ionice)
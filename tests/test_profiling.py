@@ -0,0 +1,93 @@
+"""Tests for the `profiling` module."""
+
+from __future__ import annotations
+
+import json
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from failprint._internal.cli import main
+from failprint._internal.profiling import (
+    Profiler,
+    add_profiling_callback,
+    profile_phase,
+    remove_profiling_callback,
+)
+from failprint._internal.runners import run
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_disabled_phases_are_shared() -> None:
+    """Return the same no-op context manager when no callback is registered."""
+    assert profile_phase("a") is profile_phase("b")
+
+
+def test_callbacks_receive_phases() -> None:
+    """Call registered callbacks with phase names and timings."""
+    events = []
+
+    def callback(name: str, start: float, end: float) -> None:
+        events.append((name, start, end))
+
+    add_profiling_callback(callback)
+    try:
+        with profile_phase("custom"):
+            pass
+    finally:
+        remove_profiling_callback(callback)
+    with profile_phase("ignored"):
+        pass
+
+    assert len(events) == 1
+    name, start, end = events[0]
+    assert name == "custom"
+    assert start <= end
+
+
+@pytest.mark.parametrize(
+    ("cmd", "expected"),
+    [
+        ([sys.executable, "-c", "print('hello')"], {"spawn", "capture"}),
+        (lambda: print("hello"), {"redirect", "call", "read"}),
+    ],
+)
+def test_profile_run_phases(cmd: list[str], expected: set[str]) -> None:
+    """Collect timings for each phase of a run.
+
+    Parameters:
+        cmd: The command to run.
+        expected: Phases specific to the command type.
+    """
+    with Profiler() as profiler:
+        run(cmd, progress=False, nofail=True)
+    assert {"setup", "execute", "decode", "render", "print"} | expected <= profiler.summary().keys()
+
+
+def test_cli_profile_summary(capsys: pytest.CaptureFixture) -> None:
+    """Print a per-phase breakdown on standard error.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    assert main(["--profile", "--", sys.executable, "-c", "pass"]) == 0
+    err = capsys.readouterr().err
+    assert "phase" in err
+    assert "spawn" in err
+
+
+def test_cli_profile_trace(tmp_path: Path) -> None:
+    """Write a Chrome trace file.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    trace_file = tmp_path / "trace.json"
+    assert main(["--profile", str(trace_file), "--", sys.executable, "-c", "pass"]) == 0
+    trace = json.loads(trace_file.read_text())
+    names = {event["name"] for event in trace["traceEvents"]}
+    assert {"spawn", "render"} <= names
+    assert all(event["ph"] == "X" for event in trace["traceEvents"])
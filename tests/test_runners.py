@@ -1,18 +1,38 @@
 """Tests for the `runners` module."""
 
+from __future__ import annotations
+
+import asyncio
 import os
+import pickle
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING
 from unittest.mock import MagicMock, patch
 
 import pytest
 from hypothesis import given
 from hypothesis.strategies import characters, integers, text
 
-from failprint._internal.capture import Capture
+from failprint._internal.capture import Capture, _TaskStream
 from failprint._internal.lazy import lazy
 from failprint._internal.process import WINDOWS
-from failprint._internal.runners import run, run_function
+from failprint._internal.runners import (
+    CompactRunResult,
+    RunResult,
+    arun,
+    run,
+    run_command,
+    run_function,
+    run_many,
+)
+from failprint._internal.spool import Spool
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Iterator
 
 
 def test_run_silent_command_silently(capsys: pytest.CaptureFixture) -> None:
@@ -382,3 +402,448 @@ def test_capture_large_output() -> None:
 
     with Capture.BOTH.here():
         function()
+
+
+def test_run_command_with_invalid_utf8() -> None:
+    """Run a command printing invalid UTF-8 without crashing."""
+    script = "import sys; sys.stdout.buffer.write(b'ok \\xff\\xfe\\r\\n'); sys.exit(1)"
+    result = run([sys.executable, "-c", script], silent=True)
+    assert result.code == 1
+    assert result.raw_output == b"ok \xff\xfe\n"
+    assert result.output == "ok ��\n"
+
+
+def test_run_function_as_bytes() -> None:
+    """Capture the output of a function as raw bytes."""
+    code, output = run_function(lambda: sys.stdout.buffer.write(b"\xff\n") and 0, binary=True)
+    assert code == 0
+    assert output == b"\xff\n"
+
+
+def test_render_separate_streams(capsys: pytest.CaptureFixture) -> None:
+    """Expose separate streams to templates.
+
+    Arguments:
+        capsys: Pytest fixture to capture output.
+    """
+    script = "import sys; print('out'); print('err', file=sys.stderr)"
+    result = run(
+        [sys.executable, "-c", script],
+        capture="separate",
+        fmt="custom=[{{ stdout }}][{{ stderr }}]",
+        progress=False,
+    )
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert capsys.readouterr().out == "[out\n][err\n]\n"
+
+
+def test_run_function_with_separate_streams() -> None:
+    """Capture a function's standard output and error separately."""
+    result = run(lambda: print("out") or print("err", file=sys.stderr), capture="separate", silent=True)
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+
+
+@pytest.mark.skipif(WINDOWS, reason="POSIX shell syntax")
+@pytest.mark.parametrize("pty", [False, True])
+def test_run_simple_string_without_shell(pty: bool) -> None:
+    """Execute simple command strings directly, without a shell.
+
+    Parameters:
+        pty: Whether to run in a PTY.
+    """
+    with patch("failprint._internal.process.subprocess.Popen", wraps=subprocess.Popen) as popen:
+        code, output = run_command("echo hello", pty=pty, ansi=True)
+    assert code == 0
+    assert output == "hello\n"
+    if not pty:
+        assert popen.call_args.args[0] == ["echo", "hello"]
+        assert not popen.call_args.kwargs["shell"]
+
+
+@pytest.mark.skipif(WINDOWS, reason="POSIX shell syntax")
+@pytest.mark.parametrize(
+    ("cmd", "shell", "expected"),
+    [
+        ("echo $0", None, "sh"),
+        ("echo $0", False, "$0"),
+        (["echo", "$0"], True, "sh"),
+        (["echo", "$0"], None, "$0"),
+    ],
+)
+def test_force_shell_usage(cmd: str | list[str], shell: bool | None, expected: str) -> None:
+    """Force or prevent the use of a shell.
+
+    Parameters:
+        cmd: The command to run.
+        shell: Whether to use a shell.
+        expected: The expected output.
+    """
+    code, output = run_command(cmd, shell=shell)
+    assert code == 0
+    assert output.strip().endswith(expected)
+
+
+@pytest.mark.skipif(WINDOWS, reason="always enabled on Windows")
+def test_opt_in_executable_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Resolve executables before spawning them when opted in.
+
+    Parameters:
+        monkeypatch: Pytest fixture to patch objects.
+    """
+    monkeypatch.setenv("FAILPRINT_CACHE_EXECUTABLES", "1")
+    with patch("failprint._internal.process.subprocess.Popen", wraps=subprocess.Popen) as popen:
+        code, output = run_command(["echo", "hello"])
+    assert code == 0
+    assert output == "hello\n"
+    assert os.path.isabs(popen.call_args.args[0][0])  # noqa: PTH117
+
+
+@pytest.mark.parametrize("capture", [Capture.BOTH, Capture.SEPARATE])
+def test_compact_results(capture: Capture) -> None:
+    """Keep results compact and pickle-friendly.
+
+    Parameters:
+        capture: The output to capture.
+    """
+    result = run(lambda: print("hello"), capture=capture, silent=True)
+    compact = result.compact()
+    assert isinstance(compact, CompactRunResult)
+    assert compact.compact() is compact
+    assert compact.output == result.output == "hello\n"
+    assert compact.raw_output == b"hello\n"
+    assert not hasattr(compact, "__dict__")
+    for obj in (result, compact):
+        unpickled = pickle.loads(pickle.dumps(obj))  # noqa: S301
+        assert type(unpickled) is type(obj)
+        assert unpickled.code == obj.code
+        assert unpickled.output == obj.output
+
+
+@pytest.mark.parametrize("pty", [False, True])
+@pytest.mark.parametrize("cmd", ["pwd; echo $FAILPRINT_TEST", ["sh", "-c", "pwd; echo $FAILPRINT_TEST"]])
+@pytest.mark.skipif(WINDOWS, reason="POSIX shell syntax")
+def test_run_command_with_working_directory_and_environment(
+    tmp_path: Path,
+    cmd: str | list[str],
+    pty: bool,
+) -> None:
+    """Run commands in another directory, with environment overrides.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        cmd: The command to run.
+        pty: Whether to run in a PTY.
+    """
+    code, output = run_command(cmd, cwd=tmp_path, env_overrides={"FAILPRINT_TEST": "1"}, pty=pty)
+    assert code == 0
+    assert output.split() == [str(tmp_path), "1"]
+    assert "FAILPRINT_TEST" not in os.environ
+
+
+@pytest.mark.skipif(WINDOWS, reason="POSIX commands")
+def test_run_command_with_replaced_environment() -> None:
+    """Look up executables in the given environment."""
+    code, output = run_command(["env"], env={"PATH": os.environ["PATH"], "FAILPRINT_TEST": "1"})
+    assert code == 0
+    assert "FAILPRINT_TEST=1" in output.splitlines()
+
+
+def test_refuse_environment_for_callables() -> None:
+    """Refuse to change the working directory or environment of the current process."""
+    with pytest.raises(ValueError, match="worker pool"):
+        run(lambda: True, cwd="/", silent=True)
+
+
+def test_write_rendered_chunks_in_order(capfd: pytest.CaptureFixture) -> None:
+    """Write streamed results to the binary stdout buffer, after pending text.
+
+    Parameters:
+        capfd: Pytest fixture to capture output.
+    """
+    output = "\n".join(f"line {number}" for number in range(100_000))
+    print("before", end="")
+    run(lambda: print(output) or False, title="big", fmt="tap", number=1)
+    print("after")
+    captured = capfd.readouterr().out
+    assert captured.startswith("beforenot ok 1 - big\n  ---\n  command: <lambda>()\n  output: |\n    line 0\n")
+    assert captured.endswith("    line 99999\n\n  ...\nafter\n")
+
+
+@pytest.mark.parametrize("spooled", [False, True])
+def test_pass_raw_output_through(capfdbinary: pytest.CaptureFixture, spooled: bool) -> None:
+    """Copy output as is with passthrough formats, without decoding it.
+
+    Parameters:
+        capfdbinary: Pytest fixture to capture output as bytes.
+        spooled: Whether to store output in a spool.
+    """
+    output = b"invalid \xff utf8\n"
+    with Spool() as spool:
+        run(
+            [sys.executable, "-c", f"import sys; sys.stdout.buffer.write({output!r}); sys.exit(1)"],
+            fmt="raw",
+            title="raw",
+            spool=spool if spooled else None,
+        )
+    assert capfdbinary.readouterr().out.endswith(b"\n" + output + b"\n")
+
+
+async def _greet(name: str) -> int:
+    await asyncio.sleep(0)
+    print(f"hello {name}")
+    return 2
+
+
+def test_await_coroutine_functions() -> None:
+    """Await coroutines returned by functions."""
+    code, output = run_function(_greet, args=["tim"])
+    assert code == 2
+    assert output == "hello tim\n"
+
+
+_OPEN_FDS = Path("/proc/self/fd")
+
+
+@pytest.mark.skipif(not _OPEN_FDS.is_dir(), reason="open file descriptors are listed in /proc")
+def test_close_event_loops_of_finished_threads() -> None:
+    """Close the event loops of threads awaiting coroutines when they end."""
+
+    def open_fds() -> int:
+        return len(list(_OPEN_FDS.iterdir()))
+
+    def run_in_threads() -> None:
+        with ThreadPoolExecutor(4) as executor:
+            assert list(executor.map(lambda name: run_function(_greet, args=[name])[0], "abcd")) == [2, 2, 2, 2]
+
+    run_in_threads()
+    before = open_fds()
+    for _ in range(5):
+        run_in_threads()
+    assert open_fds() <= before
+
+
+def test_await_coroutines_from_running_loop() -> None:
+    """Await coroutines even when running from an event loop."""
+
+    async def main() -> int:
+        return run(_greet, args=["tim"], silent=True).code
+
+    assert asyncio.run(main()) == 2
+
+
+def test_stream_generator_chunks() -> None:
+    """Write chunks yielded by generators to standard output, and use their return value."""
+
+    def generate() -> Iterator[str | bytes]:
+        yield "text\n"
+        yield b"bytes\n"
+        return False
+
+    async def agenerate() -> AsyncIterator[str]:
+        for chunk in ("a", "b\n"):
+            await asyncio.sleep(0)
+            yield chunk
+
+    assert run_function(generate) == (1, "text\nbytes\n")
+    assert run_function(agenerate) == (0, "ab\n")
+
+
+def test_run_coroutines_concurrently(capsys: pytest.CaptureFixture) -> None:
+    """Overlap coroutines, capturing their output per task.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    started = []
+
+    async def check(name: str) -> bool:
+        started.append(name)
+        print(f"{name} out")
+        await asyncio.sleep(0.05)
+        # all checks started before any of them finished
+        print(f"{name} err {len(started)}", file=sys.stderr)
+        return name != "b"
+
+    async def main() -> list[RunResult]:
+        return await asyncio.gather(*(arun(check, args=[name], title=name, capture="separate") for name in "abc"))
+
+    results = asyncio.run(main())
+    assert [result.code for result in results] == [0, 1, 0]
+    assert [result.stdout for result in results] == ["a out\n", "b out\n", "c out\n"]
+    assert [result.stderr for result in results] == ["a err 3\n", "b err 3\n", "c err 3\n"]
+    assert "b out" in capsys.readouterr().out
+    assert not isinstance(sys.stdout, _TaskStream)
+
+
+def test_arun_commands_and_options() -> None:
+    """Run commands in threads, and pass options to callables."""
+
+    async def echo() -> None:
+        print(sys.stdin.read())
+        print("hidden", file=sys.stderr)
+
+    async def main() -> tuple[RunResult, RunResult]:
+        return await asyncio.gather(
+            arun([sys.executable, "-c", "print('command')"], silent=True),
+            arun(echo, stdin="input", capture=Capture.STDOUT, silent=True),
+        )
+
+    command_result, echo_result = asyncio.run(main())
+    assert command_result.output == "command\n"
+    assert echo_result.output == "input\n"
+
+    with pytest.raises(TypeError, match="unknown"):
+        asyncio.run(arun(echo, unknown=True))
+
+
+def _sleep(duration: float) -> None:
+    print("started", flush=True)
+    time.sleep(duration)
+    print("finished")
+
+
+def test_interrupt_functions_on_timeout() -> None:
+    """Interrupt functions with a signal on timeout, keeping output produced until then."""
+    result = run(_sleep, args=[5], timeout=0.1, silent=True)
+    assert result.timed_out
+    assert result.code == 124
+    assert result.output.startswith("started\n")
+    assert "timed out after 0.1 seconds" in result.output
+    assert "finished" not in result.output
+
+    result = run(_sleep, args=[0], timeout=5, silent=True)
+    assert not result.timed_out
+    assert result.code == 0
+
+
+def _sleep_catching_exceptions(duration: float) -> bool:
+    try:
+        time.sleep(duration)
+    except Exception:  # noqa: BLE001
+        print("timeout swallowed")
+    return True
+
+
+def test_interrupt_functions_catching_exceptions_on_timeout() -> None:
+    """Interrupt functions on timeout even when they catch exceptions."""
+    result = run(_sleep_catching_exceptions, args=[5], timeout=0.1, silent=True)
+    assert result.timed_out
+    assert result.code == 124
+    assert "swallowed" not in result.output
+
+
+def test_isolate_functions_with_timeout_in_threads() -> None:
+    """Run functions in a child process, to time them out outside the main thread."""
+    with ThreadPoolExecutor(1) as executor:
+        code, output = executor.submit(run_function, _sleep, args=[5], timeout=0.5).result()
+        assert code == 124
+        assert output.startswith("started\n")
+        assert "finished" not in output
+        assert executor.submit(run_function, _sleep, args=[0], timeout=5).result() == (0, "started\nfinished\n")
+
+
+def test_report_unpicklable_functions_with_timeout_in_threads() -> None:
+    """Report functions that cannot be sent to a child process."""
+    with ThreadPoolExecutor(1) as executor:
+        result = executor.submit(run, lambda: True, timeout=5, silent=True).result()
+    assert result.code == 1
+    assert "cannot send function to a child process" in result.output
+
+
+def test_run_blocking_callables_in_threads() -> None:
+    """Overlap blocking callables run by `arun`, and time them out."""
+
+    async def main() -> tuple[list[RunResult], float]:
+        start = time.monotonic()
+        results = await asyncio.gather(*(arun(_sleep, args=[1], silent=True) for _ in range(2)))
+        return results, time.monotonic() - start
+
+    results, elapsed = asyncio.run(main())
+    assert [result.output for result in results] == ["started\nfinished\n"] * 2
+    assert elapsed < 1.8
+
+    result = asyncio.run(arun(_sleep, args=[0.5], timeout=0.1, silent=True))
+    assert result.timed_out
+    assert result.code == 124
+    assert result.output.startswith("started\n")
+
+
+def test_time_out_coroutines() -> None:
+    """Cancel coroutines run by `arun` on timeout."""
+
+    async def sleep() -> None:
+        print("started")
+        await asyncio.sleep(5)
+
+    result = asyncio.run(arun(sleep, timeout=0.1, silent=True))
+    assert result.timed_out
+    assert result.code == 124
+    assert result.output.startswith("started\n")
+
+
+@lazy
+def _check_even(number: int) -> bool:
+    print(f"checking {number}")
+    return number % 2 == 0
+
+
+@pytest.mark.parametrize("jobs", [None, 4])
+def test_run_batches(capsys: pytest.CaptureFixture, jobs: int | None) -> None:
+    """Run batches of lazy callables, rendering failures and a summary only.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+        jobs: The number of threads.
+    """
+    results = run_many(_check_even.map(range(6), jobs=jobs), title="Checking numbers")  # ty: ignore[unresolved-attribute]
+    assert [result.code for result in results] == [0, 1, 0, 1, 0, 1]
+    assert [result.output for result in results] == [f"checking {number}\n" for number in range(6)]
+    out = capsys.readouterr().out
+    assert "checking 0" not in out
+    assert "_check_even(1)" in out
+    assert "checking 5" in out
+    assert "3 of 6 failed" in out
+    assert sys.stdout is not None
+    assert not isinstance(sys.stdout, _TaskStream)
+
+
+def test_run_batches_with_tap_format(capsys: pytest.CaptureFixture) -> None:
+    """Render every call of batches after a plan with the TAP format, and the summary as a comment.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    run_many(_check_even.map([0, 1, 2]), title="Checking numbers", fmt="tap")  # ty: ignore[unresolved-attribute]
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[:3] == ["1..3", "ok 1 - _check_even(0)", "not ok 2 - _check_even(1)"]
+    assert lines[-2:] == ["ok 3 - _check_even(2)", "# Checking numbers: 1 of 3 failed"]
+
+
+def test_run_successful_batch_silently(capsys: pytest.CaptureFixture) -> None:
+    """Run batches without printing anything when silent.
+
+    Parameters:
+        capsys: Pytest fixture to capture output.
+    """
+    results = run_many(_check_even.map([0, 2], jobs=2), silent=True)  # ty: ignore[unresolved-attribute]
+    assert all(result.code == 0 for result in results)
+    assert not capsys.readouterr().out
+
+
+@pytest.mark.skipif(WINDOWS, reason="runs on Linux only")
+@pytest.mark.parametrize("pty", [False, True])
+def test_run_scripts_without_shebang(tmp_path: Path, pty: bool) -> None:
+    """Run executable scripts without a shebang in a shell, like `sh -c` does.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        pty: Whether to run the script in a PTY.
+    """
+    script = tmp_path / "script"
+    script.write_text("echo hello\nexit 3\n")
+    script.chmod(0o755)
+    code, output = run_command(str(script), pty=pty, ansi=True)
+    assert code == 3
+    assert output.strip() == "hello"
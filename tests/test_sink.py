@@ -0,0 +1,101 @@
+"""Tests for the `sink` module."""
+
+from __future__ import annotations
+
+import gzip
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from failprint._internal.capture import Capture, CaptureManager
+from failprint._internal.process import WINDOWS, run_pty_subprocess, run_subprocess
+from failprint._internal.runners import run
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+_SCRIPT = "for i in range(10000): print(f'line {i}')"
+
+
+def _expected_tail(last: int = 20) -> str:
+    return "".join(f"line {i}\n" for i in range(10000 - last, 10000))
+
+
+@pytest.mark.parametrize("name", ["output.log", "output.log.gz"])
+@pytest.mark.parametrize("fail_on", [None, "NEVER"])
+def test_write_subprocess_output_to_file(tmp_path: Path, name: str, fail_on: str | None) -> None:
+    """Write output to a file, and only return its last lines.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        name: The output file name.
+        fail_on: A fail-on pattern.
+    """
+    output_file = tmp_path / name
+    code, output = run_subprocess([sys.executable, "-c", _SCRIPT], output_file=output_file, fail_on=fail_on)
+    assert code == 0
+    assert output == _expected_tail()
+    contents = gzip.decompress(output_file.read_bytes()) if name.endswith(".gz") else output_file.read_bytes()
+    assert contents.decode().splitlines() == [f"line {i}" for i in range(10000)]
+
+
+@pytest.mark.skipif(WINDOWS, reason="no PTY support on Windows")
+def test_write_pty_subprocess_output_to_file(tmp_path: Path) -> None:
+    """Write PTY output to a file.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    output_file = tmp_path / "output.log"
+    code, output = run_pty_subprocess([sys.executable, "-c", _SCRIPT], output_file=output_file)
+    assert code == 0
+    assert output == _expected_tail()
+    assert output_file.read_bytes().count(b"\r\n") == 10000
+
+
+@pytest.mark.parametrize("name", ["output.log", "output.log.gz"])
+def test_write_captured_output_to_file(tmp_path: Path, capsys: pytest.CaptureFixture, name: str) -> None:
+    """Write output captured at the file descriptor level to a file.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        capsys: Pytest fixture to capture output.
+        name: The output file name.
+    """
+    output_file = tmp_path / name
+    with capsys.disabled(), CaptureManager(Capture.BOTH, output_file=output_file) as captured:
+        for i in range(10000):
+            print(f"line {i}")
+    assert captured.output == _expected_tail()
+    contents = gzip.decompress(output_file.read_bytes()) if name.endswith(".gz") else output_file.read_bytes()
+    assert len(contents.splitlines()) == 10000
+
+
+def test_refuse_separate_output_to_file(tmp_path: Path) -> None:
+    """Refuse to write separate streams to a single file.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    with pytest.raises(ValueError, match="separately"):
+        run_subprocess(["true"], capture=Capture.SEPARATE, output_file=tmp_path / "output.log")
+
+
+def test_render_output_file(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    """Pass the output file path to templates.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        capsys: Pytest fixture to capture output.
+    """
+    output_file = tmp_path / "output.log"
+    result = run(
+        [sys.executable, "-c", _SCRIPT],
+        output_file=output_file,
+        progress=False,
+        fmt="custom={{ output_file }}",
+    )
+    assert result.output_file == str(output_file)
+    assert result.output == _expected_tail()
+    assert capsys.readouterr().out == f"{output_file}\n"
@@ -0,0 +1,110 @@
+"""Tests for the `spool` module."""
+
+from __future__ import annotations
+
+import errno
+import os
+import pickle
+from typing import TYPE_CHECKING
+
+import pytest
+
+from failprint._internal.process import WINDOWS
+from failprint._internal.runners import CompactRunResult, run
+from failprint._internal.spool import Spool
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_store_outputs_in_spool() -> None:
+    """Append outputs to a single spool, and read them back."""
+    with Spool() as spool:
+        results = [run(lambda i=i: print(f"output {i}"), silent=True, spool=spool) for i in range(3)]
+        assert all(isinstance(result, CompactRunResult) for result in results)
+        assert [result.output for result in results] == ["output 0\n", "output 1\n", "output 2\n"]
+        assert len(spool) == len("output 0\n") * 3
+        # appending after a read remaps the file
+        result = run(lambda: print("last"), silent=True, spool=spool)
+        assert result.output == "last\n"
+        assert result.raw_output == b"last\n"
+
+
+def test_view_without_copy() -> None:
+    """Return memory views on spooled data."""
+    with Spool() as spool:
+        spooled = spool.append(b"hello")
+        empty = spool.append(b"")
+        view = spooled.view()
+        assert isinstance(view, memoryview)
+        assert view.readonly
+        assert view == b"hello"
+        assert bytes(empty) == b""
+        del view
+
+
+def test_pickle_spooled_results(tmp_path: Path) -> None:
+    """Pickle results referencing a spool file.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    with Spool(tmp_path / "outputs.spool") as spool:
+        results = [run(lambda: print("hello"), silent=True, spool=spool) for _ in range(2)]
+        unpickled = pickle.loads(pickle.dumps(results))  # noqa: S301
+        assert unpickled[0]._output.spool is spool
+        assert [result.output for result in unpickled] == ["hello\n", "hello\n"]
+    assert (tmp_path / "outputs.spool").read_bytes() == b"hello\nhello\n"
+
+
+@pytest.mark.skipif(WINDOWS, reason="spool files are not locked on Windows")
+def test_append_from_several_spools(tmp_path: Path) -> None:
+    """Reference data at its real position in files shared by several spools.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    path = tmp_path / "outputs.spool"
+    with Spool(path) as first, Spool(path) as second:
+        spooled_a = first.append(b"AAAA")
+        spooled_b = second.append(b"BBBB")
+        spooled_c = first.append(b"CC")
+        assert (spooled_b.offset, spooled_c.offset) == (4, 8)
+        assert bytes(spooled_a) == b"AAAA"
+        assert bytes(spooled_b) == b"BBBB"
+        assert bytes(spooled_c) == b"CC"
+        assert len(first) == len(second) == 10
+
+
+def test_refuse_pickling_temporary_spool() -> None:
+    """Refuse to pickle references to temporary spools."""
+    with Spool() as spool:
+        result = run(lambda: print("hello"), silent=True, spool=spool)
+        with pytest.raises(TypeError, match="temporary spool"):
+            pickle.dumps(result)
+
+
+@pytest.mark.parametrize("sendfile_error", [None, errno.EINVAL])
+def test_copy_output_to_file_descriptor(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    sendfile_error: int | None,
+) -> None:
+    """Copy spooled outputs to file descriptors, falling back to writes when sendfile is unsupported.
+
+    Parameters:
+        tmp_path: Pytest fixture providing a temporary directory.
+        monkeypatch: Pytest fixture to patch objects.
+        sendfile_error: The error raised by sendfile, if any.
+    """
+    if sendfile_error is not None:
+
+        def sendfile(*args: int) -> int:  # noqa: ARG001
+            raise OSError(sendfile_error, os.strerror(sendfile_error))
+
+        monkeypatch.setattr("os.sendfile", sendfile, raising=False)
+    target = tmp_path / "target"
+    with Spool() as spool, target.open("wb") as file:
+        spool.append(b"skipped")
+        spool.append(b"copied\xff").write_to(file.fileno())
+    assert target.read_bytes() == b"copied\xff"
@@ -0,0 +1,202 @@
+"""Tests for the `workers` module."""
+
+from __future__ import annotations
+
+import os
+import pickle
+import sys
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from failprint._internal.capture import Capture
+from failprint._internal.lazy import ResultCache, lazy
+from failprint._internal.runners import run, run_many
+from failprint._internal.workers import WorkerPool
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+
+def greet(name: str) -> int:
+    """Print a greeting from a worker.
+
+    Parameters:
+        name: The name to greet.
+
+    Returns:
+        An exit code.
+    """
+    print(f"hello {name} from {os.getpid()}")
+    return 3
+
+
+@lazy(name="greet")
+def lazy_greet(name: str) -> bool:
+    """Print a greeting from a worker.
+
+    Parameters:
+        name: The name to greet.
+
+    Returns:
+        Whether it succeeded.
+    """
+    print(f"hello {name}")
+    return "colorsys" in sys.modules
+
+
+@pytest.fixture(name="pool", scope="module")
+def fixture_pool() -> Iterator[WorkerPool]:
+    """Provide a worker pool.
+
+    Yields:
+        A worker pool.
+    """
+    with WorkerPool(2, preload=["colorsys"], context="spawn") as pool:
+        yield pool
+
+
+def test_run_function_in_worker(pool: WorkerPool) -> None:
+    """Run a function in another process, capturing its output there.
+
+    Parameters:
+        pool: A worker pool.
+    """
+    code, output = pool.run_function(greet, args=["tim"])
+    assert code == 3
+    assert output.startswith("hello tim from ")
+    assert output.split()[-1] != str(os.getpid())
+
+
+def test_run_lazy_callable_in_worker(pool: WorkerPool) -> None:
+    """Send lazy callables by reference to preloaded workers.
+
+    Parameters:
+        pool: A worker pool.
+    """
+    code, output = pool.run_function(lazy_greet("tim"), capture=Capture.STDOUT, binary=True)
+    assert code == 0
+    assert output == b"hello tim\n"
+
+
+def test_pickle_lazy_callable() -> None:
+    """Pickle lazy callables created from decorated functions."""
+    lazy_call = pickle.loads(pickle.dumps(lazy_greet("tim")))  # noqa: S301
+    assert lazy_call.call is lazy_greet.__wrapped__  # ty: ignore[unresolved-attribute]
+    assert lazy_call.args == ("tim",)
+    assert lazy_call.name == "greet"
+
+
+def test_run_with_pool(pool: WorkerPool, capsys: pytest.CaptureFixture) -> None:
+    """Run and render functions executed in a pool.
+
+    Parameters:
+        pool: A worker pool.
+        capsys: Pytest fixture to capture output.
+    """
+    result = run(greet, args=["tim"], pool=pool, fmt="tap")
+    assert result.code == 3
+    assert "hello tim from" in capsys.readouterr().out
+
+
+def show_environment() -> None:
+    """Print the working directory and an environment variable."""
+    print(os.getcwd(), os.environ.get("FAILPRINT_TEST"))  # noqa: PTH109
+
+
+def test_run_with_working_directory_and_environment(pool: WorkerPool, tmp_path: Path) -> None:
+    """Run functions in another directory and environment, restoring the worker's after the call.
+
+    Parameters:
+        pool: A worker pool.
+        tmp_path: Pytest fixture providing a temporary directory.
+    """
+    code, output = pool.run_function(show_environment, cwd=tmp_path, env_overrides={"FAILPRINT_TEST": "1"})
+    assert code == 0
+    assert output == f"{tmp_path} 1\n"
+    for _ in range(pool.workers):
+        code, output = pool.run_function(show_environment)
+        assert output == f"{os.getcwd()} None\n"  # noqa: PTH109
+
+
+def sleep(duration: float) -> None:
+    """Sleep in a worker.
+
+    Parameters:
+        duration: The duration, in seconds.
+    """
+    print("started", flush=True)
+    time.sleep(duration)
+
+
+def test_time_out_in_worker(pool: WorkerPool) -> None:
+    """Interrupt functions timing out in workers, which stay available.
+
+    Parameters:
+        pool: A worker pool.
+    """
+    result = run(sleep, args=[5], pool=pool, timeout=0.2, silent=True)
+    assert result.timed_out
+    assert result.code == 124
+    assert result.output.startswith("started\n")
+    assert pool.run_function(greet, args=["tim"])[0] == 3
+
+
+def test_run_batch_in_pool(pool: WorkerPool, capsys: pytest.CaptureFixture) -> None:
+    """Run batches of lazy callables in worker processes.
+
+    Parameters:
+        pool: A worker pool.
+        capsys: Pytest fixture to capture output.
+    """
+    results = run_many(lazy_greet.map(["tim", "tom"]), pool=pool, capture=Capture.STDOUT)  # ty: ignore[unresolved-attribute]
+    assert [result.code for result in results] == [0, 0]
+    assert [result.output for result in results] == ["hello tim\n", "hello tom\n"]
+    assert "greet (2 calls)" in capsys.readouterr().out
+
+
+_cache = ResultCache()
+
+
+@lazy(cache=_cache)
+def is_even(number: int) -> bool:
+    """Tell whether a number is even, in a worker.
+
+    Parameters:
+        number: The number.
+
+    Returns:
+        Whether the number is even.
+    """
+    return number % 2 == 0
+
+
+def test_cache_results_of_workers(pool: WorkerPool) -> None:
+    """Store results of cached lazy callables run in workers in the cache of the calling process.
+
+    Parameters:
+        pool: A worker pool.
+    """
+    _cache.clear()
+    assert not run(is_even(1), pool=pool, silent=True).cached
+    result = run(is_even(1), pool=pool, silent=True)
+    assert result.cached
+    assert result.code == 1
+    results = run_many(is_even.map([1, 2]), pool=pool, silent=True)  # ty: ignore[unresolved-attribute]
+    assert [result.cached for result in results] == [True, False]
+    assert _cache.lookup(is_even(2).cache_key) == (True, True)
+
+
+def test_call_cached_lazy_callables_with_arguments_in_workers(pool: WorkerPool) -> None:
+    """Call cached lazy callables with arguments in workers like in this process, without caching them.
+
+    Parameters:
+        pool: A worker pool.
+    """
+    _cache.clear()
+    code, output, _ = pool.submit(is_even(2), args=[1]).result()
+    assert code == 1
+    assert b"LazyCallable.__call__() takes 1 positional argument but 2 were given" in output
+    assert _cache.lookup(is_even(2).cache_key) == (False, None)